@@ -0,0 +1,57 @@
+# benchmarks/auth_overhead.py
+#
+# Authenticated requests to an endpoint that does nothing past
+# deps.get_current_user, GET /stats/write-scheduler, with the principal
+# cache and without it.
+#
+#   python -m benchmarks.auth_overhead --requests 5000
+
+import argparse
+import asyncio
+
+from sqlalchemy import event
+
+from .common import Timer, auth_headers, create_client, create_user, session_maker
+
+from digimon import cache, deps, models
+
+
+async def run(client, headers: dict, requests: int) -> tuple[float, int]:
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(models.engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        with Timer() as timer:
+            for _ in range(requests):
+                response = await client.get("/stats/write-scheduler", headers=headers)
+                assert response.status_code == 200
+    finally:
+        event.remove(models.engine.sync_engine, "before_cursor_execute", listener)
+    return timer.elapsed, len(statements)
+
+
+async def main(args):
+    client = await create_client()
+    async with session_maker()() as session:
+        user = await create_user(session)
+    headers = auth_headers(user)
+
+    enabled = deps.principal_cache
+    for label, principal_cache in (
+        ("cache off", cache.TTLCache(maxsize=0, ttl=0)),
+        ("cache on", enabled),
+    ):
+        deps.principal_cache = principal_cache
+        elapsed, statements = await run(client, headers, args.requests)
+        print(
+            f"{label:<10} {args.requests / elapsed:>8.0f} req/s "
+            f"{elapsed / args.requests * 1e6:>8.0f} us/request "
+            f"{statements / args.requests:>5.2f} queries/request"
+        )
+    print(f"hit ratio {enabled.stats()['hit_ratio']:.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    asyncio.run(main(parser.parse_args()))
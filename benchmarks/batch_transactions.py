@@ -0,0 +1,76 @@
+# benchmarks/batch_transactions.py
+#
+# Compare the row throughput of POST /transactions against
+# POST /transactions/batch for the same settlement-style workload.
+#
+#   python -m benchmarks.batch_transactions --rows 5000 --batch-size 1000
+
+import argparse
+import asyncio
+import random
+
+from digimon import models
+
+from .common import Timer, auth_headers, create_client, create_user, report, session_maker
+
+
+def make_rows(wallet_ids: list[int], count: int) -> list[dict]:
+    rng = random.Random(0)
+    return [
+        {
+            "wallet_id": rng.choice(wallet_ids),
+            "amount": rng.randint(1, 100),
+            "type": rng.choice(("credit", "debit")),
+            "description": "settlement",
+        }
+        for _ in range(count)
+    ]
+
+
+async def main(args):
+    client = await create_client()
+
+    async with session_maker()() as session:
+        user = await create_user(session)
+        wallets = [models.DBWallet(user_id=user.id, balance=1000) for _ in range(args.wallets)]
+        session.add_all(wallets)
+        await session.commit()
+        wallet_ids = [wallet.id for wallet in wallets]
+
+    headers = auth_headers(user)
+    rows = make_rows(wallet_ids, args.rows)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def post_one(row):
+        async with semaphore:
+            response = await client.post("/transactions", json=row, headers=headers)
+            return response.status_code
+
+    with Timer() as single:
+        await asyncio.gather(*[post_one(row) for row in rows])
+    report("POST /transactions", len(rows), single.elapsed)
+
+    with Timer() as batched:
+        for start in range(0, len(rows), args.batch_size):
+            response = await client.post(
+                "/transactions/batch",
+                json={"transactions": rows[start : start + args.batch_size]},
+                headers=headers,
+            )
+            assert response.status_code == 200, response.text
+    report(
+        "POST /transactions/batch",
+        len(rows),
+        batched.elapsed,
+        speedup=f"{single.elapsed / batched.elapsed:.1f}x",
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--wallets", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
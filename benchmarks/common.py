@@ -0,0 +1,74 @@
+# benchmarks/common.py
+
+import logging
+import os
+import pathlib
+import time
+
+# Settings are read when the digimon modules are imported, so point them at a
+# scratch database before anything else is loaded
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite:///./test-data/bench-sqlalchemy.db")
+
+from httpx import AsyncClient, ASGITransport
+
+from digimon import config, main, models, security
+
+
+async def create_client() -> AsyncClient:
+    settings = config.Settings()
+
+    path = pathlib.Path("test-data")
+    if not path.exists():
+        path.mkdir()
+
+    app = main.create_app(settings)
+
+    # Request and SQL logging would dominate the timings
+    models.engine.echo = False
+    logging.getLogger().setLevel(logging.WARNING)
+    await models.recreate_table()
+
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://localhost")
+
+
+async def create_user(
+    session: models.AsyncSession, username: str = "bench"
+) -> models.DBUser:
+    user = models.DBUser(
+        username=username,
+        password="",
+        email=f"{username}@bench.local",
+        first_name="Bench",
+        last_name="User",
+    )
+    await user.set_password("password")
+    session.add(user)
+    await session.commit()
+    await session.refresh(user)
+    return user
+
+
+def auth_headers(user: models.DBUser) -> dict:
+    access_token = security.create_access_token(data={"sub": user.id})
+    return {"Authorization": f"Bearer {access_token}"}
+
+
+def session_maker():
+    return models.sessionmaker(
+        models.engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+
+
+class Timer:
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+
+
+def report(name: str, count: int, elapsed: float, **extra):
+    rate = count / elapsed if elapsed else float("inf")
+    fields = " ".join(f"{key}={value}" for key, value in extra.items())
+    print(f"{name}: {count} in {elapsed:.3f}s ({rate:,.0f}/s) {fields}".rstrip())
@@ -0,0 +1,71 @@
+# benchmarks/concurrent_debits.py
+#
+# Fire many parallel debits at a single wallet through POST /transactions and
+# check that no update was lost.
+#
+#   python -m benchmarks.concurrent_debits --requests 5000 --concurrency 200
+
+import argparse
+import asyncio
+
+from digimon import models
+
+from .common import Timer, auth_headers, create_client, create_user, report, session_maker
+
+
+async def main(args):
+    client = await create_client()
+
+    async with session_maker()() as session:
+        user = await create_user(session)
+        # Leave room for only half of the debits to succeed
+        wallet = models.DBWallet(
+            user_id=user.id, balance=args.amount * (args.requests // 2)
+        )
+        session.add(wallet)
+        await session.commit()
+        await session.refresh(wallet)
+
+    headers = auth_headers(user)
+    payload = {
+        "wallet_id": wallet.id,
+        "amount": args.amount,
+        "type": "debit",
+        "description": "benchmark debit",
+    }
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def debit():
+        async with semaphore:
+            response = await client.post("/transactions", json=payload, headers=headers)
+            return response.status_code
+
+    with Timer() as timer:
+        status_codes = await asyncio.gather(*[debit() for _ in range(args.requests)])
+
+    response = await client.get(f"/wallets/{wallet.id}", headers=headers)
+    balance = response.json()["balance"]
+    stats = (await client.get("/stats/write-scheduler", headers=headers)).json()
+    succeeded = status_codes.count(200)
+    rejected = status_codes.count(400)
+
+    report(
+        "concurrent debits",
+        args.requests,
+        timer.elapsed,
+        succeeded=succeeded,
+        rejected=rejected,
+        balance=balance,
+        average_batch=f"{stats['average_batch_size']:.1f}",
+    )
+    assert succeeded == args.requests // 2, "unexpected number of debits"
+    assert rejected == args.requests - succeeded, "unexpected error responses"
+    assert balance == 0, "lost update on wallet balance"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--amount", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
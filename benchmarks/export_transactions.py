@@ -0,0 +1,121 @@
+# benchmarks/export_transactions.py
+#
+# Stream GET /transactions/export over a large SQLite table and record
+# rows/sec and peak RSS. The ASGI app is driven directly and the body is
+# discarded as it arrives; httpx's ASGITransport would buffer all of it.
+#
+#   python -m benchmarks.export_transactions --rows 5000000 --format csv
+
+import argparse
+import asyncio
+import datetime
+import resource
+
+from sqlmodel import insert
+
+from digimon import models
+
+from .common import Timer, auth_headers, create_client, create_user, report, session_maker
+
+SEED_CHUNK_SIZE = 50_000
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def seed(wallet_id: int, rows: int):
+    created_at = datetime.datetime(2024, 1, 1)
+    async with session_maker()() as session:
+        for start in range(0, rows, SEED_CHUNK_SIZE):
+            count = min(SEED_CHUNK_SIZE, rows - start)
+            await session.exec(
+                insert(models.DBTransaction),
+                params=[
+                    dict(wallet_id=wallet_id, amount=100, type="credit", created_at=created_at)
+                    for _ in range(count)
+                ],
+            )
+            await session.commit()
+
+
+async def export(app, headers: dict, query: str) -> tuple[int, int]:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/transactions/export",
+        "raw_path": b"/transactions/export",
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+        "server": ("localhost", 80),
+        "client": ("127.0.0.1", 1234),
+    }
+    received = dict(bytes=0, lines=0, status=None)
+    requested = asyncio.Event()
+    finished = asyncio.Event()
+
+    async def receive():
+        # The request body once, then block like a connected client until
+        # the response is complete
+        if not requested.is_set():
+            requested.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            received["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            body = message.get("body", b"")
+            received["bytes"] += len(body)
+            received["lines"] += body.count(b"\n")
+
+    await app(scope, receive, send)
+    finished.set()
+    assert received["status"] == 200, received
+    return received["lines"], received["bytes"]
+
+
+async def main(args):
+    client = await create_client()
+    app = client._transport.app
+
+    async with session_maker()() as session:
+        user = await create_user(session)
+        wallet = models.DBWallet(user_id=user.id, balance=0)
+        session.add(wallet)
+        await session.commit()
+        await session.refresh(wallet)
+
+    with Timer() as seeding:
+        await seed(wallet.id, args.rows)
+    report("seed", args.rows, seeding.elapsed)
+
+    baseline = peak_rss_mb()
+    query = f"format={args.format}&chunk_size={args.chunk_size}"
+    with Timer() as timer:
+        lines, size = await export(app, auth_headers(user), query)
+
+    rows = lines - 1 if args.format == "csv" else lines
+    report(
+        f"export {args.format}",
+        rows,
+        timer.elapsed,
+        megabytes=f"{size / 2**20:.0f}",
+        peak_rss_mb=f"{peak_rss_mb():.0f}",
+        rss_before_mb=f"{baseline:.0f}",
+    )
+    assert rows == args.rows, "rows missing from the export"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,59 @@
+# benchmarks/items_bulk.py
+#
+# Loading a catalogue through POST /items one item at a time against
+# POST /items/bulk, and rewriting it with PUT /items/bulk.
+#
+#   python -m benchmarks.items_bulk --single 2000 --bulk 50000
+
+import argparse
+import asyncio
+
+from .common import Timer, auth_headers, create_client, create_user, session_maker
+
+from digimon import models
+
+
+def catalogue(merchant_id: int, size: int, prefix: str) -> list[dict]:
+    return [
+        dict(name=f"{prefix} {index}", description="bench item", price=100 + index, merchant_id=merchant_id)
+        for index in range(size)
+    ]
+
+
+async def main(args):
+    client = await create_client()
+
+    async with session_maker()() as session:
+        user = await create_user(session)
+        merchant = models.DBMerchant(name="bench", user_id=user.id)
+        session.add(merchant)
+        await session.commit()
+        await session.refresh(merchant)
+    headers = auth_headers(user)
+
+    with Timer() as timer:
+        for item in catalogue(merchant.id, args.single, "single"):
+            response = await client.post("/items", json=item, headers=headers)
+            assert response.status_code == 200
+    print(f"POST /items       {args.single:>7} items {args.single / timer.elapsed:>10.0f} items/s")
+
+    with Timer() as timer:
+        response = await client.post(
+            "/items/bulk", json=dict(items=catalogue(merchant.id, args.bulk, "bulk")), headers=headers
+        )
+    assert response.status_code == 200
+    ids = response.json()["ids"]
+    print(f"POST /items/bulk  {args.bulk:>7} items {args.bulk / timer.elapsed:>10.0f} items/s")
+
+    items = [dict(item, id=item_id) for item, item_id in zip(catalogue(merchant.id, args.bulk, "updated"), ids)]
+    with Timer() as timer:
+        response = await client.put("/items/bulk", json=dict(items=items), headers=headers)
+    assert response.status_code == 200
+    print(f"PUT /items/bulk   {args.bulk:>7} items {args.bulk / timer.elapsed:>10.0f} items/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--single", type=int, default=2000)
+    parser.add_argument("--bulk", type=int, default=50_000)
+    asyncio.run(main(parser.parse_args()))
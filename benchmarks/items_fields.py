@@ -0,0 +1,67 @@
+# benchmarks/items_fields.py
+#
+# Paging through GET /items with full items against ?fields=id,name,price,
+# the mobile list view: CPU time and response bytes per page.
+#
+#   python -m benchmarks.items_fields --items 20000
+
+import argparse
+import asyncio
+import time
+
+from .common import auth_headers, create_client, create_user, session_maker
+
+from digimon import models
+
+
+async def walk(client, fields: str | None) -> tuple[int, float, int]:
+    """Every page of the catalogue; pages, CPU seconds and bytes read."""
+    pages, size, after = 0, 0, 0
+    started = time.process_time()
+    while after is not None:
+        params = dict(after=after)
+        if fields:
+            params["fields"] = fields
+        response = await client.get("/items", params=params)
+        assert response.status_code == 200
+        pages += 1
+        size += len(response.content)
+        after = response.json()["next_after"]
+    return pages, time.process_time() - started, size
+
+
+async def main(args):
+    client = await create_client()
+
+    async with session_maker()() as session:
+        user = await create_user(session)
+        merchant = models.DBMerchant(name="bench", user_id=user.id)
+        session.add(merchant)
+        await session.commit()
+        await session.refresh(merchant)
+
+    items = [
+        dict(
+            name=f"item {index}",
+            description="a bench item with a description the list view never shows",
+            price=100 + index,
+            tax=7,
+            merchant_id=merchant.id,
+        )
+        for index in range(args.items)
+    ]
+    response = await client.post("/items/bulk", json=dict(items=items), headers=auth_headers(user))
+    assert response.status_code == 200
+
+    for label, fields in (("full", None), ("fields=id,name,price", "id,name,price")):
+        pages, elapsed, size = await walk(client, fields)
+        print(
+            f"{label:<22} {pages:>5} pages {elapsed / pages * 1000:>8.2f} ms CPU/page "
+            f"{size / pages:>8.0f} bytes/page"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=20_000)
+    asyncio.run(main(parser.parse_args()))
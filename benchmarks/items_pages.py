@@ -0,0 +1,72 @@
+# benchmarks/items_pages.py
+#
+# Latency of GET /items by page depth: OFFSET paging with a COUNT on every
+# request (the old behaviour), OFFSET paging with the cached count, and
+# keyset paging with ?after=.
+#
+#   python -m benchmarks.items_pages --items 500000 --pages 1 100 1000 10000
+
+import argparse
+import asyncio
+import statistics
+
+from .common import Timer, create_client, create_user, session_maker
+
+from sqlmodel import insert
+
+from digimon import cache, models
+from digimon.routers import items as items_router
+
+INSERT_CHUNK_SIZE = 20_000
+
+
+async def latency(client, params: dict, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        with Timer() as timer:
+            response = await client.get("/items", params=params)
+        assert response.status_code == 200
+        assert len(response.json()["items"]) == items_router.SIZE_PER_PAGE
+        timings.append(timer.elapsed)
+    return statistics.median(timings) * 1000
+
+
+async def main(args):
+    client = await create_client()
+
+    async with session_maker()() as session:
+        user = await create_user(session)
+        merchant = models.DBMerchant(name="bench", user_id=user.id)
+        session.add(merchant)
+        await session.commit()
+        await session.refresh(merchant)
+
+        for start in range(0, args.items, INSERT_CHUNK_SIZE):
+            await session.exec(
+                insert(models.DBItem),
+                params=[
+                    dict(name=f"item {index}", price=100, merchant_id=merchant.id, user_id=user.id)
+                    for index in range(start, min(start + INSERT_CHUNK_SIZE, args.items))
+                ],
+            )
+        await session.commit()
+
+    size = items_router.SIZE_PER_PAGE
+    print(f"{'page':>8} {'offset+count':>14} {'offset':>10} {'after':>10}  (median ms)")
+    for page in args.pages:
+        # A zero TTL stores nothing, so every request counts the table again
+        items_router.item_count = cache.TTLCache(maxsize=1, ttl=0)
+        counted = await latency(client, dict(page=page), args.repeat)
+        items_router.item_count = cache.TTLCache(maxsize=1, ttl=60)
+        offset = await latency(client, dict(page=page), args.repeat)
+        # Ids are dense here, so page N starts after id (N - 1) * size
+        keyset = await latency(client, dict(after=(page - 1) * size), args.repeat)
+        print(f"{page:>8} {counted:>14.2f} {offset:>10.2f} {keyset:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=500_000)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,76 @@
+# benchmarks/ledger_appends.py
+#
+# Compare POST /transactions on one hot wallet when the balance is updated in
+# place with ledger mode, where every write only appends a ledger entry, and
+# time the compaction of the appended entries afterwards.
+#
+#   python -m benchmarks.ledger_appends --requests 5000 --concurrency 200
+
+import argparse
+import asyncio
+
+from .common import Timer, auth_headers, create_client, create_user, report, session_maker
+
+from digimon import jobs, models
+from digimon.routers import transactions as transactions_router
+
+
+async def run(client, headers, wallet_id: int, args) -> float:
+    payload = {
+        "wallet_id": wallet_id,
+        "amount": args.amount,
+        "type": "credit",
+        "description": "benchmark credit",
+    }
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def credit():
+        async with semaphore:
+            response = await client.post("/transactions", json=payload, headers=headers)
+            return response.status_code
+
+    with Timer() as timer:
+        status_codes = await asyncio.gather(*[credit() for _ in range(args.requests)])
+    assert status_codes.count(200) == args.requests, "unexpected error responses"
+    return timer.elapsed
+
+
+async def main(args):
+    client = await create_client()
+    settings = transactions_router.settings
+
+    async with session_maker()() as session:
+        user = await create_user(session)
+        wallets = [models.DBWallet(user_id=user.id) for _ in range(3)]
+        session.add_all(wallets)
+        await session.commit()
+        wallet_ids = [wallet.id for wallet in wallets]
+    headers = auth_headers(user)
+
+    modes = [
+        ("in place", dict(LEDGER_MODE=False, WRITE_SCHEDULER_ENABLED=False)),
+        ("in place + write scheduler", dict(LEDGER_MODE=False, WRITE_SCHEDULER_ENABLED=True)),
+        ("ledger append", dict(LEDGER_MODE=True)),
+    ]
+    for (name, overrides), wallet_id in zip(modes, wallet_ids):
+        for key, value in overrides.items():
+            setattr(settings, key, value)
+        elapsed = await run(client, headers, wallet_id, args)
+        report(name, args.requests, elapsed)
+
+    with Timer() as timer:
+        compacted = await jobs.compact_ledger()
+    report("compaction", compacted, timer.elapsed)
+
+    expected = args.amount * args.requests
+    for wallet_id in wallet_ids:
+        response = await client.get(f"/wallets/{wallet_id}", headers=headers)
+        assert response.json()["balance"] == expected, "lost update on wallet balance"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--amount", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,108 @@
+# benchmarks/login_lookup.py
+#
+# POST /token at 1M users: the username-or-email lookup on its own, with
+# the unique indexes and after dropping them, and whole logins, which are
+# mostly bcrypt.
+#
+#   python -m benchmarks.login_lookup --users 1000000
+
+import argparse
+import asyncio
+import datetime
+import random
+import time
+
+from sqlalchemy import case, or_, text
+from sqlmodel import select
+
+from .common import create_client, session_maker
+
+from digimon import models, passwords
+
+CHUNK_SIZE = 10_000
+
+
+def summary(latencies: list[float]) -> str:
+    ordered = sorted(latencies)
+    p50 = ordered[len(ordered) // 2] * 1000
+    p99 = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] * 1000
+    return f"p50 {p50:>9.3f} ms p99 {p99:>9.3f} ms"
+
+
+async def load_users(count: int):
+    # Every user shares one hash, hashing a million passwords is not measured
+    password = await passwords.password_hasher.hash("password")
+    now = datetime.datetime.now()
+    async with models.engine.begin() as connection:
+        for start in range(0, count, CHUNK_SIZE):
+            await connection.execute(
+                models.DBUser.__table__.insert(),
+                [
+                    dict(
+                        username=f"user{index}",
+                        email=f"user{index}@bench.local",
+                        first_name="Bench",
+                        last_name="User",
+                        password=password,
+                        register_date=now,
+                        updated_date=now,
+                    )
+                    for index in range(start, min(start + CHUNK_SIZE, count))
+                ],
+            )
+
+
+async def lookups(names: list[str]) -> list[float]:
+    latencies = []
+    async with session_maker()() as session:
+        for name in names:
+            is_username = models.DBUser.username == name
+            started = time.perf_counter()
+            result = await session.exec(
+                select(models.DBUser)
+                .where(or_(is_username, models.DBUser.email == name))
+                .order_by(case((is_username, 0), else_=1))
+                .limit(1)
+            )
+            assert result.one_or_none() is not None
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def main(args):
+    client = await create_client()
+    rng = random.Random(25)
+
+    started = time.perf_counter()
+    await load_users(args.users)
+    print(f"loaded {args.users} users in {time.perf_counter() - started:.1f}s")
+
+    def sample(count: int) -> list[str]:
+        return [
+            f"user{index}" if rng.random() < 0.5 else f"user{index}@bench.local"
+            for index in (rng.randrange(args.users) for _ in range(count))
+        ]
+
+    print(f"lookup, indexed       {summary(await lookups(sample(args.lookups)))}")
+
+    latencies = []
+    for name in sample(args.logins):
+        started = time.perf_counter()
+        response = await client.post("/token", data=dict(username=name, password="password"))
+        assert response.status_code == 200
+        latencies.append(time.perf_counter() - started)
+    print(f"POST /token, indexed  {summary(latencies)}")
+
+    async with models.engine.begin() as connection:
+        await connection.execute(text("DROP INDEX ix_users_username"))
+        await connection.execute(text("DROP INDEX ix_users_email"))
+    print(f"lookup, no indexes    {summary(await lookups(sample(args.scans)))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--scans", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,63 @@
+# benchmarks/login_storm.py
+#
+# Latency of an unrelated endpoint, GET /merchants, on its own and while a
+# storm of POST /token logins keeps every bcrypt thread busy.
+#
+#   python -m benchmarks.login_storm --logins 100 --probes 200
+
+import argparse
+import asyncio
+import time
+
+from .common import auth_headers, create_client, create_user, session_maker
+
+from digimon import passwords
+
+
+def percentiles(latencies: list[float]) -> str:
+    ordered = sorted(latencies)
+    p50 = ordered[len(ordered) // 2] * 1000
+    p99 = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] * 1000
+    return f"p50 {p50:>7.2f} ms p99 {p99:>7.2f} ms max {ordered[-1] * 1000:>7.2f} ms"
+
+
+async def probe(client, count: int, until: asyncio.Future | None = None) -> list[float]:
+    latencies = []
+    while len(latencies) < count or (until is not None and not until.done()):
+        started = time.perf_counter()
+        response = await client.get("/merchants", params=dict(size_per_page=10))
+        assert response.status_code == 200
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def main(args):
+    client = await create_client()
+    async with session_maker()() as session:
+        await create_user(session)
+
+    baseline = await probe(client, args.probes)
+    print(f"GET /merchants alone        {percentiles(baseline)}")
+
+    form = dict(username="bench", password="password")
+    storm = asyncio.gather(*[client.post("/token", data=form) for _ in range(args.logins)])
+    during = await probe(client, args.probes, until=storm)
+    responses = await storm
+    print(f"GET /merchants during storm {percentiles(during)}")
+
+    statuses = [response.status_code for response in responses]
+    print(f"POST /token x{args.logins}: {statuses.count(200)} ok, {statuses.count(503)} shed")
+    stats = passwords.password_hasher.stats()
+    for name in ("queue_wait", "hash_time"):
+        timings = stats[name]
+        print(
+            f"{name:<10} mean {timings['mean_ms']:>8.1f} ms p99 {timings['p99_ms']:>8.1f} ms "
+            f"max {timings['max_ms']:>8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--probes", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
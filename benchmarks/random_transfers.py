@@ -0,0 +1,82 @@
+# benchmarks/random_transfers.py
+#
+# Random wallet-to-wallet transfers through POST /transfers; checks that the
+# total amount of money across all wallets is unchanged afterwards.
+#
+#   python -m benchmarks.random_transfers --wallets 1000 --transfers 5000
+
+import argparse
+import asyncio
+import random
+
+from sqlmodel import func, select
+
+from digimon import models
+
+from .common import Timer, auth_headers, create_client, create_user, report, session_maker
+
+
+async def total_balance(wallet_ids: list[int]) -> float:
+    async with session_maker()() as session:
+        result = await session.exec(
+            select(func.sum(models.DBWallet.balance)).where(
+                models.DBWallet.id.in_(wallet_ids)
+            )
+        )
+        return result.one()
+
+
+async def main(args):
+    client = await create_client()
+
+    async with session_maker()() as session:
+        user = await create_user(session)
+        wallets = [
+            models.DBWallet(user_id=user.id, balance=args.balance)
+            for _ in range(args.wallets)
+        ]
+        session.add_all(wallets)
+        await session.commit()
+        wallet_ids = [wallet.id for wallet in wallets]
+
+    headers = auth_headers(user)
+    before = await total_balance(wallet_ids)
+
+    rng = random.Random(0)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def transfer():
+        source, target = rng.sample(wallet_ids, 2)
+        payload = {
+            "from_wallet_id": source,
+            "to_wallet_id": target,
+            "amount": rng.randint(1, args.balance),
+        }
+        async with semaphore:
+            response = await client.post("/transfers", json=payload, headers=headers)
+            return response.status_code
+
+    with Timer() as timer:
+        status_codes = await asyncio.gather(*[transfer() for _ in range(args.transfers)])
+
+    after = await total_balance(wallet_ids)
+    report(
+        "random transfers",
+        args.transfers,
+        timer.elapsed,
+        succeeded=status_codes.count(200),
+        rejected=status_codes.count(400),
+        total_before=before,
+        total_after=after,
+    )
+    assert set(status_codes) <= {200, 400}, "unexpected error responses"
+    assert before == after, "money was created or lost"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--wallets", type=int, default=1000)
+    parser.add_argument("--transfers", type=int, default=5000)
+    parser.add_argument("--balance", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
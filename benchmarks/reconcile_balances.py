@@ -0,0 +1,79 @@
+# benchmarks/reconcile_balances.py
+#
+# Fill the database with transactions spread over many wallets, break a few
+# balances on purpose, and time a full reconciliation run.
+#
+#   python -m benchmarks.reconcile_balances --transactions 10000000 --workers 8
+
+import argparse
+import asyncio
+import datetime
+import io
+
+from .common import Timer, create_client, create_user, report, session_maker
+
+from sqlmodel import insert, update
+
+from digimon import models, reconcile
+
+INSERT_CHUNK_SIZE = 50_000
+
+
+async def main(args):
+    await create_client()
+
+    async with session_maker()() as session:
+        user = await create_user(session)
+        # Every transaction is a credit of 1, dealt out round-robin
+        per_wallet, extra = divmod(args.transactions, args.wallets)
+        await session.exec(
+            insert(models.DBWallet),
+            params=[
+                dict(user_id=user.id, balance=per_wallet + (index < extra))
+                for index in range(args.wallets)
+            ],
+        )
+
+        now = datetime.datetime.now()
+        with Timer() as timer:
+            for start in range(0, args.transactions, INSERT_CHUNK_SIZE):
+                stop = min(start + INSERT_CHUNK_SIZE, args.transactions)
+                await session.exec(
+                    insert(models.DBTransaction),
+                    params=[
+                        dict(wallet_id=index % args.wallets + 1, amount=1, type="credit", created_at=now)
+                        for index in range(start, stop)
+                    ],
+                )
+        report("insert", args.transactions, timer.elapsed)
+
+        drifted = list(range(1, args.wallets + 1, max(args.wallets // args.drifted, 1)))[: args.drifted]
+        await session.exec(
+            update(models.DBWallet)
+            .where(models.DBWallet.id.in_(drifted))
+            .values(balance=models.DBWallet.balance + 1)
+        )
+        await session.commit()
+
+    with Timer() as timer:
+        summary = await reconcile.reconcile(args.workers, args.wallets_per_range, io.StringIO())
+    report(
+        "reconcile",
+        summary.transactions,
+        timer.elapsed,
+        wallets=summary.wallets,
+        mismatches=summary.mismatches,
+        workers=args.workers,
+    )
+    assert summary.transactions == args.transactions, "transactions missed"
+    assert summary.mismatches == len(drifted), "unexpected mismatches"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--wallets", type=int, default=10_000)
+    parser.add_argument("--drifted", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--wallets-per-range", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+# benchmarks/search_items.py
+#
+# Latency of GET /items/search on a large catalogue: items get names and
+# descriptions drawn from a random vocabulary with Zipf word frequencies, the
+# index is filled with models.rebuild_search_index, then one and two word
+# queries are timed, the last word cut short as if still being typed.
+#
+#   python -m benchmarks.search_items --items 1000000 --queries 2000
+
+import argparse
+import asyncio
+import itertools
+import random
+import statistics
+import string
+
+from .common import Timer, create_client, create_user, session_maker
+
+from sqlmodel import insert
+
+from digimon import models
+
+INSERT_CHUNK_SIZE = 20_000
+
+
+def vocabulary(size: int, rng: random.Random) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))))
+    # Sorted first so the seed alone decides which words are the common ones
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    words = vocabulary(args.words, rng)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    client = await create_client()
+
+    async with session_maker()() as session:
+        user = await create_user(session)
+        merchant = models.DBMerchant(name="bench", user_id=user.id)
+        session.add(merchant)
+        await session.commit()
+        await session.refresh(merchant)
+
+        for start in range(0, args.items, INSERT_CHUNK_SIZE):
+            await session.exec(
+                insert(models.DBItem),
+                params=[
+                    dict(
+                        name=" ".join(rng.choices(words, cum_weights=weights, k=3)),
+                        description=" ".join(rng.choices(words, cum_weights=weights, k=12)),
+                        price=100,
+                        merchant_id=merchant.id,
+                        user_id=user.id,
+                    )
+                    for _ in range(start, min(start + INSERT_CHUNK_SIZE, args.items))
+                ],
+            )
+        await session.commit()
+
+        with Timer() as timer:
+            counts = await models.rebuild_search_index(session)
+            await session.commit()
+        print(f"indexed {counts['items']} items in {timer.elapsed:.1f}s")
+
+    timings = []
+    hits = 0
+    for _ in range(args.queries):
+        terms = rng.choices(words, cum_weights=weights, k=rng.randint(1, 2))
+        terms[-1] = terms[-1][: rng.randint(min(3, len(terms[-1])), len(terms[-1]))]
+        with Timer() as timer:
+            response = await client.get("/items/search", params={"q": " ".join(terms)})
+        assert response.status_code == 200
+        hits += len(response.json()["items"])
+        timings.append(timer.elapsed * 1000)
+
+    quantiles = statistics.quantiles(timings, n=100)
+    print(
+        f"{args.queries} queries, {hits / args.queries:.1f} results each: "
+        f"p50 {quantiles[49]:.2f} ms, p99 {quantiles[98]:.2f} ms, max {max(timings):.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--words", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,213 @@
+# digimon/archive_transactions.py
+#
+# Move the transactions of closed months out of the transactions table into
+# one gzip NDJSON file per month. Every chunk is appended to the file as a
+# gzip member and then deleted from the table in a DB transaction of its own,
+# so the command can be stopped at any point and run again.
+#
+#   python -m digimon.archive_transactions [--hot-months 3] [--dir archive]
+
+import argparse
+import asyncio
+import datetime
+import gzip
+import json
+import logging
+import os
+import pathlib
+import time
+
+from sqlmodel import func, select, tuple_
+
+from . import config
+from . import models
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+
+def archive_path(directory: pathlib.Path, month: datetime.date) -> pathlib.Path:
+    return directory / f"transactions-{month:%Y-%m}.ndjson.gz"
+
+
+def encode_rows(rows) -> bytes:
+    lines = []
+    for row in rows:
+        record = dict(zip(models.ARCHIVE_COLUMNS, row))
+        record["created_at"] = record["created_at"].isoformat()
+        lines.append(json.dumps(record))
+    return gzip.compress(("\n".join(lines) + "\n").encode())
+
+
+def append_member(path: pathlib.Path, size: int, member: bytes) -> int:
+    with path.open("r+b" if path.exists() else "wb") as archive:
+        # Bytes past the last committed chunk come from an interrupted run
+        archive.truncate(size)
+        archive.seek(size)
+        archive.write(member)
+        archive.flush()
+        os.fsync(archive.fileno())
+    return size + len(member)
+
+
+async def archive_month(
+    session: models.AsyncSession,
+    month: datetime.date,
+    directory: pathlib.Path,
+    chunk_size: int,
+) -> int:
+    """Archive every transaction created in ``month``; returns the number
+    of rows moved."""
+    result = await session.exec(
+        select(models.DBTransactionArchive).where(models.DBTransactionArchive.month == month)
+    )
+    archive = result.one_or_none()
+    if archive is None:
+        archive = models.DBTransactionArchive(month=month, path=str(archive_path(directory, month)))
+        session.add(archive)
+        await session.commit()
+        await session.refresh(archive)
+
+    start, end = models.month_bounds(month)
+    columns = [getattr(models.DBTransaction, column) for column in models.ARCHIVE_COLUMNS]
+    position = (models.DBTransaction.created_at, models.DBTransaction.id)
+    after = None
+    moved = 0
+    while True:
+        query = select(*columns).where(
+            models.DBTransaction.created_at >= start, models.DBTransaction.created_at < end
+        )
+        if after is not None:
+            query = query.where(tuple_(*position) > tuple_(*after))
+        result = await session.exec(query.order_by(*position).limit(chunk_size))
+        rows = result.all()
+        if not rows:
+            return moved
+
+        size = await asyncio.to_thread(
+            append_member, pathlib.Path(archive.path), archive.size, encode_rows(rows)
+        )
+        await models.record_archived_rows(session, archive, rows, size)
+        await session.commit()
+
+        moved += len(rows)
+        after = (rows[-1][-1], rows[-1][0])  # created_at, id
+
+
+async def archive_transactions(
+    session: models.AsyncSession,
+    hot_months: int,
+    directory: pathlib.Path,
+    chunk_size: int,
+) -> dict[str, int]:
+    """Archive the months before the last ``hot_months`` months, oldest
+    first; returns the rows moved per month."""
+    directory.mkdir(parents=True, exist_ok=True)
+    cutoff, _ = models.month_bounds(
+        models.add_months(models.month_start(datetime.date.today()), -hot_months)
+    )
+
+    moved = {}
+    while True:
+        result = await session.exec(
+            select(func.min(models.DBTransaction.created_at)).where(
+                models.DBTransaction.created_at < cutoff
+            )
+        )
+        oldest = result.one()
+        if oldest is None:
+            return moved
+
+        month = models.month_start(oldest)
+        moved[f"{month:%Y-%m}"] = await archive_month(session, month, directory, chunk_size)
+        logger.info(f"Archived {month:%Y-%m}: {moved[f'{month:%Y-%m}']} transactions")
+
+
+def scan_archive(path: str, transaction_id: int) -> dict | None:
+    prefix = f'{{"id": {transaction_id},'
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        for line in archive:
+            if line.startswith(prefix):
+                return json.loads(line)
+    return None
+
+
+async def read_archived_transaction(
+    session: models.AsyncSession, transaction_id: int
+) -> models.TransactionRead | None:
+    """Look a transaction up in the archive files whose id range covers it.
+
+    This decompresses and scans whole files, so it is much slower than a
+    read from the ``transactions`` table and only meant as a fallback.
+    """
+    result = await session.exec(
+        select(models.DBTransactionArchive.path)
+        .where(
+            models.DBTransactionArchive.first_id <= transaction_id,
+            models.DBTransactionArchive.last_id >= transaction_id,
+        )
+        .order_by(models.DBTransactionArchive.month)
+    )
+    for path in result.all():
+        if not pathlib.Path(path).exists():
+            logger.warning(f"Archive file {path} is missing")
+            continue
+        record = await asyncio.to_thread(scan_archive, path, transaction_id)
+        if record is not None:
+            return models.TransactionRead.model_validate(record)
+    return None
+
+
+def scan_archive_transfer(path: str, transfer_id: int) -> list[dict]:
+    marker = f'"transfer_id": {transfer_id},'
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        return [json.loads(line) for line in archive if marker in line]
+
+
+async def read_archived_transfer_legs(
+    session: models.AsyncSession, transfer_id: int
+) -> list[models.TransactionRead]:
+    """The legs of a transfer found in the archive files, newest month
+    first. Transfers are not indexed by archive, so this can scan every
+    file; a fallback like ``read_archived_transaction``."""
+    result = await session.exec(
+        select(models.DBTransactionArchive.path).order_by(models.DBTransactionArchive.month.desc())
+    )
+    legs = []
+    for path in result.all():
+        if not pathlib.Path(path).exists():
+            logger.warning(f"Archive file {path} is missing")
+            continue
+        records = await asyncio.to_thread(scan_archive_transfer, path, transfer_id)
+        legs += [models.TransactionRead.model_validate(record) for record in records]
+        if len(legs) >= 2:
+            break
+    return legs
+
+
+async def main(args):
+    models.init_db(settings)
+    models.engine.echo = False
+
+    started = time.perf_counter()
+    async_session = models.sessionmaker(
+        models.engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+    async with async_session() as session:
+        moved = await archive_transactions(
+            session, args.hot_months, pathlib.Path(args.dir), args.chunk_size
+        )
+    seconds = time.perf_counter() - started
+    print(json.dumps(dict(months=moved, rows=sum(moved.values()), seconds=round(seconds, 3)), indent=2))
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hot-months", type=int, default=settings.TRANSACTION_HOT_MONTHS)
+    parser.add_argument("--dir", default=settings.TRANSACTION_ARCHIVE_DIR)
+    parser.add_argument("--chunk-size", type=int, default=settings.TRANSACTION_ARCHIVE_CHUNK_SIZE)
+    asyncio.run(main(parser.parse_args()))
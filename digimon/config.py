@@ -1,3 +1,5 @@
+import os
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -8,6 +10,72 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 5 * 60  # 5 minutes
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 7 * 24 * 60  # 7 days
 
+    # Group commit of POST /transactions writes per wallet
+    WRITE_SCHEDULER_ENABLED: bool = True
+    WRITE_BATCH_WINDOW_MS: float = 2.0
+    WRITE_BATCH_MAX_SIZE: int = 100
+
+    # Append-only ledger: writes insert ledger entries instead of updating
+    # the wallet row, and a background job folds them into the balances
+    LEDGER_MODE: bool = False
+    LEDGER_COMPACTION_BATCH_SIZE: int = 1000
+
+    # How stale the item count behind GET /items page_count may get
+    ITEM_COUNT_CACHE_SECONDS: float = 30
+
+    # Read-through cache of GET /items|merchants|users|wallets/{id}, per
+    # process unless ENTITY_CACHE_URL points at a shared redis:// server
+    ENTITY_CACHE_SIZE: int = 10_000
+    ENTITY_CACHE_TTL_SECONDS: float = 60
+    ENTITY_CACHE_URL: str = ""
+    ENTITY_CACHE_DISABLED: list[str] = []  # entity names, e.g. ["wallets"]
+    # Not cached per process: a write through another worker cannot
+    # invalidate them, and a stale wallet balance is served for the TTL
+    ENTITY_CACHE_LOCAL_DISABLED: list[str] = ["wallets"]
+
+    # bcrypt threads; once every one is busy and PASSWORD_HASH_QUEUE_SIZE
+    # more calls wait, logins, sign-ups and password changes get a 503
+    PASSWORD_HASH_WORKERS: int = os.cpu_count() or 1
+    PASSWORD_HASH_QUEUE_SIZE: int = 16
+
+    # Users behind bearer tokens, per process; a size of 0 disables it.
+    # Changes made through another worker show up after at most the TTL
+    PRINCIPAL_CACHE_SIZE: int = 10_000
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 60
+
+    # Rows fetched from the server-side cursor per chunk of an export
+    EXPORT_CHUNK_SIZE: int = 1000
+
+    # Replayed responses of requests sent with an Idempotency-Key
+    IDEMPOTENCY_CACHE_SIZE: int = 10_000
+    IDEMPOTENCY_TTL_SECONDS: int = 24 * 60 * 60
+    # A key claimed this long ago whose request never finished, e.g. its
+    # worker died, is taken over by the next request; keep it above the
+    # longest a request may run
+    IDEMPOTENCY_LEASE_SECONDS: int = 5 * 60
+
+    # Transactions of months older than TRANSACTION_HOT_MONTHS are moved to
+    # gzip NDJSON files in TRANSACTION_ARCHIVE_DIR
+    TRANSACTION_HOT_MONTHS: int = 3
+    TRANSACTION_ARCHIVE_DIR: str = "archive"
+    TRANSACTION_ARCHIVE_CHUNK_SIZE: int = 5000
+    # Monthly partitions created ahead of time on PostgreSQL
+    TRANSACTION_PARTITIONS_AHEAD: int = 3
+
+    # Bulk transaction import
+    IMPORT_CHUNK_SIZE: int = 5000
+    IMPORT_DIR: str = "imports"
+
+    # Background jobs, a period of 0 disables the job
+    BALANCE_CHECKPOINT_INTERVAL: int = 1000  # transactions between checkpoints
+    # Only transactions created this long ago are checkpointed, later ones
+    # may still be committing out of created_at order
+    BALANCE_CHECKPOINT_SETTLE_SECONDS: float = 60
+    BALANCE_CHECKPOINT_PERIOD_SECONDS: float = 60
+    LEDGER_COMPACTION_PERIOD_SECONDS: float = 5
+    TRANSACTION_PARTITIONS_PERIOD_SECONDS: float = 60 * 60
+    IDEMPOTENCY_PURGE_PERIOD_SECONDS: float = 60 * 60
+
     model_config = SettingsConfigDict(
         env_file=".env", validate_assignment=True, extra="allow"
     )
@@ -1,11 +1,13 @@
+import time
 import typing
 import logging
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import ValidationError
 from jwt import PyJWTError
 
+from . import cache
 from . import models
 from . import security
 from . import config
@@ -18,6 +20,12 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
 settings = config.get_settings()
 
+# Authenticated users by id, so a request costs no DB round trip before its
+# own work. An entry never outlives the token that loaded it.
+principal_cache = cache.TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
+
 
 async def get_current_user(
     token: typing.Annotated[str, Depends(oauth2_scheme)],
@@ -41,10 +49,17 @@ async def get_current_user(
         logger.error(f"JWT Error: {e}")
         raise credentials_exception
 
-    user = await session.get(models.DBUser, user_id)
-    if user is None:
+    user = principal_cache.get(user_id)
+    if user is not None:
+        return user
+
+    db_user = await session.get(models.DBUser, user_id)
+    if db_user is None:
         raise credentials_exception
 
+    user = models.User.model_validate(db_user)
+    expires = payload.get("exp")
+    principal_cache.set(user_id, user, ttl=expires - time.time() if expires else None)
     return user
 
 
@@ -79,3 +94,53 @@ class RoleChecker:
                 return
         logger.debug(f"User with roles {user.roles} not in {self.allowed_roles}")
         raise HTTPException(status_code=403, detail="Role not permitted")
+
+
+class EmbedParameter:
+    """``?embed=`` as the set of relation names it lists, each one of
+    ``allowed_relations``."""
+
+    def __init__(self, *allowed_relations: str):
+        self.allowed_relations = allowed_relations
+
+    def __call__(
+        self,
+        embed: typing.Annotated[
+            typing.Optional[str], Query(description="Comma separated relations to nest")
+        ] = None,
+    ) -> set[str]:
+        relations = {relation.strip() for relation in (embed or "").split(",") if relation.strip()}
+        unknown = relations - set(self.allowed_relations)
+        if unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Cannot embed {', '.join(sorted(unknown))}; "
+                f"choose from {', '.join(self.allowed_relations)}",
+            )
+        return relations
+
+
+class FieldsParameter:
+    """``?fields=`` as the fields it lists, each one of ``allowed_fields``;
+    ``id`` always comes first. ``None`` when not given."""
+
+    def __init__(self, *allowed_fields: str):
+        self.allowed_fields = allowed_fields
+
+    def __call__(
+        self,
+        fields: typing.Annotated[
+            typing.Optional[str], Query(description="Comma separated fields to return")
+        ] = None,
+    ) -> tuple[str, ...] | None:
+        if fields is None:
+            return None
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = set(requested) - set(self.allowed_fields)
+        if unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown fields {', '.join(sorted(unknown))}; "
+                f"choose from {', '.join(self.allowed_fields)}",
+            )
+        return tuple(dict.fromkeys(["id", *requested]))
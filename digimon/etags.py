@@ -0,0 +1,27 @@
+# digimon/etags.py
+
+import hashlib
+
+from fastapi import Response
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag over ``parts``; every part must change whenever the
+    representation does, e.g. an id and the row version."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, a W/ prefix does not matter
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
@@ -0,0 +1,240 @@
+# digimon/idempotency.py
+
+import datetime
+import hashlib
+import json
+
+import jwt
+from jwt import PyJWTError
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import delete, update
+
+from . import cache
+from . import config
+from . import models
+from . import security
+
+settings = config.get_settings()
+
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+PATH_PREFIXES = ("/transactions", "/transfers", "/wallets")
+# Resumed through its own job key, and its body is too large to buffer
+EXCLUDED_PATHS = {"/transactions/import"}
+MAX_KEY_LENGTH = 255
+# Not replayed: the same request can succeed once the caller authenticates,
+# the conflict clears or the rate limit resets
+UNSTORED_STATUSES = {401, 403, 409, 429}
+
+# key -> (fingerprint, status_code, content_type, body) of completed requests
+responses = cache.TTLCache(
+    maxsize=settings.IDEMPOTENCY_CACHE_SIZE, ttl=settings.IDEMPOTENCY_TTL_SECONDS
+)
+
+replayed_from_db = 0
+
+
+def applies_to(scope) -> bool:
+    path = scope["path"]
+    return (
+        scope["method"] in MUTATING_METHODS
+        and path.startswith(PATH_PREFIXES)
+        and path not in EXCLUDED_PATHS
+    )
+
+
+def principal(scope) -> str:
+    """Who sent the request: the user of a valid bearer token, otherwise
+    a hash of whatever Authorization header came with it."""
+    authorization = dict(scope["headers"]).get(b"authorization", b"")
+    _, _, token = authorization.decode("latin-1").partition(" ")
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[security.ALGORITHM])
+    except PyJWTError:
+        return "authorization:" + hashlib.sha256(authorization).hexdigest()
+    return f"user:{payload.get('sub')}"
+
+
+def stats() -> dict:
+    return dict(responses.stats(), replayed_from_db=replayed_from_db)
+
+
+async def send_json(send, status_code: int, content: dict):
+    await send_response(send, status_code, "application/json", json.dumps(content).encode())
+
+
+async def send_response(send, status_code: int, content_type: str, body: bytes, replayed=False):
+    headers = [
+        (b"content-type", content_type.encode()),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    if replayed:
+        headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """Replay the stored response of a mutating request whose
+    ``Idempotency-Key`` was seen before, instead of running it again.
+
+    Completed responses are kept in a bounded in-process LRU/TTL cache; the
+    ``idempotency_keys`` table is the source of truth shared by all workers.
+    Keys are scoped to the caller, so another user sending the same key
+    runs their own request. Responses with a 5xx status or one of
+    ``UNSTORED_STATUSES`` are not stored, so those requests can be retried.
+    A key whose request never finished can be claimed again once
+    ``IDEMPOTENCY_LEASE_SECONDS`` have passed.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not applies_to(scope):
+            return await self.app(scope, receive, send)
+
+        key = dict(scope["headers"]).get(b"idempotency-key")
+        if key is None:
+            return await self.app(scope, receive, send)
+
+        key = key.decode("latin-1")
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return await send_json(send, 400, {"detail": "Invalid Idempotency-Key"})
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        caller = principal(scope).encode()
+        fingerprint = hashlib.sha256(
+            b"\0".join([caller, scope["method"].encode(), scope["path"].encode(), scope["query_string"], body])
+        ).hexdigest()
+        # The same key from two callers is two different keys
+        key = hashlib.sha256(caller + b"\0" + key.encode()).hexdigest()
+
+        stored = responses.get(key)
+        if stored is None:
+            stored = await self.claim(key, fingerprint)
+            if stored is None:
+                return await self.run(scope, body, send, key, fingerprint)
+            if stored == "in_progress":
+                return await send_json(
+                    send, 409, {"detail": "A request with this Idempotency-Key is in progress"}
+                )
+
+        stored_fingerprint, status_code, content_type, stored_body = stored
+        if stored_fingerprint != fingerprint:
+            return await send_json(
+                send, 422, {"detail": "Idempotency-Key was used with a different request"}
+            )
+        await send_response(send, status_code, content_type, stored_body, replayed=True)
+
+    async def claim(self, key: str, fingerprint: str):
+        """Insert the key as in progress. Returns ``None`` when this request
+        owns the key, otherwise the stored response or ``"in_progress"``."""
+        global replayed_from_db
+
+        async with self.session() as session:
+            session.add(models.DBIdempotencyKey(key=key, fingerprint=fingerprint))
+            try:
+                await session.commit()
+                return None
+            except IntegrityError:
+                await session.rollback()
+
+            row = await session.get(models.DBIdempotencyKey, key)
+            if row is None:
+                # Deleted after a failed attempt in the meantime
+                return await self.claim(key, fingerprint)
+
+            now = datetime.datetime.now()
+            expired = row.created_date < now - datetime.timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+            # A request that outran its lease is taken to have died
+            abandoned = row.status_code is None and row.created_date < now - datetime.timedelta(
+                seconds=settings.IDEMPOTENCY_LEASE_SECONDS
+            )
+            if expired or abandoned:
+                # Reuse the key; the conditional UPDATE lets only one
+                # worker take it over
+                result = await session.exec(
+                    update(models.DBIdempotencyKey)
+                    .where(
+                        models.DBIdempotencyKey.key == key,
+                        models.DBIdempotencyKey.created_date == row.created_date,
+                    )
+                    .values(
+                        fingerprint=fingerprint,
+                        status_code=None,
+                        content_type=None,
+                        body=None,
+                        created_date=now,
+                    )
+                )
+                await session.commit()
+                return None if result.rowcount else "in_progress"
+
+            if row.status_code is None:
+                return "in_progress"
+
+            stored = (row.fingerprint, row.status_code, row.content_type, row.body)
+            responses.set(key, stored)
+            replayed_from_db += 1
+            return stored
+
+    async def run(self, scope, body: bytes, send, key: str, fingerprint: str):
+        received = False
+        response = dict(status_code=500, content_type="application/json", body=b"")
+
+        async def receive_body():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return {"type": "http.disconnect"}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status_code"] = message["status"]
+                headers = dict(message.get("headers", []))
+                response["content_type"] = headers.get(
+                    b"content-type", b"application/json"
+                ).decode("latin-1")
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, capture)
+        finally:
+            await self.store(key, fingerprint, response)
+
+    async def store(self, key: str, fingerprint: str, response: dict):
+        async with self.session() as session:
+            if response["status_code"] >= 500 or response["status_code"] in UNSTORED_STATUSES:
+                await session.exec(
+                    delete(models.DBIdempotencyKey).where(models.DBIdempotencyKey.key == key)
+                )
+            else:
+                await session.exec(
+                    update(models.DBIdempotencyKey)
+                    .where(models.DBIdempotencyKey.key == key)
+                    .values(
+                        status_code=response["status_code"],
+                        content_type=response["content_type"],
+                        body=response["body"],
+                    )
+                )
+                responses.set(
+                    key,
+                    (fingerprint, response["status_code"], response["content_type"], response["body"]),
+                )
+            await session.commit()
+
+    def session(self):
+        async_session = models.sessionmaker(
+            models.engine, class_=models.AsyncSession, expire_on_commit=False
+        )
+        return async_session()
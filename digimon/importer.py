@@ -0,0 +1,281 @@
+# digimon/importer.py
+#
+# Bulk import of historic transactions from CSV or NDJSON. Rows are read as a
+# stream, validated chunk by chunk and written with one executemany INSERT
+# and one set-based balance UPDATE per chunk. Progress is committed together
+# with every chunk, so running the same job again resumes after the last
+# committed chunk.
+#
+#   python -m digimon.importer ledger.csv --format csv [--job ledger-2019]
+
+import argparse
+import asyncio
+import codecs
+import csv
+import datetime
+import json
+import logging
+import pathlib
+import time
+from collections import defaultdict, deque
+from typing import AsyncIterator, TextIO
+
+from pydantic import TypeAdapter, ValidationError
+from sqlmodel import insert, select
+
+from . import config
+from . import models
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+TRANSACTION_TYPES = ("credit", "debit")
+
+# Built once; validating with it skips the per-call schema lookups
+transaction_adapter = TypeAdapter(models.TransactionImport)
+
+
+async def file_lines(path: pathlib.Path) -> AsyncIterator[str]:
+    with path.open(encoding="utf-8", newline="") as source:
+        for line in source:
+            yield line
+
+
+async def stream_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+class LineFeed:
+    """Lines for a csv reader that outlives them, queued as they arrive."""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def read_records(lines: AsyncIterator[str], format: str):
+    """Yield ``(line_number, record)`` for every non-blank data record; the
+    record is a dict, or the error message if it cannot be parsed.
+
+    A CSV record may span lines within a quoted field; it is numbered by
+    its first line, and handed to the one csv reader once its quotes are
+    balanced.
+    """
+    feed = LineFeed()
+    reader = csv.reader(feed)
+    header = None
+    line_number = first_line = quotes = 0
+    async for line in lines:
+        line_number += 1
+        if format != "csv":
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, f"Invalid JSON: {e}"
+            continue
+
+        if not feed.lines:
+            if not line.strip():
+                continue
+            first_line = line_number
+        feed.lines.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+
+        values = next(reader)
+        quotes = 0
+        if header is None:
+            header = values
+            continue
+        # Empty cells fall back to the model defaults
+        yield first_line, {key: value for key, value in zip(header, values) if value != ""}
+
+    if feed.lines:
+        yield first_line, "Unterminated quoted field"
+
+
+def validate(record) -> models.TransactionImport | str:
+    if isinstance(record, str):
+        return record
+    try:
+        transaction = transaction_adapter.validate_python(record)
+    except ValidationError as e:
+        return json.dumps(e.errors(include_url=False, include_input=False, include_context=False))
+    if transaction.type not in TRANSACTION_TYPES:
+        return f"Unknown transaction type {transaction.type!r}"
+    return transaction
+
+
+async def import_chunk(
+    session: models.AsyncSession,
+    job: models.DBImportJob,
+    chunk: list,
+) -> list[tuple[int, str]]:
+    rejects = []
+    transactions = []
+    for line_number, record in chunk:
+        result = validate(record)
+        if isinstance(result, str):
+            rejects.append((line_number, result))
+        else:
+            transactions.append((line_number, result))
+
+    wallet_ids = {transaction.wallet_id for _, transaction in transactions}
+    existing = set(
+        (await session.exec(select(models.DBWallet.id).where(models.DBWallet.id.in_(wallet_ids)))).all()
+    )
+    rejects += [
+        (line_number, "Wallet not found")
+        for line_number, transaction in transactions
+        if transaction.wallet_id not in existing
+    ]
+    transactions = [transaction for _, transaction in transactions if transaction.wallet_id in existing]
+
+    now = datetime.datetime.now()
+    if transactions:
+        for transaction in transactions:
+            transaction.created_at = transaction.created_at or now
+        await session.exec(
+            insert(models.DBTransaction),
+            params=[transaction.model_dump() for transaction in transactions],
+        )
+        await models.update_rollups(session, transactions)
+
+        # Historic rows land behind checkpoints that did not count them
+        earliest = {}
+        for transaction in transactions:
+            earliest[transaction.wallet_id] = min(
+                transaction.created_at, earliest.get(transaction.wallet_id, transaction.created_at)
+            )
+        for wallet_id, created_at in earliest.items():
+            await models.invalidate_checkpoints(session, wallet_id, created_at)
+
+        deltas = defaultdict(int)
+        for transaction in transactions:
+            deltas[transaction.wallet_id] += models.balance_delta(transaction.type, transaction.amount)
+        if settings.LEDGER_MODE:
+            await models.append_ledger_entries(session, deltas)
+        else:
+            await models.apply_balance_deltas(session, deltas)
+
+    job.rows_read += len(chunk)
+    job.rows_imported += len(transactions)
+    job.rows_rejected += len(rejects)
+    job.chunks += 1
+    job.updated_date = now
+    session.add(job)
+    await session.commit()
+    await models.wallet_cache.invalidate(*{transaction.wallet_id for transaction in transactions})
+
+    return sorted(rejects)
+
+
+async def import_transactions(
+    session: models.AsyncSession,
+    lines: AsyncIterator[str],
+    format: str,
+    job_name: str,
+    rejects: TextIO,
+    chunk_size: int,
+) -> models.ImportSummary:
+    started = time.perf_counter()
+
+    result = await session.exec(select(models.DBImportJob).where(models.DBImportJob.name == job_name))
+    job = result.one_or_none()
+    if job is None:
+        job = models.DBImportJob(name=job_name)
+        session.add(job)
+        await session.commit()
+        await session.refresh(job)
+
+    # Rows up to the last committed chunk were imported by an earlier run
+    skip = job.rows_read
+    rows = imported = rejected = 0
+    chunk = []
+
+    async def flush():
+        nonlocal imported, rejected
+        imported_before = job.rows_imported
+        for line_number, error in await import_chunk(session, job, chunk):
+            rejects.write(json.dumps(dict(line=line_number, error=error)) + "\n")
+            rejected += 1
+        rejects.flush()
+        imported += job.rows_imported - imported_before
+        chunk.clear()
+
+    async for line_number, record in read_records(lines, format):
+        rows += 1
+        if rows <= skip:
+            continue
+        chunk.append((line_number, record))
+        if len(chunk) >= chunk_size:
+            await flush()
+            logger.info(f"Import {job_name}: {job.rows_read} rows read")
+    if chunk:
+        await flush()
+
+    seconds = time.perf_counter() - started
+    processed = rows - min(skip, rows)
+    return models.ImportSummary(
+        job=job_name,
+        job_id=job.id,
+        rows=rows,
+        imported=imported,
+        rejected=rejected,
+        skipped=min(skip, rows),
+        seconds=round(seconds, 3),
+        rows_per_second=round(processed / seconds, 1) if seconds else 0.0,
+    )
+
+
+async def main(args):
+    models.init_db(settings)
+    models.engine.echo = False
+
+    path = pathlib.Path(args.path)
+    job_name = args.job or path.name
+    rejects_path = pathlib.Path(args.rejects or f"{path}.rejects.ndjson")
+
+    async_session = models.sessionmaker(
+        models.engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+    async with async_session() as session:
+        with rejects_path.open("a", encoding="utf-8") as rejects:
+            summary = await import_transactions(
+                session, file_lines(path), args.format, job_name, rejects, args.chunk_size
+            )
+    print(summary.model_dump_json(indent=2))
+    logger.info(f"Rejected rows are in {rejects_path}")
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "ndjson"), default="ndjson")
+    parser.add_argument("--job", help="resume key, defaults to the file name")
+    parser.add_argument("--rejects", help="defaults to <path>.rejects.ndjson")
+    parser.add_argument("--chunk-size", type=int, default=settings.IMPORT_CHUNK_SIZE)
+    asyncio.run(main(parser.parse_args()))
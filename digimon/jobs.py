@@ -0,0 +1,116 @@
+# digimon/jobs.py
+#
+# Periodic background jobs. They are started by the app lifespan, and each
+# one can also be run once from the command line:
+#
+#   python -m digimon.jobs checkpoints
+#   python -m digimon.jobs compact-ledger
+#   python -m digimon.jobs partitions
+#   python -m digimon.jobs idempotency-keys
+
+import argparse
+import asyncio
+import datetime
+import logging
+
+from . import config
+from . import models
+from . import partitions
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+tasks = []
+
+
+async def write_balance_checkpoints() -> int:
+    async_session = models.sessionmaker(
+        models.engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+    async with async_session() as session:
+        settled_before = datetime.datetime.now() - datetime.timedelta(
+            seconds=settings.BALANCE_CHECKPOINT_SETTLE_SECONDS
+        )
+        written = await models.write_balance_checkpoints(
+            session, settings.BALANCE_CHECKPOINT_INTERVAL, settled_before
+        )
+        await session.commit()
+    return written
+
+
+async def compact_ledger() -> int:
+    async_session = models.sessionmaker(
+        models.engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+    compacted = 0
+    async with async_session() as session:
+        # One DB transaction per batch keeps the wallet rows locked briefly
+        while True:
+            count = await models.compact_ledger(session, settings.LEDGER_COMPACTION_BATCH_SIZE)
+            await session.commit()
+            compacted += count
+            if count < settings.LEDGER_COMPACTION_BATCH_SIZE:
+                return compacted
+
+
+async def extend_partitions() -> int:
+    # Only does something on PostgreSQL once the table is partitioned
+    async with models.engine.begin() as connection:
+        return await connection.run_sync(partitions.extend, settings.TRANSACTION_PARTITIONS_AHEAD)
+
+
+async def purge_idempotency_keys() -> int:
+    async_session = models.sessionmaker(
+        models.engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+    async with async_session() as session:
+        expired = datetime.datetime.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+        purged = await models.purge_idempotency_keys(session, expired)
+        await session.commit()
+    return purged
+
+
+JOBS = {
+    "checkpoints": (write_balance_checkpoints, settings.BALANCE_CHECKPOINT_PERIOD_SECONDS),
+    "compact-ledger": (compact_ledger, settings.LEDGER_COMPACTION_PERIOD_SECONDS),
+    "partitions": (extend_partitions, settings.TRANSACTION_PARTITIONS_PERIOD_SECONDS),
+    "idempotency-keys": (purge_idempotency_keys, settings.IDEMPOTENCY_PURGE_PERIOD_SECONDS),
+}
+
+
+async def run_periodically(name: str, job, period: float):
+    while True:
+        await asyncio.sleep(period)
+        try:
+            result = await job()
+            logger.debug(f"Job {name}: {result}")
+        except Exception:
+            logger.exception(f"Job {name} failed")
+
+
+def start_jobs():
+    for name, (job, period) in JOBS.items():
+        if period > 0:
+            tasks.append(asyncio.create_task(run_periodically(name, job, period)))
+
+
+async def stop_jobs():
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    tasks.clear()
+
+
+async def main(args):
+    models.init_db(settings)
+    job, _ = JOBS[args.job]
+    logger.info(f"Job {args.job}: {await job()}")
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("job", choices=sorted(JOBS))
+    asyncio.run(main(parser.parse_args()))
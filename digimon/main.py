@@ -1,23 +1,31 @@
 # ssl patch
 from gevent import monkey
 
-monkey.patch_all()
+monkey.patch_ssl()
 
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 
 from . import config
 from . import models
+from . import scheduler
+from . import jobs
+from . import idempotency
+from . import passwords
 
 from . import routers
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    jobs.start_jobs()
     yield
+    await jobs.stop_jobs()
+    await scheduler.write_scheduler.close()
+    passwords.password_hasher.close()
     if models.engine is not None:
         # Close the DB connection
-        await models.sesion_close()
+        await models.close_session()
 
 
 def create_app(settings=None):
@@ -25,6 +33,8 @@ def create_app(settings=None):
         settings = config.get_settings()
 
     app = FastAPI(lifespan=lifespan)
+    app.add_middleware(idempotency.IdempotencyMiddleware)
+    app.add_exception_handler(passwords.PasswordHasherBusy, passwords.busy_response)
 
     models.init_db(settings)
 
@@ -0,0 +1,146 @@
+# digimon/migrate_money.py
+#
+# Convert money columns stored as float major units into BIGINT minor units.
+#
+#   python -m digimon.migrate_money [--exponent 2]
+
+import argparse
+import asyncio
+import logging
+
+from sqlalchemy import BigInteger, Column, ForeignKeyConstraint, Index, MetaData, Table, inspect, text
+
+from digimon import models
+from digimon.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+MONEY_COLUMNS = {
+    "wallets": ["balance"],
+    "transactions": ["amount"],
+    "transfers": ["amount"],
+    "items": ["price", "tax"],
+}
+
+
+def float_columns(connection, table: str) -> list[str]:
+    inspector = inspect(connection)
+    if not inspector.has_table(table):
+        return []
+
+    columns = {column["name"]: column["type"] for column in inspector.get_columns(table)}
+    return [
+        name
+        for name in MONEY_COLUMNS[table]
+        if name in columns and columns[name].python_type is not int
+    ]
+
+
+def convert_postgresql(connection, table: str, columns: list[str], factor: int):
+    alterations = ", ".join(
+        f"ALTER COLUMN {column} TYPE BIGINT USING round({column} * {factor})::bigint"
+        for column in columns
+    )
+    connection.execute(text(f"ALTER TABLE {table} {alterations}"))
+
+
+def integer_copy(old: Table, name: str, columns: list[str]) -> Table:
+    """``old`` as it is in the database, with ``columns`` as BIGINT."""
+    table = Table(name, MetaData())
+    for column in old.columns:
+        table.append_column(
+            Column(
+                column.name,
+                BigInteger() if column.name in columns else column.type,
+                primary_key=column.primary_key,
+                nullable=column.nullable,
+                server_default=column.server_default,
+            )
+        )
+    for constraint in old.foreign_key_constraints:
+        table.append_constraint(
+            ForeignKeyConstraint(
+                [column.name for column in constraint.columns],
+                [f"{element.column.table.name}.{element.column.name}" for element in constraint.elements],
+            )
+        )
+    for index in old.indexes:
+        Index(index.name, *[table.c[column.name] for column in index.columns], unique=index.unique)
+    return table
+
+
+def convert_sqlite(connection, table: str, columns: list[str], factor: int):
+    # SQLite cannot change a column type, and a REAL column turns integers
+    # back into floats, so the table is rebuilt with the columns it has now;
+    # later columns are added by migrate_schema
+    old = Table(table, MetaData(), autoload_with=connection)
+
+    old_table = f"{table}_float"
+    # Otherwise the rename also repoints other tables' foreign keys, e.g.
+    # transactions.transfer_id, at the old table
+    connection.exec_driver_sql("PRAGMA legacy_alter_table = ON")
+    connection.execute(text(f"ALTER TABLE {table} RENAME TO {old_table}"))
+    connection.exec_driver_sql("PRAGMA legacy_alter_table = OFF")
+    for index in old.indexes:
+        connection.execute(text(f"DROP INDEX {index.name}"))
+
+    new = integer_copy(old, table, columns)
+    # The tables its foreign keys point at, for the DDL to name them
+    for constraint in old.foreign_key_constraints:
+        constraint.referred_table.to_metadata(new.metadata)
+    new.create(connection)
+
+    names = [column.name for column in old.columns]
+    values = [
+        f"CAST(ROUND({name} * {factor}) AS INTEGER)" if name in columns else name
+        for name in names
+    ]
+    connection.execute(
+        text(
+            f"INSERT INTO {table} ({', '.join(names)}) "
+            f"SELECT {', '.join(values)} FROM {old_table}"
+        )
+    )
+    connection.execute(text(f"DROP TABLE {old_table}"))
+
+
+def migrate(connection, exponent: int):
+    factor = 10**exponent
+    if connection.dialect.name == "postgresql":
+        convert = convert_postgresql
+    else:
+        convert = convert_sqlite
+        # The sqlite driver does not open a transaction before DDL by itself
+        connection.exec_driver_sql("BEGIN")
+
+    for table in MONEY_COLUMNS:
+        columns = float_columns(connection, table)
+        if not columns:
+            logger.info("%s: already stored in minor units", table)
+            continue
+
+        convert(connection, table, columns, factor)
+        logger.info("%s: converted %s to minor units", table, ", ".join(columns))
+
+
+async def main(args):
+    settings = get_settings()
+    models.init_db(settings)
+
+    # One DB transaction, either every table is converted or none is
+    async with models.engine.begin() as connection:
+        await connection.run_sync(migrate, args.exponent)
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--exponent",
+        type=int,
+        default=models.MINOR_UNIT_EXPONENT,
+        help="number of minor-unit digits of the currency",
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,83 @@
+# digimon/migrate_schema.py
+#
+# Bring an existing database up to the current models: create missing
+# tables, add missing columns with their existing rows backfilled from the
+# column's server default, and create missing indexes. Run it after
+# migrate_money on a database that predates minor units.
+#
+#   python -m digimon.migrate_schema
+
+import argparse
+import asyncio
+import logging
+
+from sqlalchemy import inspect, text
+from sqlmodel import SQLModel
+
+from digimon import models
+from digimon.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+def add_column(connection, table, column):
+    dialect = connection.dialect
+    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=dialect)}"
+    for foreign_key in column.foreign_keys:
+        ddl += f" REFERENCES {foreign_key.column.table.name} ({foreign_key.column.name})"
+
+    default = dialect.ddl_compiler(dialect, None).get_column_default_string(column)
+    # SQLite only adds columns with a constant default, e.g. not
+    # CURRENT_TIMESTAMP; those are backfilled and stay nullable there
+    constant = column.server_default is not None and isinstance(column.server_default.arg, str)
+    if default is not None and (dialect.name == "postgresql" or constant):
+        ddl += f" DEFAULT {default}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+        connection.execute(text(ddl))
+        return
+
+    connection.execute(text(ddl))
+    if default is not None:
+        connection.execute(
+            text(f"UPDATE {table.name} SET {column.name} = {default} WHERE {column.name} IS NULL")
+        )
+
+
+def migrate(connection):
+    if connection.dialect.name != "postgresql":
+        # The sqlite driver does not open a transaction before DDL by itself
+        connection.exec_driver_sql("BEGIN")
+
+    SQLModel.metadata.create_all(connection, checkfirst=True)
+
+    inspector = inspect(connection)
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                raise RuntimeError(f"{table.name}.{column.name} is NOT NULL without a server default")
+            add_column(connection, table, column)
+            logger.info("%s: added %s", table.name, column.name)
+
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+async def main(args):
+    settings = get_settings()
+    models.init_db(settings)
+
+    # One DB transaction, either the whole schema is brought up or nothing
+    async with models.engine.begin() as connection:
+        await connection.run_sync(migrate)
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    asyncio.run(main(parser.parse_args()))
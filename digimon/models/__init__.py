@@ -6,11 +6,21 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
 
+from .money import *
 from .items import *
 from .merchants import *
 from .users import *
 from .wallets import *
 from .transactions import *
+from .transfers import *
+from .checkpoints import *
+from .imports import *
+from .rollups import *
+from .reconciliation import *
+from .archives import *
+from .search import *
+from .entity_cache import *
+from .idempotency import *
 
 
 connect_args = {}
@@ -27,6 +37,7 @@ def init_db(settings):
         future=True,
         connect_args=connect_args,
     )
+    configure_entity_caches(settings)
 
 
 async def recreate_table():
@@ -41,6 +52,22 @@ async def get_session() -> AsyncIterator[AsyncSession]:
         yield session
 
 
+async def stream_rows(statement, chunk_size: int):
+    """Yield the rows of ``statement`` in lists of up to ``chunk_size``.
+
+    Rows come from a server-side cursor on a session of its own, so only
+    one chunk is held in memory and the caller can outlive the request's
+    session.
+    """
+    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with async_session() as session:
+        result = await session.stream(
+            statement.execution_options(yield_per=chunk_size)
+        )
+        async for rows in result.partitions():
+            yield rows
+
+
 async def close_session():
     global engine
     if engine is None:
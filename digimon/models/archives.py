@@ -0,0 +1,119 @@
+# digimon/models/archives.py
+
+import datetime
+from collections import defaultdict
+from sqlmodel import SQLModel, Field, delete, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Optional
+
+from .money import MoneyField
+from .rollups import UPSERT_CHUNK_SIZE, dialect_insert
+from .transactions import DBTransaction
+from .wallets import DBWallet, balance_delta
+
+# Same columns and order as the NDJSON export, so an archive file reads
+# like an export of its month
+ARCHIVE_COLUMNS = ("id", "wallet_id", "amount", "type", "description", "transfer_id", "created_at")
+
+class DBTransactionArchive(SQLModel, table=True):
+    """Transactions created in ``month`` that were moved out of the
+    ``transactions`` table into a gzip NDJSON file.
+
+    ``first_id`` and ``last_id`` bound the ids in the file, to route a
+    lookup by id; ``size`` is the length of the file covered by committed
+    chunks.
+    """
+
+    __tablename__ = "transaction_archives"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    month: datetime.date = Field(unique=True)
+    path: str
+    rows: int = 0
+    first_id: Optional[int] = None
+    last_id: Optional[int] = None
+    size: int = 0
+    updated_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+class DBArchivedWalletTotal(SQLModel, table=True):
+    """Sum of a wallet's archived transactions, so balances can still be
+    reconciled without reading the archive files."""
+
+    __tablename__ = "archived_wallet_totals"
+    archive_id: int = Field(primary_key=True, foreign_key="transaction_archives.id")
+    wallet_id: int = Field(primary_key=True, foreign_key="wallets.id")
+    total: int = MoneyField(0)
+    count: int = 0
+
+
+def month_start(moment: datetime.date) -> datetime.date:
+    return datetime.date(moment.year, moment.month, 1)
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month: datetime.date) -> tuple[datetime.datetime, datetime.datetime]:
+    start = datetime.datetime.combine(month, datetime.time())
+    return start, datetime.datetime.combine(add_months(month, 1), datetime.time())
+
+
+async def archive_horizon(session: AsyncSession) -> datetime.datetime | None:
+    """End of the newest archived month: older transactions may be in an
+    archive file instead of the ``transactions`` table."""
+    result = await session.exec(select(func.max(DBTransactionArchive.month)))
+    month = result.one()
+    if month is None:
+        return None
+    return month_bounds(month)[1]
+
+
+def archived_total():
+    # Sum of the archived transactions of the wallet in the outer query
+    return (
+        select(func.coalesce(func.sum(DBArchivedWalletTotal.total), 0))
+        .where(DBArchivedWalletTotal.wallet_id == DBWallet.id)
+        .scalar_subquery()
+    )
+
+
+async def record_archived_rows(
+    session: AsyncSession, archive: DBTransactionArchive, rows: list, size: int
+):
+    """Delete ``rows`` (tuples of ``ARCHIVE_COLUMNS``) from the
+    ``transactions`` table once they are written to the archive file, and
+    add them to the archive's totals. Does not commit."""
+    totals = defaultdict(lambda: [0, 0])
+    for _, wallet_id, amount, type, *_ in rows:
+        totals[wallet_id][0] += balance_delta(type, amount)
+        totals[wallet_id][1] += 1
+
+    rows_by_wallet = [
+        dict(archive_id=archive.id, wallet_id=wallet_id, total=total, count=count)
+        for wallet_id, (total, count) in sorted(totals.items())
+    ]
+    for start in range(0, len(rows_by_wallet), UPSERT_CHUNK_SIZE):
+        statement = dialect_insert(session, DBArchivedWalletTotal).values(
+            rows_by_wallet[start : start + UPSERT_CHUNK_SIZE]
+        )
+        await session.exec(
+            statement.on_conflict_do_update(
+                index_elements=["archive_id", "wallet_id"],
+                set_=dict(
+                    total=DBArchivedWalletTotal.total + statement.excluded.total,
+                    count=DBArchivedWalletTotal.count + statement.excluded.count,
+                ),
+            )
+        )
+
+    ids = [row[0] for row in rows]
+    await session.exec(delete(DBTransaction).where(DBTransaction.id.in_(ids)))
+
+    archive.rows += len(rows)
+    first, last = min(ids), max(ids)
+    archive.first_id = first if archive.first_id is None else min(archive.first_id, first)
+    archive.last_id = last if archive.last_id is None else max(archive.last_id, last)
+    archive.size = size
+    archive.updated_date = datetime.datetime.now()
+    session.add(archive)
@@ -0,0 +1,228 @@
+# digimon/models/checkpoints.py
+
+import datetime
+from sqlalchemy import true, tuple_
+from sqlmodel import SQLModel, Field, Index, delete, func, insert, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Optional
+
+from .money import MoneyField
+from .transactions import DBTransaction, signed_amount
+from .wallets import DBWallet, wallet_balance
+
+class WalletBalance(SQLModel):
+    wallet_id: int
+    balance: int
+    at: datetime.datetime
+    checkpoint_id: Optional[int] = None
+
+class DBBalanceCheckpoint(SQLModel, table=True):
+    """Wallet balance after every transaction up to ``(as_of,
+    transaction_id)`` in ``(created_at, id)`` order.
+
+    Neither ids nor commit order follow ``created_at``: imports carry
+    historic timestamps, and concurrent commits can land out of order.
+    """
+
+    __tablename__ = "balance_checkpoints"
+    __table_args__ = (
+        Index("ix_balance_checkpoints_wallet_id_as_of", "wallet_id", "as_of"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    wallet_id: int = Field(foreign_key="wallets.id")
+    transaction_id: int
+    balance: int = MoneyField()
+    as_of: datetime.datetime
+
+
+class DBCheckpointProgress(SQLModel, table=True):
+    """Transactions up to ``transaction_id`` have been counted towards the
+    checkpoints of their wallets."""
+
+    __tablename__ = "balance_checkpoint_progress"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    transaction_id: int = 0
+
+
+def checkpoint_order(created_at, transaction_id):
+    return tuple_(created_at, transaction_id)
+
+
+def transaction_order():
+    return checkpoint_order(DBTransaction.created_at, DBTransaction.id)
+
+
+async def write_balance_checkpoints(
+    session: AsyncSession, interval: int, settled_before: Optional[datetime.datetime] = None
+) -> int:
+    """Checkpoint every wallet with ``interval`` or more transactions since
+    its last checkpoint; returns the number of checkpoints written.
+
+    Only the wallets of transactions added since the previous run are
+    looked at, and a run ends where the first transaction created after
+    ``settled_before`` (default now) begins. A checkpoint only covers
+    transactions created before that; ones created earlier but still
+    uncommitted would otherwise fall behind it unaccounted. Its balance
+    and position come from one statement, so they are consistent with
+    each other.
+    """
+    settled_before = settled_before or datetime.datetime.now()
+    # Locked, so runs of several workers take turns
+    result = await session.exec(select(DBCheckpointProgress).with_for_update())
+    progress = result.first()
+    if progress is None:
+        progress = DBCheckpointProgress()
+        session.add(progress)
+
+    # Ids follow insertion, not created_at: historic imports get new ids
+    unsettled = await session.exec(
+        select(func.min(DBTransaction.id)).where(
+            DBTransaction.id > progress.transaction_id, DBTransaction.created_at > settled_before
+        )
+    )
+    new = [DBTransaction.id > progress.transaction_id]
+    end = unsettled.one()
+    if end is not None:
+        new.append(DBTransaction.id < end)
+    result = await session.exec(
+        select(DBTransaction.wallet_id, func.max(DBTransaction.id)).where(*new).group_by(DBTransaction.wallet_id)
+    )
+    touched = result.all()
+    if not touched:
+        return 0
+    progress.transaction_id = max(transaction_id for _, transaction_id in touched)
+    session.add(progress)
+
+    written = 0
+    for wallet_id, _ in touched:
+        result = await session.exec(
+            select(DBBalanceCheckpoint.as_of, DBBalanceCheckpoint.transaction_id)
+            .where(DBBalanceCheckpoint.wallet_id == wallet_id)
+            .order_by(DBBalanceCheckpoint.as_of.desc(), DBBalanceCheckpoint.transaction_id.desc())
+            .limit(1)
+        )
+        since = [DBTransaction.wallet_id == wallet_id, DBTransaction.created_at <= settled_before]
+        last_checkpoint = result.first()
+        if last_checkpoint:
+            since.append(transaction_order() > checkpoint_order(*last_checkpoint))
+        # Counted no further than the interval
+        due = select(DBTransaction.id).where(*since).limit(interval).subquery()
+        if (await session.exec(select(func.count()).select_from(due))).one() < interval:
+            continue
+
+        # The last settled transaction, and the current balance less
+        # everything after it
+        point = (
+            select(DBTransaction.created_at, DBTransaction.id)
+            .where(DBTransaction.wallet_id == wallet_id, DBTransaction.created_at <= settled_before)
+            .order_by(DBTransaction.created_at.desc(), DBTransaction.id.desc())
+            .limit(1)
+            .subquery()
+        )
+        later = (
+            select(func.coalesce(func.sum(signed_amount()), 0))
+            .where(
+                DBTransaction.wallet_id == wallet_id,
+                transaction_order() > checkpoint_order(point.c.created_at, point.c.id),
+            )
+            .scalar_subquery()
+        )
+        result = await session.exec(
+            select(wallet_balance() - later, point.c.id, point.c.created_at)
+            .select_from(DBWallet)
+            .join(point, true())
+            .where(DBWallet.id == wallet_id)
+        )
+        row = result.first()
+        if row is None:
+            continue
+        balance, transaction_id, as_of = row
+        await session.exec(
+            insert(DBBalanceCheckpoint).values(
+                wallet_id=wallet_id, balance=balance, transaction_id=transaction_id, as_of=as_of
+            )
+        )
+        written += 1
+    return written
+
+
+async def invalidate_checkpoints(
+    session: AsyncSession, wallet_id: int, created_at: datetime.datetime, transaction_id: int = 0
+):
+    """Drop the checkpoints of a wallet that cover a transaction at
+    ``(created_at, transaction_id)``, in the DB transaction that changes it.
+    ``transaction_id`` 0 drops every one from ``created_at`` on."""
+    await session.exec(
+        delete(DBBalanceCheckpoint).where(
+            DBBalanceCheckpoint.wallet_id == wallet_id,
+            checkpoint_order(DBBalanceCheckpoint.as_of, DBBalanceCheckpoint.transaction_id)
+            >= checkpoint_order(created_at, transaction_id),
+        )
+    )
+
+
+async def balance_at(
+    session: AsyncSession,
+    wallet_id: int,
+    at: datetime.datetime,
+    since: Optional[datetime.datetime] = None,
+) -> WalletBalance:
+    """Balance of a wallet at time ``at``, replaying only the transactions
+    between the nearest checkpoint and ``at``.
+
+    Transactions before ``since`` may have been archived, so checkpoints
+    older than that are not replayed from; ``at`` must not be before it.
+    """
+    checkpoints = [DBBalanceCheckpoint.wallet_id == wallet_id]
+    if since is not None:
+        checkpoints.append(DBBalanceCheckpoint.as_of >= since)
+
+    result = await session.exec(
+        select(DBBalanceCheckpoint)
+        .where(*checkpoints, DBBalanceCheckpoint.as_of <= at)
+        .order_by(DBBalanceCheckpoint.as_of.desc(), DBBalanceCheckpoint.transaction_id.desc())
+        .limit(1)
+    )
+    checkpoint = result.first()
+    if checkpoint:
+        replayed = await session.exec(
+            select(func.coalesce(func.sum(signed_amount()), 0)).where(
+                DBTransaction.wallet_id == wallet_id,
+                transaction_order() > checkpoint_order(checkpoint.as_of, checkpoint.transaction_id),
+                DBTransaction.created_at <= at,
+            )
+        )
+        return WalletBalance(
+            wallet_id=wallet_id,
+            balance=checkpoint.balance + replayed.one(),
+            at=at,
+            checkpoint_id=checkpoint.id,
+        )
+
+    # No checkpoint that old: walk back from the earliest checkpoint after
+    # ``at`` or, without any checkpoint, from the current balance
+    result = await session.exec(
+        select(DBBalanceCheckpoint)
+        .where(*checkpoints)
+        .order_by(DBBalanceCheckpoint.as_of, DBBalanceCheckpoint.transaction_id)
+        .limit(1)
+    )
+    checkpoint = result.first()
+    later = [DBTransaction.wallet_id == wallet_id, DBTransaction.created_at > at]
+    if checkpoint:
+        later.append(transaction_order() <= checkpoint_order(checkpoint.as_of, checkpoint.transaction_id))
+        balance = checkpoint.balance
+    else:
+        balance = wallet_balance()
+
+    reverted = await session.exec(
+        select(
+            balance - select(func.coalesce(func.sum(signed_amount()), 0)).where(*later).scalar_subquery()
+        ).where(DBWallet.id == wallet_id)
+    )
+    return WalletBalance(
+        wallet_id=wallet_id,
+        balance=reverted.one(),
+        at=at,
+        checkpoint_id=checkpoint.id if checkpoint else None,
+    )
@@ -0,0 +1,201 @@
+# digimon/models/entity_cache.py
+
+import logging
+from typing import Awaitable, Callable, Hashable
+
+from pydantic import BaseModel
+
+from .. import cache
+from .items import Item
+from .merchants import Merchant
+from .users import User
+from .wallets import WalletRead
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBackend:
+    """Entries in this process only, in a bounded LRU with a TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = cache.TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: Hashable) -> BaseModel | None:
+        return self.entries.get(key)
+
+    async def set(self, key: Hashable, value: BaseModel):
+        self.entries.set(key, value)
+
+    async def delete(self, key: Hashable):
+        self.entries.pop(key)
+
+    def stats(self) -> dict:
+        stats = self.entries.stats()
+        return dict(
+            size=stats["size"],
+            maxsize=stats["maxsize"],
+            evictions=stats["evictions"],
+            expirations=stats["expirations"],
+        )
+
+
+class SharedBackend:
+    """Entries in a cache server shared by every worker, stored as JSON.
+
+    ``client`` is anything with async ``get(key)`` and ``set(key, value,
+    ex=, nx=)``, e.g. a ``redis.asyncio`` client.
+
+    A delete leaves a tombstone for ``TOMBSTONE_SECONDS`` that ``set`` does
+    not overwrite, so a worker that loaded the row before the change
+    cannot put the old one back.
+    """
+
+    TOMBSTONE = "-"
+    TOMBSTONE_SECONDS = 10
+
+    def __init__(self, client, prefix: str, model: type[BaseModel], ttl: float):
+        self.client = client
+        self.prefix = prefix
+        self.model = model
+        self.ttl = ttl
+
+    async def get(self, key: Hashable) -> BaseModel | None:
+        value = await self.client.get(f"{self.prefix}{key}")
+        if value is None or value in (self.TOMBSTONE, self.TOMBSTONE.encode()):
+            return None
+        return self.model.model_validate_json(value)
+
+    async def set(self, key: Hashable, value: BaseModel):
+        await self.client.set(
+            f"{self.prefix}{key}", value.model_dump_json(), ex=max(int(self.ttl), 1), nx=True
+        )
+
+    async def delete(self, key: Hashable):
+        await self.client.set(f"{self.prefix}{key}", self.TOMBSTONE, ex=self.TOMBSTONE_SECONDS)
+
+    def stats(self) -> dict:
+        # Size and evictions are the cache server's business
+        return {}
+
+
+class EntityCache:
+    """Read-through cache of one entity type, keyed by id.
+
+    Handlers read with ``fetch`` and call ``invalidate`` once a change to
+    the row is committed; a disabled cache always loads from the DB. A
+    load overtaken by an invalidate of its key is not cached, it may have
+    read the row before the change.
+    """
+
+    def __init__(self, name: str, model: type[BaseModel]):
+        self.name = name
+        self.model = model
+        self.backend = None
+        self.enabled = False
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Invalidations per key while loads of it are in flight
+        self.loading = {}
+        self.generations = {}
+
+    async def fetch(
+        self, key: Hashable, load: Callable[[], Awaitable[BaseModel | None]]
+    ) -> BaseModel | None:
+        if not self.enabled:
+            return await load()
+
+        value = await self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        generation = self.generations.get(key, 0)
+        self.loading[key] = self.loading.get(key, 0) + 1
+        try:
+            value = await load()
+        finally:
+            overtaken = self.generations.get(key, 0) != generation
+            self.loading[key] -= 1
+            if not self.loading[key]:
+                del self.loading[key]
+                self.generations.pop(key, None)
+        # Misses are not cached, a create needs no invalidation
+        if value is not None and not overtaken:
+            await self.backend.set(key, value)
+        return value
+
+    async def peek(self, key: Hashable) -> BaseModel | None:
+        """The cached value if there is one, without loading or counting."""
+        if not self.enabled:
+            return None
+        return await self.backend.get(key)
+
+    async def invalidate(self, *keys: Hashable):
+        if not self.enabled:
+            return
+        for key in keys:
+            if key in self.loading:
+                self.generations[key] = self.generations.get(key, 0) + 1
+            await self.backend.delete(key)
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return dict(
+            enabled=self.enabled,
+            backend=type(self.backend).__name__ if self.enabled else None,
+            hits=self.hits,
+            misses=self.misses,
+            hit_ratio=self.hits / lookups if lookups else 0.0,
+            invalidations=self.invalidations,
+            **(self.backend.stats() if self.enabled else {}),
+        )
+
+
+item_cache = EntityCache("items", Item)
+merchant_cache = EntityCache("merchants", Merchant)
+user_cache = EntityCache("users", User)
+wallet_cache = EntityCache("wallets", WalletRead)
+
+ENTITY_CACHES = {
+    entity_cache.name: entity_cache
+    for entity_cache in (item_cache, merchant_cache, user_cache, wallet_cache)
+}
+
+
+def shared_cache_client(url: str):
+    try:
+        import redis.asyncio
+    except ImportError:
+        raise RuntimeError("ENTITY_CACHE_URL needs the redis package") from None
+    return redis.asyncio.from_url(url)
+
+
+def configure_entity_caches(settings):
+    """Point every entity cache at a fresh backend: the shared one when
+    ENTITY_CACHE_URL is set, otherwise a per-process LRU."""
+    client = shared_cache_client(settings.ENTITY_CACHE_URL) if settings.ENTITY_CACHE_URL else None
+    disabled = set(settings.ENTITY_CACHE_DISABLED)
+    if client is None:
+        disabled |= set(settings.ENTITY_CACHE_LOCAL_DISABLED)
+    for name, entity_cache in ENTITY_CACHES.items():
+        entity_cache.enabled = name not in disabled
+        if client is not None:
+            entity_cache.backend = SharedBackend(
+                client, f"digimon:{name}:", entity_cache.model, settings.ENTITY_CACHE_TTL_SECONDS
+            )
+        else:
+            entity_cache.backend = LocalBackend(
+                settings.ENTITY_CACHE_SIZE, settings.ENTITY_CACHE_TTL_SECONDS
+            )
+    logger.info(
+        f"Entity caches: {'shared' if client else 'local'}, "
+        f"disabled for {sorted(disabled) or 'none'}"
+    )
+
+
+def entity_cache_stats() -> dict:
+    return {name: entity_cache.stats() for name, entity_cache in ENTITY_CACHES.items()}
@@ -0,0 +1,32 @@
+# digimon/models/idempotency.py
+
+import datetime
+from sqlmodel import SQLModel, Field, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Optional
+
+class DBIdempotencyKey(SQLModel, table=True):
+    """Outcome of a mutating request sent with an ``Idempotency-Key``.
+
+    The row is inserted before the request runs (``status_code`` is unset
+    while it is in progress, ``created_date`` is when it was claimed), so
+    only one worker can claim a key.
+    """
+
+    __tablename__ = "idempotency_keys"
+    key: str = Field(primary_key=True, max_length=255)
+    fingerprint: str
+    status_code: Optional[int] = None
+    content_type: Optional[str] = None
+    body: Optional[bytes] = None
+    # Indexed for the purge of expired keys
+    created_date: datetime.datetime = Field(default_factory=datetime.datetime.now, index=True)
+
+
+async def purge_idempotency_keys(session: AsyncSession, before: datetime.datetime) -> int:
+    """Delete the keys claimed before ``before``, without committing;
+    returns how many were deleted."""
+    result = await session.exec(
+        delete(DBIdempotencyKey).where(DBIdempotencyKey.created_date < before)
+    )
+    return result.rowcount
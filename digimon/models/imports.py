@@ -0,0 +1,28 @@
+# digimon/models/imports.py
+
+import datetime
+from sqlmodel import SQLModel, Field
+from typing import Optional
+
+class ImportSummary(SQLModel):
+    job: str
+    job_id: int
+    rows: int
+    imported: int
+    rejected: int
+    skipped: int
+    seconds: float
+    rows_per_second: float
+
+class DBImportJob(SQLModel, table=True):
+    """Progress of a bulk transaction import, committed with every chunk so
+    an interrupted import can resume after the last committed one."""
+
+    __tablename__ = "import_jobs"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
+    rows_read: int = 0
+    rows_imported: int = 0
+    rows_rejected: int = 0
+    chunks: int = 0
+    updated_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
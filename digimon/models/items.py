@@ -1,10 +1,22 @@
-from typing import Optional
+from typing import Iterable, Optional
 
-from pydantic import BaseModel, ConfigDict
-from sqlmodel import Field, SQLModel, create_engine, Session, select, Relationship
+import pydantic
+from pydantic import BaseModel, ConfigDict, SerializeAsAny
+from sqlalchemy import bindparam
+from sqlmodel import Field, SQLModel, create_engine, Session, select, Relationship, insert, update
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from . import users
 from . import merchants
+from .money import Money, MoneyField
+
+# Items per multi-row INSERT of the bulk endpoints, well below the bound
+# parameter limit of SQLite
+BULK_CHUNK_SIZE = 1000
+MAX_BULK_ITEMS = 50_000
+BULK_COLUMNS = ("name", "description", "price", "tax", "merchant_id", "user_id")
+# Relations GET /items can nest in each item with ?embed=
+ITEM_RELATIONS = ("merchant", "user")
 
 
 class BaseItem(BaseModel):
@@ -12,8 +24,8 @@ class BaseItem(BaseModel):
 
     name: str
     description: str | None = None
-    price: float = 0.12
-    tax: float | None = None
+    price: Money = 12  # minor units
+    tax: Money | None = None
     merchant_id: int | None
     user_id: int | None = 1
 
@@ -29,12 +41,32 @@ class UpdatedItem(BaseItem):
 class Item(BaseItem):
     id: int
     merchant_id: int
-    # merchant: merchants.Merchant | None
+    version: int = 1
+
+
+class EmbeddedItem(Item):
+    """An item with the relations asked for with ``?embed=``; the others
+    are left out of the JSON rather than sent as null."""
+
+    merchant: merchants.Merchant | None = None
+    user: users.ReferenceUser | None = None
+
+    @pydantic.model_serializer(mode="wrap")
+    def omit_relations_not_embedded(self, handler):
+        data = handler(self)
+        for relation in ITEM_RELATIONS:
+            if relation not in self.model_fields_set:
+                data.pop(relation, None)
+        return data
 
 
 class DBItem(BaseItem, SQLModel, table=True):
     __tablename__ = "items"
     id: int = Field(default=None, primary_key=True)
+    # Bumped by every update, behind the ETag of the item
+    version: int = Field(default=1, sa_column_kwargs=dict(server_default="1"))
+    price: int = MoneyField(12)
+    tax: int | None = MoneyField(None)
     merchant_id: int = Field(default=None, foreign_key="merchants.id")
     merchant: merchants.DBMerchant = Relationship()
 
@@ -44,7 +76,91 @@ class DBItem(BaseItem, SQLModel, table=True):
 
 class ItemList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
-    items: list[Item]
+    # Serialized as what they are, so embedded relations are kept
+    items: list[SerializeAsAny[Item]]
     page: int
     page_count: int
-    size_per_page: int
\ No newline at end of file
+    size_per_page: int
+    next_after: int | None = None
+
+
+def embedded_item(db_item: DBItem, relations: Iterable[str]) -> EmbeddedItem:
+    """``db_item`` with ``relations`` nested; they must have been loaded
+    with the item, e.g. with selectinload."""
+    return EmbeddedItem.model_validate(
+        Item.model_validate(db_item).model_dump()
+        | {relation: getattr(db_item, relation) for relation in relations}
+    )
+
+
+class BulkUpdatedItem(UpdatedItem):
+    id: int
+
+
+class ItemBulkCreate(BaseModel):
+    items: list[CreatedItem] = pydantic.Field(min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class ItemBulkUpdate(BaseModel):
+    items: list[BulkUpdatedItem] = pydantic.Field(min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class ItemBulkResult(BaseModel):
+    ids: list[int]
+
+
+async def insert_items(session: AsyncSession, items: list[BaseItem]) -> list[int]:
+    """Insert ``items`` with one multi-row INSERT per chunk, without
+    committing; returns their ids in the order of ``items``."""
+    ids = []
+    for start in range(0, len(items), BULK_CHUNK_SIZE):
+        result = await session.exec(
+            insert(DBItem).returning(DBItem.id, sort_by_parameter_order=True),
+            params=[
+                item.model_dump(include=set(BULK_COLUMNS))
+                for item in items[start : start + BULK_CHUNK_SIZE]
+            ],
+        )
+        ids += result.scalars().all()
+    return ids
+
+
+async def update_items(session: AsyncSession, items: list[BulkUpdatedItem]) -> set[int]:
+    """Write ``items`` over the rows with their ids, without committing;
+    returns the ids of the rows written, each of which gets a new version.
+
+    A chunk's rows are locked before one executemany UPDATE writes them,
+    so a row deleted meanwhile is left out rather than written back.
+    """
+    table = DBItem.__table__
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("item_id"))
+        .values(version=table.c.version + 1)
+    )
+    updated = set()
+    for start in range(0, len(items), BULK_CHUNK_SIZE):
+        chunk = items[start : start + BULK_CHUNK_SIZE]
+        result = await session.exec(
+            select(DBItem.id).where(DBItem.id.in_([item.id for item in chunk])).with_for_update()
+        )
+        found = set(result.all())
+        rows = [
+            dict(item.model_dump(include=set(BULK_COLUMNS)), item_id=item.id)
+            for item in chunk
+            if item.id in found
+        ]
+        if rows:
+            await session.exec(statement, params=rows)
+        updated |= found
+    return updated
+
+
+async def existing_ids(session: AsyncSession, column, ids: set[int]) -> set[int]:
+    """Those of ``ids`` found in ``column``, looked up a chunk at a time."""
+    found = set()
+    ids = sorted(ids)
+    for start in range(0, len(ids), BULK_CHUNK_SIZE):
+        result = await session.exec(select(column).where(column.in_(ids[start : start + BULK_CHUNK_SIZE])))
+        found.update(result.all())
+    return found
@@ -1,6 +1,7 @@
-from typing import Optional, List, TYPE_CHECKING
+from typing import Iterable, Optional, List, TYPE_CHECKING
 
-from pydantic import BaseModel, ConfigDict
+import pydantic
+from pydantic import BaseModel, ConfigDict, SerializeAsAny
 from sqlmodel import Field, SQLModel, create_engine, Session, select, Relationship
 
 from . import users
@@ -23,21 +24,54 @@ class UpdatedMerchant(BaseMerchant):
     pass
 
 
+# Relations GET /merchants can nest in each merchant with ?embed=
+MERCHANT_RELATIONS = ("user",)
+
+
 class Merchant(BaseMerchant):
     id: int
+    version: int = 1
+
+
+class EmbeddedMerchant(Merchant):
+    """A merchant with the relations asked for with ``?embed=``; the others
+    are left out of the JSON rather than sent as null."""
+
+    user: users.ReferenceUser | None = None
+
+    @pydantic.model_serializer(mode="wrap")
+    def omit_relations_not_embedded(self, handler):
+        data = handler(self)
+        for relation in MERCHANT_RELATIONS:
+            if relation not in self.model_fields_set:
+                data.pop(relation, None)
+        return data
 
 
 class DBMerchant(BaseMerchant, SQLModel, table=True):
     __tablename__ = "merchants"
     id: Optional[int] = Field(default=None, primary_key=True)
+    # Bumped by every update, behind the ETag of the merchant
+    version: int = Field(default=1, sa_column_kwargs=dict(server_default="1"))
 
     user_id: int = Field(default=None, foreign_key="users.id")
     user: users.DBUser | None = Relationship()
 
 
+def embedded_merchant(db_merchant: "DBMerchant", relations: Iterable[str]) -> EmbeddedMerchant:
+    """``db_merchant`` with ``relations`` nested; they must have been
+    loaded with the merchant, e.g. with selectinload."""
+    return EmbeddedMerchant.model_validate(
+        Merchant.model_validate(db_merchant).model_dump()
+        | {relation: getattr(db_merchant, relation) for relation in relations}
+    )
+
+
 class MerchantList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
-    merchants: list[Merchant]
+    # Serialized as what they are, so embedded relations are kept
+    merchants: list[SerializeAsAny[Merchant]]
     page: int
-    page_size: int
-    size_per_page: int
\ No newline at end of file
+    page_size: int  # merchants on this page
+    size_per_page: int
+    next_after: int | None = None
\ No newline at end of file
@@ -0,0 +1,32 @@
+# digimon/models/money.py
+
+import decimal
+from typing import Annotated
+
+import pydantic
+from sqlmodel import BigInteger, Field
+
+# Money is stored as a 64-bit integer count of minor units (satang for THB).
+# MINOR_UNIT_EXPONENT is the number of minor-unit digits of the currency, so
+# an amount of 1099 is 10.99 in major units.
+MINOR_UNIT_EXPONENT = 2
+
+MONEY_MIN = -(2**63)
+MONEY_MAX = 2**63 - 1
+
+Money = Annotated[int, pydantic.Field(ge=MONEY_MIN, le=MONEY_MAX)]
+
+
+def MoneyField(default=..., **kwargs):
+    # SQLModel does not pick up sa_type from Annotated metadata, so table
+    # columns declare their money fields with this instead of Money
+    return Field(default, sa_type=BigInteger, ge=MONEY_MIN, le=MONEY_MAX, **kwargs)
+
+
+def to_minor_units(amount, exponent: int = MINOR_UNIT_EXPONENT) -> int:
+    value = decimal.Decimal(str(amount)).scaleb(exponent)
+    return int(value.to_integral_value(rounding=decimal.ROUND_HALF_EVEN))
+
+
+def to_major_units(amount: int, exponent: int = MINOR_UNIT_EXPONENT) -> decimal.Decimal:
+    return decimal.Decimal(amount).scaleb(-exponent)
@@ -0,0 +1,80 @@
+# digimon/models/reconciliation.py
+
+import datetime
+from sqlmodel import SQLModel, Field, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Optional
+
+from .archives import archived_total
+from .transactions import DBTransaction, signed_amount
+from .wallets import DBWallet, wallet_balance
+
+class WalletMismatch(SQLModel):
+    wallet_id: int
+    balance: int
+    expected: int
+    difference: int
+
+class ReconciliationSummary(SQLModel):
+    job: Optional[str] = None
+    wallets: int
+    transactions: int
+    mismatches: int
+    skipped_wallets: int
+    seconds: float
+    transactions_per_second: float
+    report_file: Optional[str] = None
+
+class DBReconciliationJob(SQLModel, table=True):
+    """Progress of a reconciliation run: every wallet with an id below
+    ``next_wallet_id`` has been checked, so a rerun resumes there."""
+
+    __tablename__ = "reconciliation_jobs"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
+    next_wallet_id: int = 0
+    wallets_checked: int = 0
+    transactions_checked: int = 0
+    mismatches: int = 0
+    updated_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+async def reconcile_wallets(
+    session: AsyncSession, first_wallet_id: int, last_wallet_id: int
+) -> tuple[int, int, list[WalletMismatch]]:
+    """Compare the balance of wallets ``first_wallet_id`` to
+    ``last_wallet_id`` (inclusive) with the sum of their transactions,
+    archived ones included.
+
+    The sums are computed by the database in one statement. Returns the
+    number of wallets and transactions checked, and the mismatches.
+    """
+    totals = (
+        select(
+            DBTransaction.wallet_id,
+            func.sum(signed_amount()).label("total"),
+            func.count(DBTransaction.id).label("count"),
+        )
+        .where(DBTransaction.wallet_id.between(first_wallet_id, last_wallet_id))
+        .group_by(DBTransaction.wallet_id)
+        .subquery()
+    )
+    result = await session.exec(
+        select(
+            DBWallet.id,
+            wallet_balance(),
+            func.coalesce(totals.c.total, 0) + archived_total(),
+            func.coalesce(totals.c.count, 0),
+        )
+        .outerjoin(totals, totals.c.wallet_id == DBWallet.id)
+        .where(DBWallet.id.between(first_wallet_id, last_wallet_id))
+        .order_by(DBWallet.id)
+    )
+    rows = result.all()
+
+    mismatches = [
+        WalletMismatch(wallet_id=wallet_id, balance=balance, expected=expected, difference=balance - expected)
+        for wallet_id, balance, expected, _ in rows
+        if balance != expected
+    ]
+    return len(rows), sum(count for *_, count in rows), mismatches
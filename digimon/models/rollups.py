@@ -0,0 +1,155 @@
+# digimon/models/rollups.py
+
+import datetime
+from collections import defaultdict
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import (
+    SQLModel, Field, Date, case, cast, delete, func, insert, select, type_coerce
+)
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Iterable
+
+from .money import MoneyField
+from .transactions import DBTransaction
+
+ROLLUP_TOTALS = ("credit_total", "credit_count", "debit_total", "debit_count")
+
+# Keep the bound parameters of one upsert well below SQLite's limit
+UPSERT_CHUNK_SIZE = 500
+
+class WalletDay(SQLModel):
+    day: datetime.date
+    credit_total: int = 0
+    credit_count: int = 0
+    debit_total: int = 0
+    debit_count: int = 0
+
+class WalletSummary(SQLModel):
+    wallet_id: int
+    days: list[WalletDay]
+    credit_total: int
+    credit_count: int
+    debit_total: int
+    debit_count: int
+
+class DBWalletRollup(WalletDay, table=True):
+    """Credit and debit totals of a wallet's transactions created on ``day``,
+    kept up to date in the same DB transaction as every write."""
+
+    __tablename__ = "wallet_daily_rollups"
+    wallet_id: int = Field(primary_key=True, foreign_key="wallets.id")
+    day: datetime.date = Field(primary_key=True)
+    credit_total: int = MoneyField(0)
+    debit_total: int = MoneyField(0)
+
+
+def dialect_insert(session: AsyncSession, model):
+    # ON CONFLICT is dialect specific in SQLAlchemy; both dialects we run on
+    # spell it the same way
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+async def update_rollups(session: AsyncSession, transactions: Iterable, reverse: bool = False):
+    """Add ``transactions`` to the daily rollups of their wallets, or take
+    them out again with ``reverse``. Does not commit.
+
+    Each transaction needs ``wallet_id``, ``created_at``, ``type`` and
+    ``amount``. They are summed per (wallet, day) first, so a batch costs
+    one upsert per chunk of rollup rows.
+    """
+    sign = -1 if reverse else 1
+    rollups = defaultdict(lambda: dict.fromkeys(ROLLUP_TOTALS, 0))
+    for transaction in transactions:
+        rollup = rollups[(transaction.wallet_id, transaction.created_at.date())]
+        kind = "debit" if transaction.type == "debit" else "credit"
+        rollup[f"{kind}_total"] += sign * transaction.amount
+        rollup[f"{kind}_count"] += sign
+
+    # Sorted so that concurrent writers lock rollup rows in the same order
+    rows = [
+        dict(wallet_id=wallet_id, day=day, **totals)
+        for (wallet_id, day), totals in sorted(rollups.items())
+    ]
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        statement = dialect_insert(session, DBWalletRollup).values(
+            rows[start : start + UPSERT_CHUNK_SIZE]
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["wallet_id", "day"],
+            set_={
+                total: getattr(DBWalletRollup, total) + getattr(statement.excluded, total)
+                for total in ROLLUP_TOTALS
+            },
+        )
+        await session.exec(statement)
+
+
+async def read_summary(
+    session: AsyncSession,
+    wallet_id: int,
+    day_from: datetime.date | None = None,
+    day_to: datetime.date | None = None,
+) -> WalletSummary:
+    query = select(DBWalletRollup).where(DBWalletRollup.wallet_id == wallet_id)
+    if day_from is not None:
+        query = query.where(DBWalletRollup.day >= day_from)
+    if day_to is not None:
+        query = query.where(DBWalletRollup.day < day_to)
+
+    result = await session.exec(query.order_by(DBWalletRollup.day))
+    days = [WalletDay.model_validate(rollup) for rollup in result.all()]
+    return WalletSummary(
+        wallet_id=wallet_id,
+        days=days,
+        **{total: sum(getattr(day, total) for day in days) for total in ROLLUP_TOTALS},
+    )
+
+
+def transaction_day(session: AsyncSession):
+    if session.bind.dialect.name == "sqlite":
+        # CAST(... AS DATE) has numeric affinity on SQLite
+        return type_coerce(func.date(DBTransaction.created_at), Date)
+    return cast(DBTransaction.created_at, Date)
+
+
+async def rebuild_rollups(
+    session: AsyncSession,
+    first_wallet_id: int,
+    last_wallet_id: int,
+    since: datetime.datetime | None = None,
+) -> int:
+    """Recompute the rollups of wallets ``first_wallet_id`` to
+    ``last_wallet_id`` (inclusive) from their transactions with one
+    INSERT ... SELECT ... GROUP BY, without committing. Returns the number
+    of rollup rows written.
+
+    Days before ``since`` are left alone, their transactions may have been
+    archived.
+    """
+    in_range = [DBTransaction.wallet_id.between(first_wallet_id, last_wallet_id)]
+    rollups = [DBWalletRollup.wallet_id.between(first_wallet_id, last_wallet_id)]
+    if since is not None:
+        in_range.append(DBTransaction.created_at >= since)
+        rollups.append(DBWalletRollup.day >= since.date())
+    await session.exec(delete(DBWalletRollup).where(*rollups))
+
+    is_debit = DBTransaction.type == "debit"
+    day = transaction_day(session)
+    totals = (
+        select(
+            DBTransaction.wallet_id,
+            day,
+            func.coalesce(func.sum(case((is_debit, 0), else_=DBTransaction.amount)), 0),
+            func.count(case((is_debit, None), else_=1)),
+            func.coalesce(func.sum(case((is_debit, DBTransaction.amount), else_=0)), 0),
+            func.count(case((is_debit, 1), else_=None)),
+        )
+        .where(*in_range)
+        .group_by(DBTransaction.wallet_id, day)
+    )
+    result = await session.exec(
+        insert(DBWalletRollup).from_select(["wallet_id", "day", *ROLLUP_TOTALS], totals)
+    )
+    return result.rowcount
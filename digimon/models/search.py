@@ -0,0 +1,270 @@
+# digimon/models/search.py
+
+import heapq
+import re
+from sqlalchemy import bindparam
+from sqlmodel import SQLModel, select, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+
+from .items import DBItem, Item
+from .merchants import DBMerchant, Merchant
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Matches ranked per query: a common word can match most of the catalogue,
+# and scoring all of it costs time in proportion to the catalogue
+SEARCH_CANDIDATES = 250
+# The longest prefix FTS5 indexes; a longer last term is cut to it, as a
+# prefix past the index is expanded over every matching row first
+MAX_PREFIX_LENGTH = 9
+
+class ItemSearchResults(SQLModel):
+    items: list[Item]
+
+class MerchantSearchResults(SQLModel):
+    merchants: list[Merchant]
+
+
+# Full-text indexes live outside the SQLModel tables: an FTS5 virtual table
+# per entity on SQLite, with prefix indexes for the as-you-type last term,
+# and a tsvector table with a GIN index on PostgreSQL. Weights rank a match
+# in the name above one in the description.
+SQLITE_PREFIXES = " ".join(str(length) for length in range(1, MAX_PREFIX_LENGTH + 1))
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(name, description, prefix='{SQLITE_PREFIXES}')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS merchants_fts USING fts5(name, prefix='{SQLITE_PREFIXES}')",
+]
+# Weights of the columns of each FTS5 table
+SQLITE_WEIGHTS = {
+    "items": {"name": 10.0, "description": 1.0},
+    "merchants": {"name": 1.0},
+}
+POSTGRESQL_DDL = [
+    "CREATE TABLE IF NOT EXISTS items_search "
+    "(id INTEGER PRIMARY KEY REFERENCES items (id) ON DELETE CASCADE, document TSVECTOR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_items_search_document ON items_search USING GIN (document)",
+    "CREATE TABLE IF NOT EXISTS merchants_search "
+    "(id INTEGER PRIMARY KEY REFERENCES merchants (id) ON DELETE CASCADE, document TSVECTOR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_merchants_search_document ON merchants_search USING GIN (document)",
+]
+SEARCH_TABLES = {
+    "sqlite": ("items_fts", "merchants_fts"),
+    "postgresql": ("items_search", "merchants_search"),
+}
+
+ITEM_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce({name}, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({description}, '')), 'B')"
+)
+MERCHANT_DOCUMENT = "to_tsvector('simple', coalesce({name}, ''))"
+
+
+@event.listens_for(SQLModel.metadata, "after_create")
+def create_search_tables(target, connection, **kw):
+    for statement in POSTGRESQL_DDL if connection.dialect.name == "postgresql" else SQLITE_DDL:
+        connection.execute(text(statement))
+
+
+@event.listens_for(SQLModel.metadata, "before_drop")
+def drop_search_tables(target, connection, **kw):
+    for table in SEARCH_TABLES.get(connection.dialect.name, ()):
+        connection.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+
+def dialect_name(session: AsyncSession) -> str:
+    return session.bind.dialect.name
+
+
+async def index_item(session: AsyncSession, item: DBItem):
+    """Add or replace the item in the search index, without committing."""
+    params = dict(id=item.id, name=item.name, description=item.description)
+    if dialect_name(session) == "postgresql":
+        document = ITEM_DOCUMENT.format(name=":name", description=":description")
+        await session.exec(
+            text(
+                f"INSERT INTO items_search (id, document) VALUES (:id, {document}) "
+                "ON CONFLICT (id) DO UPDATE SET document = excluded.document"
+            ).bindparams(**params)
+        )
+        return
+    await unindex_item(session, item.id)
+    await session.exec(
+        text(
+            "INSERT INTO items_fts (rowid, name, description) VALUES (:id, :name, :description)"
+        ).bindparams(**params)
+    )
+
+
+async def index_items(session: AsyncSession, ids: list[int], chunk_size: int = 1000):
+    """Add or replace many items in the search index, reading them back
+    from the items table a chunk at a time; does not commit."""
+    if dialect_name(session) == "postgresql":
+        statements = [
+            "INSERT INTO items_search (id, document) SELECT id, "
+            + ITEM_DOCUMENT.format(name="name", description="description")
+            + " FROM items WHERE id IN :ids "
+            "ON CONFLICT (id) DO UPDATE SET document = excluded.document"
+        ]
+    else:
+        statements = [
+            "DELETE FROM items_fts WHERE rowid IN :ids",
+            "INSERT INTO items_fts (rowid, name, description) "
+            "SELECT id, name, description FROM items WHERE id IN :ids",
+        ]
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start : start + chunk_size]
+        for statement in statements:
+            await session.exec(
+                text(statement).bindparams(bindparam("ids", value=chunk, expanding=True))
+            )
+
+
+async def unindex_item(session: AsyncSession, item_id: int):
+    table = "items_search WHERE id" if dialect_name(session) == "postgresql" else "items_fts WHERE rowid"
+    await session.exec(text(f"DELETE FROM {table} = :id").bindparams(id=item_id))
+
+
+async def index_merchant(session: AsyncSession, merchant: DBMerchant):
+    params = dict(id=merchant.id, name=merchant.name)
+    if dialect_name(session) == "postgresql":
+        document = MERCHANT_DOCUMENT.format(name=":name")
+        await session.exec(
+            text(
+                f"INSERT INTO merchants_search (id, document) VALUES (:id, {document}) "
+                "ON CONFLICT (id) DO UPDATE SET document = excluded.document"
+            ).bindparams(**params)
+        )
+        return
+    await unindex_merchant(session, merchant.id)
+    await session.exec(
+        text("INSERT INTO merchants_fts (rowid, name) VALUES (:id, :name)").bindparams(**params)
+    )
+
+
+async def unindex_merchant(session: AsyncSession, merchant_id: int):
+    table = "merchants_search WHERE id" if dialect_name(session) == "postgresql" else "merchants_fts WHERE rowid"
+    await session.exec(text(f"DELETE FROM {table} = :id").bindparams(id=merchant_id))
+
+
+def search_terms(q: str) -> list[str]:
+    # Only word characters reach the query syntax of either engine
+    return re.findall(r"\w+", q.lower())
+
+
+def rank_candidates(rows, terms: list[str], weights: list[float], limit: int) -> list[int]:
+    """Ids of the best ``limit`` of ``(id, *columns)`` rows that all match
+    ``terms``, the last one as a prefix; best first, newest first among
+    equals.
+
+    The score is BM25 without its document frequency part, which FTS5 can
+    only count by reading every posting of a term: the weighted term
+    frequency of each column, saturated and normalized by column length
+    as in BM25. ts_rank_cd on PostgreSQL leaves it out as well.
+    """
+    *exact, last = terms
+    tokenized = [[search_terms(text or "") for text in columns] for _, *columns in rows]
+    averages = [
+        max(sum(len(columns[index]) for columns in tokenized) / len(tokenized), 1.0)
+        for index in range(len(weights))
+    ]
+
+    scores = []
+    for (row_id, *_), columns in zip(rows, tokenized):
+        score = 0.0
+        for tokens, weight, average in zip(columns, weights, averages):
+            norm = 1.2 * (0.25 + 0.75 * len(tokens) / average)
+            counts = [tokens.count(term) for term in exact]
+            counts.append(sum(1 for token in tokens if token.startswith(last)))
+            score += weight * sum(count / (count + norm) for count in counts)
+        scores.append((-score, -row_id))
+    return [-row_id for _, row_id in heapq.nsmallest(limit, scores)]
+
+
+async def search_ids(session: AsyncSession, entity: str, q: str, limit: int) -> list[int]:
+    """Ids of the best ``limit`` matches of every term in ``q``, the last
+    term as a prefix, best match first.
+
+    Only the newest ``SEARCH_CANDIDATES`` matches are ranked, walked in id
+    order straight off the index, so a common word costs no more than a
+    rare one.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return []
+
+    if dialect_name(session) == "postgresql":
+        query = " & ".join(terms) + ":*"
+        result = await session.exec(
+            text(
+                "SELECT id FROM (SELECT id, document, query "
+                f"FROM {entity}_search, to_tsquery('simple', :query) AS query "
+                "WHERE document @@ query ORDER BY id DESC LIMIT :candidates) AS candidates "
+                "ORDER BY ts_rank_cd(document, query) DESC, id DESC LIMIT :limit"
+            ).bindparams(query=query, candidates=SEARCH_CANDIDATES, limit=limit)
+        )
+        return list(result.scalars())
+
+    terms[-1] = terms[-1][:MAX_PREFIX_LENGTH]
+    query = " ".join(f'"{term}"' for term in terms) + "*"
+    weights = SQLITE_WEIGHTS[entity]
+    result = await session.exec(
+        text(
+            f"SELECT rowid, {', '.join(weights)} FROM {entity}_fts WHERE {entity}_fts MATCH :query "
+            "ORDER BY rowid DESC LIMIT :candidates"
+        ).bindparams(query=query, candidates=SEARCH_CANDIDATES)
+    )
+    rows = result.all()
+    if not rows:
+        return []
+    return rank_candidates(rows, terms, list(weights.values()), limit)
+
+
+async def search_items(session: AsyncSession, q: str, limit: int = SEARCH_LIMIT) -> list[DBItem]:
+    ids = await search_ids(session, "items", q, limit)
+    if not ids:
+        return []
+    result = await session.exec(select(DBItem).where(DBItem.id.in_(ids)))
+    items = {item.id: item for item in result.all()}
+    return [items[item_id] for item_id in ids if item_id in items]
+
+
+async def search_merchants(session: AsyncSession, q: str, limit: int = SEARCH_LIMIT) -> list[DBMerchant]:
+    ids = await search_ids(session, "merchants", q, limit)
+    if not ids:
+        return []
+    result = await session.exec(select(DBMerchant).where(DBMerchant.id.in_(ids)))
+    merchants = {merchant.id: merchant for merchant in result.all()}
+    return [merchants[merchant_id] for merchant_id in ids if merchant_id in merchants]
+
+
+async def rebuild_search_index(session: AsyncSession) -> dict[str, int]:
+    """Refill both search indexes from the items and merchants tables with
+    one INSERT ... SELECT each, without committing. The FTS5 tables are
+    created anew, with the current table options."""
+    if dialect_name(session) == "postgresql":
+        statements = {
+            "items": "INSERT INTO items_search (id, document) SELECT id, "
+            + ITEM_DOCUMENT.format(name="name", description="description")
+            + " FROM items",
+            "merchants": "INSERT INTO merchants_search (id, document) SELECT id, "
+            + MERCHANT_DOCUMENT.format(name="name")
+            + " FROM merchants",
+        }
+    else:
+        statements = {
+            "items": "INSERT INTO items_fts (rowid, name, description) SELECT id, name, description FROM items",
+            "merchants": "INSERT INTO merchants_fts (rowid, name) SELECT id, name FROM merchants",
+        }
+
+    counts = {}
+    for (entity, statement), table in zip(statements.items(), SEARCH_TABLES[dialect_name(session)]):
+        if dialect_name(session) == "postgresql":
+            await session.exec(text(f"DELETE FROM {table}"))
+        else:
+            # Created again, so the index takes the current prefix lengths
+            await session.exec(text(f"DROP TABLE IF EXISTS {table}"))
+            await session.exec(text(SQLITE_DDL[SEARCH_TABLES["sqlite"].index(table)]))
+        result = await session.exec(text(statement))
+        counts[entity] = result.rowcount
+    return counts
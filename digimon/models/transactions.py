@@ -1,22 +1,166 @@
 # digimon/models/transactions.py
 
-from sqlmodel import SQLModel, Field, Relationship
+import datetime
+from collections import defaultdict
+from sqlmodel import SQLModel, Field, Index, Relationship, case, func, insert
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Optional
 
+from .money import MoneyField
+from .wallets import append_ledger_entries, apply_balance_deltas, balance_delta, read_balances
+
 class BaseTransaction(SQLModel):
     wallet_id: int
-    amount: float
+    amount: int = MoneyField()  # minor units
     type: str  # 'credit' or 'debit'
     description: Optional[str] = None
 
 class TransactionCreate(BaseTransaction):
     pass
 
+class TransactionImport(TransactionCreate):
+    # Historic transactions keep their original timestamp
+    created_at: Optional[datetime.datetime] = None
+
 class TransactionRead(BaseTransaction):
     id: int
+    transfer_id: Optional[int] = None
+    created_at: Optional[datetime.datetime] = None
 
 class DBTransaction(BaseTransaction, table=True):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Keyset pagination of a wallet's history walks this index
+        Index("ix_transactions_wallet_id_id", "wallet_id", "id"),
+        # Month ranges, for archiving and partition-style date filters
+        Index("ix_transactions_created_at_id", "created_at", "id"),
+        # A wallet's transactions between two balance checkpoints
+        Index("ix_transactions_wallet_id_created_at_id", "wallet_id", "created_at", "id"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     wallet_id: int = Field(foreign_key="wallets.id")
-    
+    # Set on both legs of a wallet-to-wallet transfer
+    transfer_id: Optional[int] = Field(default=None, foreign_key="transfers.id")
+    # The server default fills rows of databases from before the column
+    created_at: datetime.datetime = Field(
+        default_factory=datetime.datetime.now, sa_column_kwargs=dict(server_default=func.now())
+    )
+
+def stored_datetime(value: datetime.datetime) -> datetime.datetime:
+    # created_at is stored naive, in the server's local time; an aware
+    # datetime from a client is converted to that before it is compared
+    if value.tzinfo is None:
+        return value
+    return value.astimezone().replace(tzinfo=None)
+
+MAX_BATCH_SIZE = 10_000
+
+class TransactionBatch(SQLModel):
+    transactions: list[TransactionCreate] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+class TransactionBatchItem(SQLModel):
+    index: int
+    status: str  # 'ok', 'insufficient_funds' or 'wallet_not_found'
+    transaction: Optional[TransactionRead] = None
+
+class TransactionBatchResult(SQLModel):
+    results: list[TransactionBatchItem]
+    succeeded: int
+    failed: int
+
+class TransactionPage(SQLModel):
+    transactions: list[TransactionRead]
+    next_cursor: Optional[int] = None
+
+
+def signed_amount():
+    # SQL counterpart of balance_delta() for aggregating over transactions
+    return case(
+        (DBTransaction.type == "debit", -DBTransaction.amount),
+        else_=DBTransaction.amount,
+    )
+
+
+def plan_wallet(balance: int, entries: list[tuple[int, TransactionCreate]]):
+    # Walk the wallet's entries in request order, accepting a debit only
+    # while the running balance covers it
+    accepted, rejected = [], []
+    delta = floor = 0
+    for index, transaction in entries:
+        change = balance_delta(transaction.type, transaction.amount)
+        if transaction.type == 'debit' and balance + delta + change < 0:
+            rejected.append(index)
+            continue
+        accepted.append(index)
+        delta += change
+        floor = min(floor, delta)
+    return accepted, rejected, delta, floor
+
+
+async def apply_transactions(
+    session: AsyncSession, transactions: list[TransactionCreate], ledger: bool = False
+) -> list[tuple[str, Optional[TransactionRead]]]:
+    """Apply many transactions with set-based statements, without committing.
+
+    With ``ledger`` the balance changes are written as ledger entries
+    instead of updating the wallet rows, which stay locked from the read
+    of their balances to the commit.
+
+    Returns a ``(status, transaction)`` pair per entry, in request order;
+    ``transaction`` is only set for entries with status ``'ok'``.
+    """
+    entries_by_wallet = defaultdict(list)
+    for index, transaction in enumerate(transactions):
+        entries_by_wallet[transaction.wallet_id].append((index, transaction))
+
+    statuses = {}
+    pending = sorted(entries_by_wallet)
+    while pending:
+        balances = await read_balances(session, pending)
+        deltas, floors = {}, {}
+        for wallet_id in pending:
+            entries = entries_by_wallet[wallet_id]
+            if wallet_id not in balances:
+                statuses.update((index, "wallet_not_found") for index, _ in entries)
+                continue
+
+            accepted, rejected, delta, floor = plan_wallet(balances[wallet_id], entries)
+            statuses.update((index, "ok") for index in accepted)
+            statuses.update((index, "insufficient_funds") for index in rejected)
+            if accepted:
+                deltas[wallet_id] = delta
+                floors[wallet_id] = floor
+
+        if ledger:
+            await append_ledger_entries(session, deltas)
+            break
+        updated = await apply_balance_deltas(session, deltas, floors)
+        # A wallet whose balance changed since it was read fails the guard;
+        # plan it again against the new balance
+        pending = [wallet_id for wallet_id in deltas if wallet_id not in updated]
+
+    accepted = [index for index, status in sorted(statuses.items()) if status == "ok"]
+    created_at = datetime.datetime.now()
+    transaction_ids = []
+    if accepted:
+        result = await session.exec(
+            insert(DBTransaction).returning(DBTransaction.id, sort_by_parameter_order=True),
+            params=[
+                dict(transactions[index].model_dump(), created_at=created_at)
+                for index in accepted
+            ],
+        )
+        transaction_ids = result.scalars().all()
+
+    created = dict(zip(accepted, transaction_ids))
+    return [
+        (
+            statuses[index],
+            TransactionRead(
+                id=created[index], created_at=created_at, **transaction.model_dump()
+            )
+            if index in created
+            else None,
+        )
+        for index, transaction in enumerate(transactions)
+    ]
@@ -0,0 +1,26 @@
+# digimon/models/transfers.py
+
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from .money import MoneyField
+
+class BaseTransfer(SQLModel):
+    from_wallet_id: int
+    to_wallet_id: int
+    amount: int = MoneyField(gt=0)  # minor units
+    description: Optional[str] = None
+
+class TransferCreate(BaseTransfer):
+    pass
+
+class TransferRead(BaseTransfer):
+    id: int
+    # None only if a leg is in neither the table nor the archive
+    debit_transaction_id: Optional[int] = None
+    credit_transaction_id: Optional[int] = None
+
+class DBTransfer(BaseTransfer, table=True):
+    __tablename__ = "transfers"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    from_wallet_id: int = Field(foreign_key="wallets.id")
+    to_wallet_id: int = Field(foreign_key="wallets.id")
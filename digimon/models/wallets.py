@@ -1,10 +1,16 @@
-from sqlmodel import SQLModel, Field, Relationship
+import datetime
+from collections import defaultdict
+from sqlmodel import (
+    BigInteger, SQLModel, Field, Index, Relationship, case, delete, func, insert, literal, select, update
+)
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Optional
+from .money import MoneyField
 from .users import DBUser
 
 class BaseWallet(SQLModel):
     user_id: int
-    balance: float = 0.0
+    balance: int = MoneyField(0)  # minor units
 
 class WalletCreate(BaseWallet):
     pass
@@ -13,10 +19,215 @@ class WalletRead(BaseWallet):
     id: int
 
 class WalletUpdate(SQLModel):
-    balance: Optional[float] = None
+    balance: Optional[int] = MoneyField(None)
 
 class DBWallet(BaseWallet, table=True):
     __tablename__ = "wallets"
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="users.id")
-    
+
+class DBLedgerEntry(SQLModel, table=True):
+    """Change to a wallet balance that is not folded into ``wallets.balance``
+    yet. Entries are never updated: compaction adds them to the balance and
+    deletes them in the same DB transaction."""
+
+    __tablename__ = "ledger_entries"
+    __table_args__ = (
+        Index("ix_ledger_entries_wallet_id", "wallet_id"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    wallet_id: int = Field(foreign_key="wallets.id")
+    delta: int = MoneyField()
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+def pending_delta():
+    # Sum of the uncompacted ledger entries of the wallet in the outer query
+    return (
+        select(func.coalesce(func.sum(DBLedgerEntry.delta), 0))
+        .where(DBLedgerEntry.wallet_id == DBWallet.id)
+        .scalar_subquery()
+    )
+
+
+def wallet_balance():
+    # The balance a client sees: the stored one plus the uncompacted tail
+    return DBWallet.balance + pending_delta()
+
+
+async def read_wallet(session: AsyncSession, wallet_id: int) -> WalletRead | None:
+    result = await session.exec(
+        select(DBWallet, wallet_balance()).where(DBWallet.id == wallet_id)
+    )
+    row = result.first()
+    if row is None:
+        return None
+    db_wallet, balance = row
+    return WalletRead(**db_wallet.model_dump(exclude={"balance"}), balance=balance)
+
+
+def balance_delta(type: str, amount: int) -> int:
+    # A debit takes money out of the wallet, anything else puts it in
+    return -amount if type == "debit" else amount
+
+
+async def apply_balance_delta(
+    session: AsyncSession,
+    wallet_id: int,
+    delta: int,
+    check_funds: bool = False,
+) -> int | None:
+    """Add ``delta`` to the wallet balance in a single conditional UPDATE.
+
+    Returns the new balance, or ``None`` when the wallet does not exist or,
+    with ``check_funds``, when the update would take the balance below zero.
+    The row is changed in the database only, so no read-modify-write race
+    is possible between concurrent requests.
+    """
+    statement = (
+        update(DBWallet)
+        .where(DBWallet.id == wallet_id)
+        .values(balance=DBWallet.balance + delta)
+        .returning(DBWallet.balance)
+        .execution_options(synchronize_session=False)
+    )
+    if check_funds:
+        statement = statement.where(wallet_balance() + delta >= 0)
+
+    result = await session.exec(statement)
+    return result.scalar_one_or_none()
+
+
+async def append_ledger_entry(
+    session: AsyncSession,
+    wallet_id: int,
+    delta: int,
+    check_funds: bool = False,
+) -> int | None:
+    """Record a balance change as a new ledger entry, with one INSERT ...
+    SELECT that checks the wallet exists and, with ``check_funds``, that
+    its balance stays at or above zero.
+
+    Returns the entry id, or ``None`` when the check fails. The wallet row
+    is never updated, so credits to a hot wallet do not wait on each other.
+    A checked entry locks the wallet row first: the check only sees
+    committed entries, and on PostgreSQL two concurrent debits could both
+    pass it otherwise.
+    """
+    if check_funds:
+        await session.exec(select(DBWallet.id).where(DBWallet.id == wallet_id).with_for_update())
+
+    source = select(
+        DBWallet.id, literal(delta, BigInteger), literal(datetime.datetime.now())
+    ).where(DBWallet.id == wallet_id)
+    if check_funds:
+        source = source.where(wallet_balance() + delta >= 0)
+
+    result = await session.exec(
+        insert(DBLedgerEntry)
+        .from_select(["wallet_id", "delta", "created_at"], source)
+        .returning(DBLedgerEntry.id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def append_ledger_entries(session: AsyncSession, deltas: dict[int, int]):
+    """One ledger entry per wallet in ``deltas``, unchecked: the caller has
+    checked the funds with the wallet rows locked, e.g. by read_balances."""
+    if not deltas:
+        return
+    created_at = datetime.datetime.now()
+    await session.exec(
+        insert(DBLedgerEntry),
+        params=[
+            dict(wallet_id=wallet_id, delta=delta, created_at=created_at)
+            for wallet_id, delta in sorted(deltas.items())
+        ],
+    )
+
+
+async def compact_ledger(session: AsyncSession, batch_size: int) -> int:
+    """Fold up to ``batch_size`` of the oldest ledger entries into the wallet
+    balances, without committing; returns the number of entries folded.
+
+    Balances are updated and entries deleted in the same DB transaction, so
+    ``wallet_balance()`` reads the same value before and after.
+    """
+    result = await session.exec(
+        select(DBLedgerEntry.id, DBLedgerEntry.wallet_id, DBLedgerEntry.delta)
+        .order_by(DBLedgerEntry.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    entries = result.all()
+    if not entries:
+        return 0
+
+    deltas = defaultdict(int)
+    for _, wallet_id, delta in entries:
+        deltas[wallet_id] += delta
+    await apply_balance_deltas(session, deltas)
+
+    await session.exec(
+        delete(DBLedgerEntry).where(DBLedgerEntry.id.in_([entry_id for entry_id, _, _ in entries]))
+    )
+    return len(entries)
+
+
+# Keep the bound parameters of one statement well below SQLite's limit
+BALANCE_UPDATE_CHUNK_SIZE = 500
+
+
+async def read_balances(
+    session: AsyncSession, wallet_ids: list[int]
+) -> dict[int, int]:
+    # Rows are locked in id order so concurrent batches cannot deadlock
+    result = await session.exec(
+        select(DBWallet.id, wallet_balance())
+        .where(DBWallet.id.in_(wallet_ids))
+        .order_by(DBWallet.id)
+        .with_for_update()
+    )
+    return {wallet_id: balance for wallet_id, balance in result.all()}
+
+
+async def apply_balance_deltas(
+    session: AsyncSession,
+    deltas: dict[int, int],
+    floors: dict[int, int] | None = None,
+) -> dict[int, int]:
+    """Add a delta to many wallets with one UPDATE per chunk of wallets.
+
+    ``floors`` maps a wallet id to the lowest point its running balance
+    reaches relative to the current one (a value <= 0); the wallet is only
+    updated if ``balance + floor >= 0``, counting uncompacted ledger
+    entries. Returns the new stored balance of every wallet that was
+    updated.
+    """
+    floors = floors or {}
+    balances = {}
+    wallet_ids = sorted(deltas)
+
+    for start in range(0, len(wallet_ids), BALANCE_UPDATE_CHUNK_SIZE):
+        chunk = wallet_ids[start : start + BALANCE_UPDATE_CHUNK_SIZE]
+        statement = (
+            update(DBWallet)
+            .where(DBWallet.id.in_(chunk))
+            .values(
+                balance=DBWallet.balance
+                + case({wallet_id: deltas[wallet_id] for wallet_id in chunk}, value=DBWallet.id)
+            )
+            .returning(DBWallet.id, DBWallet.balance)
+            .execution_options(synchronize_session=False)
+        )
+
+        guarded = {wallet_id: floors[wallet_id] for wallet_id in chunk if floors.get(wallet_id)}
+        if guarded:
+            statement = statement.where(
+                wallet_balance() + case(guarded, value=DBWallet.id, else_=0) >= 0
+            )
+
+        result = await session.exec(statement)
+        balances.update({wallet_id: balance for wallet_id, balance in result.all()})
+
+    return balances
@@ -0,0 +1,134 @@
+# digimon/partitions.py
+#
+# Native monthly partitions of the transactions table on PostgreSQL. The
+# conversion is a one-off; partitions for the coming months are then created
+# ahead of time by the "partitions" job. SQLite has no native partitioning,
+# closed months are moved out by digimon.archive_transactions instead.
+#
+#   python -m digimon.partitions convert
+#   python -m digimon.partitions extend
+
+import argparse
+import asyncio
+import datetime
+import logging
+
+from sqlalchemy import inspect, text
+from sqlmodel import SQLModel
+
+from . import config
+from . import models
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"transactions_y{month:%Y}m{month:%m}"
+
+
+def is_partitioned(connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = 'transactions'::regclass)"
+        )
+    ).scalar()
+
+
+def create_partition(connection, month: datetime.date) -> bool:
+    name = partition_name(month)
+    if connection.execute(text("SELECT to_regclass(:name)"), dict(name=name)).scalar():
+        return False
+    connection.execute(
+        text(
+            f"CREATE TABLE {name} PARTITION OF transactions "
+            f"FOR VALUES FROM ('{month}') TO ('{models.add_months(month, 1)}')"
+        )
+    )
+    return True
+
+
+def extend(connection, months_ahead: int) -> int:
+    """Create the partitions of this month and the next ``months_ahead``
+    months; returns the number created. A no-op unless converted."""
+    if not is_partitioned(connection):
+        return 0
+    month = models.month_start(datetime.date.today())
+    return sum(
+        create_partition(connection, models.add_months(month, offset))
+        for offset in range(months_ahead + 1)
+    )
+
+
+def convert(connection, months_ahead: int):
+    """Rebuild ``transactions`` as a table partitioned by month of
+    ``created_at``, in the caller's DB transaction.
+
+    The primary key becomes (id, created_at), as PostgreSQL requires the
+    partition key in every unique index; ids still come from the same
+    sequence, so lookups by id alone are unchanged for the application.
+    """
+    if connection.dialect.name != "postgresql":
+        raise SystemExit("Native partitioning needs PostgreSQL")
+    if is_partitioned(connection):
+        logger.info("transactions: already partitioned")
+        return
+
+    old_table = "transactions_unpartitioned"
+    connection.execute(text(f"ALTER TABLE transactions RENAME TO {old_table}"))
+    connection.execute(text(f"ALTER TABLE {old_table} RENAME CONSTRAINT transactions_pkey TO {old_table}_pkey"))
+    for index in inspect(connection).get_indexes(old_table):
+        connection.execute(text(f"DROP INDEX {index['name']}"))
+
+    connection.execute(
+        text(
+            f"CREATE TABLE transactions (LIKE {old_table} INCLUDING DEFAULTS) "
+            "PARTITION BY RANGE (created_at)"
+        )
+    )
+    connection.execute(text("ALTER TABLE transactions ADD PRIMARY KEY (id, created_at)"))
+    connection.execute(text("ALTER TABLE transactions ADD FOREIGN KEY (wallet_id) REFERENCES wallets (id)"))
+    connection.execute(text("ALTER TABLE transactions ADD FOREIGN KEY (transfer_id) REFERENCES transfers (id)"))
+    # Keep the id sequence alive when the old table is dropped
+    sequence = connection.execute(text(f"SELECT pg_get_serial_sequence('{old_table}', 'id')")).scalar()
+    connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY transactions.id"))
+
+    # Rows outside every monthly partition, e.g. imports far in the past
+    connection.execute(text("CREATE TABLE transactions_default PARTITION OF transactions DEFAULT"))
+    oldest = connection.execute(text(f"SELECT min(created_at) FROM {old_table}")).scalar()
+    month = models.month_start(oldest or datetime.date.today())
+    last = models.add_months(models.month_start(datetime.date.today()), months_ahead)
+    while month <= last:
+        create_partition(connection, month)
+        month = models.add_months(month, 1)
+
+    connection.execute(text(f"INSERT INTO transactions SELECT * FROM {old_table}"))
+    connection.execute(text(f"DROP TABLE {old_table}"))
+    for index in SQLModel.metadata.tables["transactions"].indexes:
+        index.create(connection)
+    logger.info("transactions: partitioned by month")
+
+
+async def main(args):
+    models.init_db(settings)
+
+    # One DB transaction, the table is either fully converted or untouched
+    async with models.engine.begin() as connection:
+        if args.command == "convert":
+            await connection.run_sync(convert, settings.TRANSACTION_PARTITIONS_AHEAD)
+        else:
+            created = await connection.run_sync(extend, settings.TRANSACTION_PARTITIONS_AHEAD)
+            logger.info(f"transactions: {created} partitions created")
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("convert", "extend"))
+    asyncio.run(main(parser.parse_args()))
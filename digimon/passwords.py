@@ -0,0 +1,145 @@
+# digimon/passwords.py
+#
+# bcrypt takes 100-250ms of CPU per hash or check. It runs in a thread pool so
+# the event loop keeps serving other requests meanwhile; bcrypt releases the
+# GIL while hashing, so the threads do run in parallel.
+
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class Timings:
+    """Count, mean and maximum of every sample, percentiles of the recent
+    ones."""
+
+    def __init__(self, window: int = 1000):
+        self.recent = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.recent.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    def stats(self) -> dict:
+        return dict(
+            mean_ms=self.total / self.count * 1000 if self.count else 0.0,
+            p50_ms=self.percentile(0.5) * 1000,
+            p99_ms=self.percentile(0.99) * 1000,
+            max_ms=self.max * 1000,
+        )
+
+
+class PasswordHasher:
+    """bcrypt on ``workers`` threads.
+
+    At most ``queue_size`` calls wait for a free thread; past that a call
+    raises ``PasswordHasherBusy`` straight away rather than queue behind
+    work that would take seconds to drain.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor = None
+
+        self.pending = 0
+        self.max_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_wait = Timings()
+        self.hash_time = Timings()
+
+    async def run(self, function, *args):
+        if self.pending >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise PasswordHasherBusy(f"{self.pending} password hashes already pending")
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hasher")
+
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            result = function(*args)
+            return result, started - submitted, time.perf_counter() - started
+
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        try:
+            result, waited, took = await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+        finally:
+            self.pending -= 1
+
+        self.completed += 1
+        self.queue_wait.add(waited)
+        self.hash_time.add(took)
+        return result
+
+    async def hash(self, plain_password: str) -> str:
+        hashed = await self.run(bcrypt.hashpw, plain_password.encode("utf-8"), bcrypt.gensalt())
+        return hashed.decode("utf-8")
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run(
+            bcrypt.checkpw, plain_password.encode("utf-8"), hashed_password.encode("utf-8")
+        )
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def stats(self) -> dict:
+        return dict(
+            workers=self.workers,
+            queue_size=self.queue_size,
+            pending=self.pending,
+            queued=max(self.pending - self.workers, 0),
+            max_pending=self.max_pending,
+            completed=self.completed,
+            rejected=self.rejected,
+            queue_wait=self.queue_wait.stats(),
+            hash_time=self.hash_time.stats(),
+        )
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    queue_size=settings.PASSWORD_HASH_QUEUE_SIZE,
+)
+
+
+async def busy_response(request: Request, exc: PasswordHasherBusy) -> JSONResponse:
+    logger.warning(f"Shedding {request.method} {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content=dict(detail="Too many password checks in progress, retry shortly"),
+        headers={"Retry-After": "1"},
+    )
@@ -0,0 +1,54 @@
+# digimon/projection.py
+#
+# Sparse fieldsets: ?fields= narrows the SELECT of a list or read endpoint to
+# the columns asked for, and the rows go out as plain dicts instead of one
+# pydantic model each.
+
+import datetime
+import json
+from typing import Sequence
+
+from fastapi.responses import JSONResponse
+from sqlmodel import select
+
+
+def encode(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        # The same text pydantic gives datetimes
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class ProjectedResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return json.dumps(
+            content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=encode
+        ).encode("utf-8")
+
+
+def select_fields(model, fields: Sequence[str]):
+    return select(*[getattr(model, field) for field in fields])
+
+
+def with_version(fields: tuple[str, ...]) -> tuple[str, ...]:
+    # The version is behind the ETag, selected even when not sent
+    return fields if "version" in fields else (*fields, "version")
+
+
+def records(fields: Sequence[str], rows) -> list[dict]:
+    if len(fields) == 1:
+        # A single column comes back as scalars
+        return [{fields[0]: value} for value in rows]
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def versioned_records(fields: tuple[str, ...], rows) -> tuple[list[dict], list[int]]:
+    """Rows selected with ``with_version(fields)`` as dicts of ``fields``,
+    and their versions."""
+    selected = with_version(fields)
+    rows = records(selected, rows)
+    versions = [row["version"] for row in rows]
+    if "version" not in fields:
+        for row in rows:
+            del row["version"]
+    return rows, versions
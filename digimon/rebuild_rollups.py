@@ -0,0 +1,76 @@
+# digimon/rebuild_rollups.py
+#
+# Recompute the daily wallet rollups from the raw transactions. The wallet id
+# space is split into ranges that are rebuilt concurrently, each range in a
+# DB transaction of its own.
+#
+#   python -m digimon.rebuild_rollups [--workers 4] [--wallets-per-range 1000]
+
+import argparse
+import asyncio
+import datetime
+import logging
+import time
+
+from sqlmodel import func, select
+
+from . import config
+from . import models
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+
+async def rebuild_range(
+    first_wallet_id: int, last_wallet_id: int, since: datetime.datetime | None
+) -> int:
+    async_session = models.sessionmaker(
+        models.engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+    async with async_session() as session:
+        rows = await models.rebuild_rollups(session, first_wallet_id, last_wallet_id, since)
+        await session.commit()
+    logger.info(f"Wallets {first_wallet_id}-{last_wallet_id}: {rows} rollups")
+    return rows
+
+
+async def rebuild(workers: int, wallets_per_range: int) -> int:
+    async_session = models.sessionmaker(
+        models.engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+    async with async_session() as session:
+        result = await session.exec(select(func.min(models.DBWallet.id), func.max(models.DBWallet.id)))
+        first, last = result.one()
+        # Rollups of archived months cannot be recomputed, keep them
+        since = await models.archive_horizon(session)
+    if first is None:
+        return 0
+
+    semaphore = asyncio.Semaphore(workers)
+
+    async def run(start: int) -> int:
+        async with semaphore:
+            return await rebuild_range(start, min(start + wallets_per_range - 1, last), since)
+
+    counts = await asyncio.gather(*[run(start) for start in range(first, last + 1, wallets_per_range)])
+    return sum(counts)
+
+
+async def main(args):
+    models.init_db(settings)
+    models.engine.echo = False
+
+    started = time.perf_counter()
+    rows = await rebuild(args.workers, args.wallets_per_range)
+    logger.info(f"Rebuilt {rows} rollups in {time.perf_counter() - started:.1f}s")
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4, help="concurrent DB connections")
+    parser.add_argument("--wallets-per-range", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,50 @@
+# digimon/rebuild_search.py
+#
+# Create the full-text search indexes of items and merchants if they are
+# missing, e.g. on a database created before they existed, and refill them
+# from the tables.
+#
+#   python -m digimon.rebuild_search
+
+import asyncio
+import logging
+import time
+
+from . import config
+from . import models
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+
+async def rebuild() -> dict[str, int]:
+    async with models.engine.begin() as connection:
+        await connection.run_sync(lambda connection: models.create_search_tables(None, connection))
+
+    async_session = models.sessionmaker(
+        models.engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+    # One DB transaction, searches see the old index until the new one is complete
+    async with async_session() as session:
+        counts = await models.rebuild_search_index(session)
+        await session.commit()
+    return counts
+
+
+async def main():
+    models.init_db(settings)
+    models.engine.echo = False
+
+    started = time.perf_counter()
+    counts = await rebuild()
+    for entity, rows in counts.items():
+        logger.info(f"{entity}: {rows} rows indexed")
+    logger.info(f"Rebuilt the search index in {time.perf_counter() - started:.1f}s")
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
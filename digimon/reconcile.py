@@ -0,0 +1,151 @@
+# digimon/reconcile.py
+#
+# Check that every wallet balance equals the sum of the wallet's transactions.
+# The wallet id space is split into ranges that are summed by the database,
+# several ranges at once on separate connections. Mismatches are appended to
+# an NDJSON report as soon as their range is done. With --job, progress is
+# committed as ranges finish, so an interrupted run resumes where it stopped.
+#
+#   python -m digimon.reconcile [--workers 8] [--job nightly-2024-06-01]
+
+import argparse
+import asyncio
+import datetime
+import logging
+import pathlib
+import time
+from typing import Optional, TextIO
+
+from sqlmodel import func, select
+
+from . import config
+from . import models
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+
+def session_maker():
+    return models.sessionmaker(
+        models.engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+
+
+async def reconcile(
+    workers: int,
+    wallets_per_range: int,
+    report: TextIO,
+    job_name: Optional[str] = None,
+) -> models.ReconciliationSummary:
+    """Reconcile every wallet, ``workers`` ranges at a time.
+
+    On aiosqlite every connection runs on a thread of its own and SQLite
+    releases the GIL while it executes, so on a machine with several cores
+    the ranges of an SQLite file are summed in parallel as well.
+    """
+    started = time.perf_counter()
+    async with session_maker()() as session:
+        result = await session.exec(select(func.min(models.DBWallet.id), func.max(models.DBWallet.id)))
+        first, last = result.one()
+
+    job_session = session_maker()()
+    job = None
+    if job_name:
+        result = await job_session.exec(
+            select(models.DBReconciliationJob).where(models.DBReconciliationJob.name == job_name)
+        )
+        job = result.one_or_none()
+        if job is None:
+            job = models.DBReconciliationJob(name=job_name)
+            job_session.add(job)
+            await job_session.commit()
+    skipped = job.wallets_checked if job else 0
+
+    starts = []
+    if first is not None:
+        # Wallets below next_wallet_id were checked by an earlier run
+        start = max(first, job.next_wallet_id) if job else first
+        starts = list(range(start, last + 1, wallets_per_range))
+
+    semaphore = asyncio.Semaphore(workers)
+    job_lock = asyncio.Lock()
+    finished = {}
+    wallets = transactions = mismatches = 0
+    completed = 0  # ranges finished in id order, the resume point
+
+    async def run(start: int):
+        nonlocal wallets, transactions, mismatches, completed
+        async with semaphore:
+            async with session_maker()() as session:
+                counts = await models.reconcile_wallets(
+                    session, start, min(start + wallets_per_range - 1, last)
+                )
+
+        checked_wallets, checked_transactions, found = counts
+        logger.debug(f"Wallets from {start}: {checked_wallets} checked, {len(found)} mismatches")
+        for mismatch in found:
+            report.write(mismatch.model_dump_json() + "\n")
+        report.flush()
+        wallets += checked_wallets
+        transactions += checked_transactions
+        mismatches += len(found)
+
+        finished[start] = (checked_wallets, checked_transactions, len(found))
+        if job is None:
+            return
+
+        async with job_lock:
+            # Only move the resume point over ranges that all finished
+            advanced = False
+            while completed < len(starts) and starts[completed] in finished:
+                range_wallets, range_transactions, range_mismatches = finished.pop(starts[completed])
+                job.wallets_checked += range_wallets
+                job.transactions_checked += range_transactions
+                job.mismatches += range_mismatches
+                job.next_wallet_id = starts[completed] + wallets_per_range
+                completed += 1
+                advanced = True
+            if advanced:
+                job.updated_date = datetime.datetime.now()
+                job_session.add(job)
+                await job_session.commit()
+
+    try:
+        await asyncio.gather(*[run(start) for start in starts])
+    finally:
+        await job_session.close()
+
+    seconds = time.perf_counter() - started
+    return models.ReconciliationSummary(
+        job=job_name,
+        wallets=wallets,
+        transactions=transactions,
+        mismatches=mismatches,
+        skipped_wallets=skipped,
+        seconds=round(seconds, 3),
+        transactions_per_second=round(transactions / seconds, 1) if seconds else 0.0,
+    )
+
+
+async def main(args):
+    models.init_db(settings)
+    models.engine.echo = False
+
+    report_path = pathlib.Path(args.report)
+    with report_path.open("a", encoding="utf-8") as report:
+        summary = await reconcile(args.workers, args.wallets_per_range, report, args.job)
+    summary.report_file = str(report_path)
+    print(summary.model_dump_json(indent=2))
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4, help="concurrent DB connections")
+    parser.add_argument("--wallets-per-range", type=int, default=1000)
+    parser.add_argument("--job", help="resume key; without it progress is not saved")
+    parser.add_argument("--report", default="reconciliation.ndjson", help="mismatches are appended here")
+    asyncio.run(main(parser.parse_args()))
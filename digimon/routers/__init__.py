@@ -7,6 +7,8 @@ from .users import router as users_router
 from .authentication import router as auth_router
 from .wallets import router as wallets_router
 from .transactions import router as transactions_router
+from .transfers import router as transfers_router
+from .stats import router as stats_router
 
 def init_router(app):
     app.include_router(items_router)
@@ -15,3 +17,5 @@ def init_router(app):
     app.include_router(auth_router)
     app.include_router(wallets_router)
     app.include_router(transactions_router)
+    app.include_router(transfers_router)
+    app.include_router(stats_router)
@@ -7,11 +7,12 @@ from fastapi.security import (
 )
 
 
-from sqlmodel import select
+from sqlmodel import case, or_, select
 from typing import Annotated
 import datetime
 
 from .. import config
+from .. import deps
 from .. import models
 from .. import security
 
@@ -28,24 +29,28 @@ async def authentication(
     session: Annotated[models.AsyncSession, Depends(models.get_session)],
 ) -> models.Token:
 
+    # One lookup through both unique indexes; a username match wins over
+    # another user's email
+    is_username = models.DBUser.username == form_data.username
     result = await session.exec(
-        select(models.DBUser).where(models.DBUser.username == form_data.username)
+        select(models.DBUser)
+        .where(or_(is_username, models.DBUser.email == form_data.username))
+        .order_by(case((is_username, 0), else_=1))
+        .limit(1)
     )
 
     user = result.one_or_none()
 
-    if not user:
-        result = await session.exec(
-            select(models.DBUser).where(models.DBUser.email == form_data.username)
-        )
-        user = result.one_or_none()
-
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
 
+    # Hand the connection back to the pool while bcrypt runs, or a login
+    # storm holds every connection and stalls unrelated requests
+    await session.commit()
+
     if not await user.verify_password(form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -57,6 +62,9 @@ async def authentication(
     session.add(user)
     await session.commit()
     await session.refresh(user)
+    # last_login_date is part of the cached user
+    await models.user_cache.invalidate(user.id)
+    deps.principal_cache.pop(user.id)
 
     access_token_expires = datetime.timedelta(
         minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
@@ -1,45 +1,145 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
 
 from typing import Optional, Annotated
 
+from pydantic import SerializeAsAny
+from sqlalchemy.orm import selectinload
 from sqlmodel import Field, SQLModel, Session, select, func
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 import math
 
+from .. import cache
+from .. import config
+from .. import etags
 from .. import models
 from .. import deps
+from .. import projection
 
 router = APIRouter(prefix="/items")
 
+Embed = Annotated[set[str], Depends(deps.EmbedParameter(*models.ITEM_RELATIONS))]
+Fields = Annotated[Optional[tuple[str, ...]], Depends(deps.FieldsParameter(*models.Item.model_fields))]
+
 SIZE_PER_PAGE = 50
 
+settings = config.get_settings()
+
+# COUNT(*) scans the whole table, so page_count is served from here and may
+# lag behind by up to ITEM_COUNT_CACHE_SECONDS
+item_count = cache.TTLCache(maxsize=1, ttl=settings.ITEM_COUNT_CACHE_SECONDS)
+
+
+async def count_items(session: AsyncSession) -> int:
+    count = item_count.get("items")
+    if count is None:
+        count = (await session.exec(select(func.count(models.DBItem.id)))).one()
+        item_count.set("items", count)
+    return count
+
+
+async def item_version(session: AsyncSession, item_id: int) -> int | None:
+    # From the entity cache, else without loading the rest of the row
+    item = await models.item_cache.peek(item_id)
+    if item is not None:
+        return item.version
+    result = await session.exec(select(models.DBItem.version).where(models.DBItem.id == item_id))
+    return result.one_or_none()
+
 
 @router.get("")
 async def read_items(
+    response: Response,
     session: Annotated[AsyncSession, Depends(models.get_session)],
-    page: int = 1,
+    embed: Embed,
+    fields: Fields,
+    page: Annotated[int, Query(ge=1)] = 1,
+    after: Optional[int] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
 ) -> models.ItemList:
+    """Pass the returned ``next_after`` as ``after`` to get the next page;
+    that is an index range scan, so deep pages cost the same as the first.
+    ``page`` alone uses OFFSET and gets slower the deeper the page.
 
-    result = await session.exec(
-        select(models.DBItem).offset((page - 1) * SIZE_PER_PAGE).limit(SIZE_PER_PAGE)
-    )
+    The ETag covers the page count and the id and version of every item on
+    the page; with a matching ``If-None-Match`` only those are read. Pages
+    with ``embed`` have no ETag, it would not cover the nested relations;
+    each embedded relation costs one more query for the whole page.
+
+    ``fields`` selects only those columns, plus ``id``, and returns each
+    item as just those keys."""
+    if fields and embed:
+        raise HTTPException(status_code=422, detail="fields and embed cannot be combined")
+
+    def page_of(query):
+        query = query.order_by(models.DBItem.id).limit(SIZE_PER_PAGE)
+        if after is not None:
+            return query.where(models.DBItem.id > after)
+        return query.offset((page - 1) * SIZE_PER_PAGE)
+
+    page_count = math.ceil(await count_items(session) / SIZE_PER_PAGE)
+    if if_none_match and not embed:
+        result = await session.exec(page_of(select(models.DBItem.id, models.DBItem.version)))
+        etag = etags.make_etag("items", page_count, [tuple(row) for row in result.all()])
+        if etags.matches(if_none_match, etag):
+            return etags.not_modified(etag)
+
+    if fields:
+        result = await session.exec(
+            page_of(projection.select_fields(models.DBItem, projection.with_version(fields)))
+        )
+        items, versions = projection.versioned_records(fields, result.all())
+        etag = etags.make_etag(
+            "items", page_count, [(item["id"], version) for item, version in zip(items, versions)]
+        )
+        return projection.ProjectedResponse(
+            dict(
+                items=items,
+                page=page,
+                page_count=page_count,
+                size_per_page=SIZE_PER_PAGE,
+                next_after=items[-1]["id"] if len(items) == SIZE_PER_PAGE else None,
+            ),
+            headers={"ETag": etag},
+        )
+
+    query = page_of(select(models.DBItem))
+    if embed:
+        query = query.options(*[selectinload(getattr(models.DBItem, relation)) for relation in embed])
+    result = await session.exec(query)
     items = result.all()
+    next_after = items[-1].id if len(items) == SIZE_PER_PAGE else None
 
-    page_count = int(
-        math.ceil(
-            (await session.exec(select(func.count(models.DBItem.id)))).first()
-            / SIZE_PER_PAGE
+    if embed:
+        items = [models.embedded_item(item, embed) for item in items]
+    else:
+        response.headers["ETag"] = etags.make_etag(
+            "items", page_count, [(item.id, item.version) for item in items]
         )
-    )
 
-    print("page_count", page_count)
-    print("items", items)
-    return models.ItemList.from_orm(
-        dict(items=items, page_count=page_count, page=page, size_per_page=SIZE_PER_PAGE)
+    return models.ItemList.model_validate(
+        dict(
+            items=items,
+            page_count=page_count,
+            page=page,
+            size_per_page=SIZE_PER_PAGE,
+            next_after=next_after,
+        )
     )
 
 
+@router.get("/search")
+async def search_items(
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    limit: Annotated[int, Query(ge=1, le=models.MAX_SEARCH_LIMIT)] = models.SEARCH_LIMIT,
+) -> models.ItemSearchResults:
+    """Items whose name or description contains every word of ``q``, the
+    last one as a prefix; matches in the name rank first."""
+    items = await models.search_items(session, q, limit)
+    return models.ItemSearchResults(items=[models.Item.model_validate(item) for item in items])
+
+
 @router.post("")
 async def create_item(
     item: models.CreatedItem,
@@ -51,21 +151,117 @@ async def create_item(
     
     # Add it to the session and commit
     session.add(dbitem)
+    await session.flush()
+    await models.index_item(session, dbitem)
     await session.commit()
     await session.refresh(dbitem)
+    item_count.pop("items")
 
     # Return the created item
-    return models.Item.from_orm(dbitem)
+    return models.Item.model_validate(dbitem)
+
+
+async def check_merchants(session: AsyncSession, items: list[models.BaseItem]):
+    found = await models.existing_ids(
+        session, models.DBMerchant.id, {item.merchant_id for item in items}
+    )
+    errors = [
+        dict(loc=["body", "items", index, "merchant_id"], msg="Merchant not found")
+        for index, item in enumerate(items)
+        if item.merchant_id not in found
+    ]
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
+
+@router.post("/bulk")
+async def create_items_bulk(
+    bulk: models.ItemBulkCreate,
+    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+) -> models.ItemBulkResult:
+    """Create up to ``MAX_BULK_ITEMS`` items in one DB transaction; either
+    all of them are created or, if any record is invalid, none."""
+    await check_merchants(session, bulk.items)
+
+    ids = await models.insert_items(session, bulk.items)
+    await models.index_items(session, ids)
+    await session.commit()
+    item_count.pop("items")
+
+    return models.ItemBulkResult(ids=ids)
+
+
+@router.put("/bulk")
+async def update_items_bulk(
+    bulk: models.ItemBulkUpdate,
+    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+) -> models.ItemBulkResult:
+    """Replace up to ``MAX_BULK_ITEMS`` existing items, by id, in one DB
+    transaction; all of them or none."""
+    ids = [item.id for item in bulk.items]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=422, detail="Duplicate item ids")
+    await check_merchants(session, bulk.items)
+
+    # Missing ids come from the write itself, which never inserts; leaving
+    # the session uncommitted rolls the rows already written back
+    missing = set(ids) - await models.update_items(session, bulk.items)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Items not found: {sorted(missing)}")
+    await models.index_items(session, ids)
+    await session.commit()
+    await models.item_cache.invalidate(*ids)
+
+    return models.ItemBulkResult(ids=ids)
 
 
 
 @router.get("/{item_id}")
 async def read_item(
-    item_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]
-) -> models.Item:
-    db_item = await session.get(models.DBItem, item_id)
-    if db_item:
-        return models.Item.from_orm(db_item)
+    item_id: int,
+    response: Response,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    embed: Embed,
+    fields: Fields,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+) -> SerializeAsAny[models.Item]:
+    if fields and embed:
+        raise HTTPException(status_code=422, detail="fields and embed cannot be combined")
+    if embed:
+        # Not cached and without an ETag, neither would cover the relations
+        options = [selectinload(getattr(models.DBItem, relation)) for relation in embed]
+        db_item = await session.get(models.DBItem, item_id, options=options)
+        if not db_item:
+            raise HTTPException(status_code=404, detail="Item not found")
+        return models.embedded_item(db_item, embed)
+
+    if if_none_match:
+        version = await item_version(session, item_id)
+        etag = etags.make_etag("item", item_id, version)
+        if version is not None and etags.matches(if_none_match, etag):
+            return etags.not_modified(etag)
+
+    if fields:
+        result = await session.exec(
+            projection.select_fields(models.DBItem, projection.with_version(fields))
+            .where(models.DBItem.id == item_id)
+        )
+        items, versions = projection.versioned_records(fields, result.all())
+        if not items:
+            raise HTTPException(status_code=404, detail="Item not found")
+        etag = etags.make_etag("item", item_id, versions[0])
+        return projection.ProjectedResponse(items[0], headers={"ETag": etag})
+
+    async def load() -> models.Item | None:
+        db_item = await session.get(models.DBItem, item_id)
+        return models.Item.model_validate(db_item) if db_item else None
+
+    item = await models.item_cache.fetch(item_id, load)
+    if item:
+        response.headers["ETag"] = etags.make_etag("item", item.id, item.version)
+        return item
 
     raise HTTPException(status_code=404, detail="Item not found")
 
@@ -77,15 +273,18 @@ async def update_item(
     current_user: Annotated[models.User, Depends(deps.get_current_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.Item:
-    print("update_item", item)
     data = item.model_dump()
     db_item = await session.get(models.DBItem, item_id)
     db_item.sqlmodel_update(data)
+    # Incremented by the UPDATE itself, so concurrent writes never share one
+    db_item.version = models.DBItem.version + 1
     session.add(db_item)
+    await models.index_item(session, db_item)
     await session.commit()
     await session.refresh(db_item)
+    await models.item_cache.invalidate(item_id)
 
-    return models.Item.from_orm(db_item)
+    return models.Item.model_validate(db_item)
 
 
 @router.delete("/{item_id}")
@@ -95,7 +294,10 @@ async def delete_item(
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> dict:
     db_item = await session.get(models.DBItem, item_id)
+    await models.unindex_item(session, item_id)
     await session.delete(db_item)
     await session.commit()
+    item_count.pop("items")
+    await models.item_cache.invalidate(item_id)
 
     return dict(message="delete success")
\ No newline at end of file
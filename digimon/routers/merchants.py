@@ -1,16 +1,34 @@
-from fastapi import APIRouter, HTTPException, Depends
+import json
 
-from typing import Optional, Annotated
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
 
+from typing import Optional, Annotated, Literal
+
+from pydantic import SerializeAsAny
+from sqlalchemy.orm import selectinload
 from sqlmodel import Field, SQLModel, create_engine, Session, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from .. import config
+from .. import etags
 from .. import models
 from .. import deps
+from .. import projection
 
 
 router = APIRouter(prefix="/merchants")
 
+Embed = Annotated[set[str], Depends(deps.EmbedParameter(*models.MERCHANT_RELATIONS))]
+Fields = Annotated[Optional[tuple[str, ...]], Depends(deps.FieldsParameter(*models.Merchant.model_fields))]
+
+SIZE_PER_PAGE = 50
+MAX_SIZE_PER_PAGE = 500
+
+MERCHANT_COLUMNS = ("id", "name", "description", "tax_id", "user_id", "version")
+
+settings = config.get_settings()
+
 
 @router.post("")
 async def create_merchant(
@@ -19,33 +37,161 @@ async def create_merchant(
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.Merchant:
     dbmerchant = models.DBMerchant.model_validate(merchant)
-    dbmerchant.user = current_user
+    dbmerchant.user_id = current_user.id
     session.add(dbmerchant)
+    await session.flush()
+    await models.index_merchant(session, dbmerchant)
     await session.commit()
     await session.refresh(dbmerchant)
 
     return models.Merchant.model_validate(dbmerchant)
 
 
-@router.get("")
+async def export_merchants(chunks):
+    async for rows in chunks:
+        lines = [json.dumps(dict(zip(MERCHANT_COLUMNS, row))) for row in rows]
+        yield ("\n".join(lines) + "\n").encode()
+
+
+@router.get("", response_model=models.MerchantList)
 async def read_merchants(
-    session: Annotated[AsyncSession, Depends(models.get_session)]
-) -> models.MerchantList:
-    result = await session.exec(select(models.DBMerchant))
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    embed: Embed,
+    fields: Fields,
+    page: Annotated[int, Query(ge=1)] = 1,
+    after: Optional[int] = None,
+    size_per_page: Annotated[int, Query(ge=1, le=MAX_SIZE_PER_PAGE)] = SIZE_PER_PAGE,
+    format: Literal["json", "ndjson"] = "json",
+):
+    """One page of merchants ordered by id. Pass the returned ``next_after``
+    as ``after`` to get the next page; ``page`` alone uses OFFSET.
+
+    ``format=ndjson`` streams every merchant instead, one per line, read
+    from a server-side cursor chunk by chunk; it ignores ``embed``.
+
+    ``fields`` selects only those columns, plus ``id``, for each merchant.
+    """
+    if format == "ndjson":
+        query = select(*[getattr(models.DBMerchant, column) for column in MERCHANT_COLUMNS])
+        if after is not None:
+            query = query.where(models.DBMerchant.id > after)
+        chunks = models.stream_rows(
+            query.order_by(models.DBMerchant.id), settings.EXPORT_CHUNK_SIZE
+        )
+        return StreamingResponse(export_merchants(chunks), media_type="application/x-ndjson")
+
+    if fields and embed:
+        raise HTTPException(status_code=422, detail="fields and embed cannot be combined")
+
+    columns = projection.select_fields(models.DBMerchant, fields) if fields else select(models.DBMerchant)
+    query = columns.order_by(models.DBMerchant.id).limit(size_per_page)
+    if after is not None:
+        query = query.where(models.DBMerchant.id > after)
+    else:
+        query = query.offset((page - 1) * size_per_page)
+
+    if fields:
+        result = await session.exec(query)
+        merchants = projection.records(fields, result.all())
+        return projection.ProjectedResponse(
+            dict(
+                merchants=merchants,
+                page=page,
+                page_size=len(merchants),
+                size_per_page=size_per_page,
+                next_after=merchants[-1]["id"] if len(merchants) == size_per_page else None,
+            )
+        )
+
+    if embed:
+        query = query.options(*[selectinload(getattr(models.DBMerchant, relation)) for relation in embed])
+
+    result = await session.exec(query)
     merchants = result.all()
+    next_after = merchants[-1].id if len(merchants) == size_per_page else None
+    if embed:
+        merchants = [models.embedded_merchant(merchant, embed) for merchant in merchants]
 
     return models.MerchantList.model_validate(
-        dict(merchants=merchants, page_size=0, page=0, size_per_page=0)
+        dict(
+            merchants=merchants,
+            page=page,
+            page_size=len(merchants),
+            size_per_page=size_per_page,
+            next_after=next_after,
+        )
     )
 
 
+@router.get("/search")
+async def search_merchants(
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    limit: Annotated[int, Query(ge=1, le=models.MAX_SEARCH_LIMIT)] = models.SEARCH_LIMIT,
+) -> models.MerchantSearchResults:
+    """Merchants whose name contains every word of ``q``, the last one as
+    a prefix, best match first."""
+    merchants = await models.search_merchants(session, q, limit)
+    return models.MerchantSearchResults(
+        merchants=[models.Merchant.model_validate(merchant) for merchant in merchants]
+    )
+
+
+async def merchant_version(session: AsyncSession, merchant_id: int) -> int | None:
+    # From the entity cache, else without loading the rest of the row
+    merchant = await models.merchant_cache.peek(merchant_id)
+    if merchant is not None:
+        return merchant.version
+    result = await session.exec(
+        select(models.DBMerchant.version).where(models.DBMerchant.id == merchant_id)
+    )
+    return result.one_or_none()
+
+
 @router.get("/{merchant_id}")
 async def read_merchant(
-    merchant_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]
-) -> models.Merchant:
-    db_merchant = await session.get(models.DBMerchant, merchant_id)
-    if db_merchant:
-        return models.Merchant.model_validate(db_merchant)
+    merchant_id: int,
+    response: Response,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    embed: Embed,
+    fields: Fields,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+) -> SerializeAsAny[models.Merchant]:
+    if fields and embed:
+        raise HTTPException(status_code=422, detail="fields and embed cannot be combined")
+    if embed:
+        # Not cached and without an ETag, neither would cover the relations
+        options = [selectinload(getattr(models.DBMerchant, relation)) for relation in embed]
+        db_merchant = await session.get(models.DBMerchant, merchant_id, options=options)
+        if not db_merchant:
+            raise HTTPException(status_code=404, detail="Merchant not found")
+        return models.embedded_merchant(db_merchant, embed)
+
+    if if_none_match:
+        version = await merchant_version(session, merchant_id)
+        etag = etags.make_etag("merchant", merchant_id, version)
+        if version is not None and etags.matches(if_none_match, etag):
+            return etags.not_modified(etag)
+
+    if fields:
+        result = await session.exec(
+            projection.select_fields(models.DBMerchant, projection.with_version(fields))
+            .where(models.DBMerchant.id == merchant_id)
+        )
+        merchants, versions = projection.versioned_records(fields, result.all())
+        if not merchants:
+            raise HTTPException(status_code=404, detail="Merchant not found")
+        etag = etags.make_etag("merchant", merchant_id, versions[0])
+        return projection.ProjectedResponse(merchants[0], headers={"ETag": etag})
+
+    async def load() -> models.Merchant | None:
+        db_merchant = await session.get(models.DBMerchant, merchant_id)
+        return models.Merchant.model_validate(db_merchant) if db_merchant else None
+
+    merchant = await models.merchant_cache.fetch(merchant_id, load)
+    if merchant:
+        response.headers["ETag"] = etags.make_etag("merchant", merchant.id, merchant.version)
+        return merchant
     raise HTTPException(status_code=404, detail="Merchant not found")
 
 
@@ -59,9 +205,13 @@ async def update_merchant(
     data = merchant.model_dump()
     db_merchant = await session.get(models.DBMerchant, merchant_id)
     db_merchant.sqlmodel_update(data)
+    # Incremented by the UPDATE itself, so concurrent writes never share one
+    db_merchant.version = models.DBMerchant.version + 1
     session.add(db_merchant)
+    await models.index_merchant(session, db_merchant)
     await session.commit()
     await session.refresh(db_merchant)
+    await models.merchant_cache.invalidate(merchant_id)
 
     return models.Merchant.model_validate(db_merchant)
 
@@ -73,7 +223,9 @@ async def delete_merchant(
     current_user: Annotated[models.User, Depends(deps.get_current_user)],
 ) -> dict:
     db_merchant = await session.get(models.DBMerchant, merchant_id)
+    await models.unindex_merchant(session, merchant_id)
     await session.delete(db_merchant)
     await session.commit()
+    await models.merchant_cache.invalidate(merchant_id)
 
     return dict(message="delete success")
\ No newline at end of file
@@ -0,0 +1,42 @@
+# digimon/routers/stats.py
+
+from fastapi import APIRouter, Depends
+from typing import Annotated
+from .. import models, deps, idempotency, passwords, scheduler
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+
+@router.get("/write-scheduler")
+async def read_write_scheduler_stats(
+    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+) -> dict:
+    return scheduler.write_scheduler.stats()
+
+
+@router.get("/idempotency")
+async def read_idempotency_stats(
+    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+) -> dict:
+    return idempotency.stats()
+
+
+@router.get("/entity-cache")
+async def read_entity_cache_stats(
+    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+) -> dict:
+    return models.entity_cache_stats()
+
+
+@router.get("/password-hasher")
+async def read_password_hasher_stats(
+    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+) -> dict:
+    return passwords.password_hasher.stats()
+
+
+@router.get("/principal-cache")
+async def read_principal_cache_stats(
+    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+) -> dict:
+    return deps.principal_cache.stats()
@@ -1,42 +1,249 @@
 # digimon/routers/transactions.py
 
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Annotated
+import csv
+import datetime
+import io
+import json
+import pathlib
+import uuid
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import Annotated, Literal, Optional
+from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
-from .. import models, deps
+from .. import archive_transactions, config, models, deps, importer, projection, scheduler
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
+settings = config.get_settings()
+
+Fields = Annotated[
+    Optional[tuple[str, ...]], Depends(deps.FieldsParameter(*models.TransactionRead.model_fields))
+]
+
+BATCH_ERRORS = {
+    "wallet_not_found": HTTPException(status_code=404, detail="Wallet not found"),
+    "insufficient_funds": HTTPException(status_code=400, detail="Insufficient funds"),
+}
+
+
+async def raise_balance_error(session: AsyncSession, wallet_id: int):
+    # A conditional balance update matched no row: tell apart a missing
+    # wallet from one without enough funds
+    if await session.get(models.DBWallet, wallet_id) is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    raise HTTPException(status_code=400, detail="Insufficient funds")
+
+
+async def change_balance(
+    session: AsyncSession, wallet_id: int, delta: int, check_funds: bool = False
+) -> bool:
+    """Apply ``delta`` to a wallet, in place or, in ledger mode, as a new
+    ledger entry; ``False`` if the wallet is missing or short of funds."""
+    if settings.LEDGER_MODE:
+        entry = await models.append_ledger_entry(session, wallet_id, delta, check_funds)
+        return entry is not None
+    balance = await models.apply_balance_delta(session, wallet_id, delta, check_funds)
+    return balance is not None
+
+
 @router.post("", response_model=models.TransactionRead)
 async def create_transaction(
     transaction: models.TransactionCreate,
     current_user: Annotated[models.User, Depends(deps.get_current_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ):
-    db_wallet = await session.get(models.DBWallet, transaction.wallet_id)
-    if not db_wallet:
-        raise HTTPException(status_code=404, detail="Wallet not found")
+    if settings.WRITE_SCHEDULER_ENABLED:
+        # Coalesced with other writes to the same wallet into one commit,
+        # as ledger entries in ledger mode.
+        # Hand the request's connection back to the pool first, the
+        # scheduler needs one of its own to flush
+        await session.close()
+        status, created = await scheduler.write_scheduler.submit(transaction)
+        if status in BATCH_ERRORS:
+            raise BATCH_ERRORS[status]
+        return created
 
-    if transaction.type == 'debit':
-        if db_wallet.balance < transaction.amount:
-            raise HTTPException(status_code=400, detail="Insufficient funds")
-        db_wallet.balance -= transaction.amount
-    else:
-        db_wallet.balance += transaction.amount
+    changed = await change_balance(
+        session,
+        transaction.wallet_id,
+        models.balance_delta(transaction.type, transaction.amount),
+        check_funds=transaction.type == 'debit',
+    )
+    if not changed:
+        await raise_balance_error(session, transaction.wallet_id)
 
     db_transaction = models.DBTransaction(**transaction.model_dump())
     session.add(db_transaction)
-    session.add(db_wallet)
+    await models.update_rollups(session, [db_transaction])
     await session.commit()
     await session.refresh(db_transaction)
+    await models.wallet_cache.invalidate(transaction.wallet_id)
     return models.TransactionRead.model_validate(db_transaction)
 
+@router.post("/batch", response_model=models.TransactionBatchResult)
+async def create_transactions_batch(
+    batch: models.TransactionBatch,
+    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+) -> models.TransactionBatchResult:
+    outcomes = await models.apply_transactions(session, batch.transactions, ledger=settings.LEDGER_MODE)
+    await models.update_rollups(
+        session, [created for _, created in outcomes if created is not None]
+    )
+    await session.commit()
+    await models.wallet_cache.invalidate(
+        *{transaction.wallet_id for transaction in batch.transactions}
+    )
+
+    results = [
+        models.TransactionBatchItem(index=index, status=status, transaction=transaction)
+        for index, (status, transaction) in enumerate(outcomes)
+    ]
+    succeeded = sum(1 for result in results if result.transaction is not None)
+
+    return models.TransactionBatchResult(
+        results=results,
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+    )
+
+EXPORT_COLUMNS = ("id", "wallet_id", "amount", "type", "description", "transfer_id", "created_at")
+
+async def export_ndjson(chunks):
+    async for rows in chunks:
+        lines = []
+        for row in rows:
+            record = dict(zip(EXPORT_COLUMNS, row))
+            record["created_at"] = record["created_at"].isoformat()
+            lines.append(json.dumps(record))
+        yield ("\n".join(lines) + "\n").encode()
+
+async def export_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+@router.get("/export")
+async def export_transactions(
+    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    format: Literal["ndjson", "csv"] = "ndjson",
+    wallet_id: Optional[int] = None,
+    created_from: Annotated[Optional[datetime.datetime], Query(alias="from")] = None,
+    created_to: Annotated[Optional[datetime.datetime], Query(alias="to")] = None,
+    chunk_size: Annotated[Optional[int], Query(ge=1, le=100_000)] = None,
+) -> StreamingResponse:
+    """Stream every matching transaction as NDJSON or CSV.
+
+    Rows are read from a server-side cursor one chunk at a time, and the
+    next chunk is only fetched once the client has taken the previous one.
+    Archived months are not included; their archive files hold them in the
+    same NDJSON format.
+    """
+    query = select(*[getattr(models.DBTransaction, column) for column in EXPORT_COLUMNS])
+    if wallet_id is not None:
+        query = query.where(models.DBTransaction.wallet_id == wallet_id)
+    if created_from is not None:
+        query = query.where(models.DBTransaction.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(models.DBTransaction.created_at < created_to)
+
+    chunks = models.stream_rows(
+        query.order_by(models.DBTransaction.id),
+        chunk_size or settings.EXPORT_CHUNK_SIZE,
+    )
+    if format == "csv":
+        return StreamingResponse(export_csv(chunks), media_type="text/csv")
+    return StreamingResponse(export_ndjson(chunks), media_type="application/x-ndjson")
+
+def rejects_path(job: str) -> pathlib.Path:
+    return pathlib.Path(settings.IMPORT_DIR) / f"{job}.rejects.ndjson"
+
+@router.post("/import", response_model=models.ImportSummary)
+async def import_transactions(
+    request: Request,
+    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    format: Literal["ndjson", "csv"] = "ndjson",
+    job: Annotated[Optional[str], Query(pattern=r"^[\w.-]+$", max_length=100)] = None,
+) -> models.ImportSummary:
+    """Bulk import historic transactions from the request body.
+
+    Send the same ``job`` again to resume an interrupted import after its
+    last committed chunk. The rows it rejects are served by
+    ``GET /transactions/import/{job_id}/rejects``.
+    """
+    job = job or f"import-{uuid.uuid4().hex}"
+    path = rejects_path(job)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with path.open("a", encoding="utf-8") as rejects:
+        summary = await importer.import_transactions(
+            session,
+            importer.stream_lines(request.stream()),
+            format,
+            job,
+            rejects,
+            settings.IMPORT_CHUNK_SIZE,
+        )
+    return summary
+
+@router.get("/import/{job_id}/rejects")
+async def read_import_rejects(
+    job_id: int,
+    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+) -> Response:
+    """The rows an import job rejected so far, as NDJSON of ``line`` and
+    ``error``."""
+    job = await session.get(models.DBImportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    path = rejects_path(job.name)
+    if not path.exists():
+        return Response(media_type="application/x-ndjson")
+    return FileResponse(path, media_type="application/x-ndjson")
+
 @router.get("/{transaction_id}", response_model=models.TransactionRead)
-async def read_transaction(transaction_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]) -> models.TransactionRead:
-    db_transaction = await session.get(models.DBTransaction, transaction_id)
-    if not db_transaction:
+async def read_transaction(
+    transaction_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    fields: Fields,
+) -> models.TransactionRead:
+    if fields:
+        result = await session.exec(
+            projection.select_fields(models.DBTransaction, fields)
+            .where(models.DBTransaction.id == transaction_id)
+        )
+        transactions = projection.records(fields, result.all())
+        if transactions:
+            return projection.ProjectedResponse(transactions[0])
+    else:
+        db_transaction = await session.get(models.DBTransaction, transaction_id)
+        if db_transaction:
+            return models.TransactionRead.model_validate(db_transaction)
+
+    # Not in the hot table: the slow path through the archive files
+    archived = await archive_transactions.read_archived_transaction(session, transaction_id)
+    if not archived:
         raise HTTPException(status_code=404, detail="Transaction not found")
-    return models.TransactionRead.model_validate(db_transaction)
+    if fields:
+        return projection.ProjectedResponse(archived.model_dump(mode="json", include=set(fields)))
+    return archived
+
+
+async def get_writable_transaction(session: AsyncSession, transaction_id: int) -> models.DBTransaction:
+    db_transaction = await session.get(models.DBTransaction, transaction_id)
+    if db_transaction:
+        return db_transaction
+    if await archive_transactions.read_archived_transaction(session, transaction_id):
+        raise HTTPException(status_code=409, detail="Transaction is archived")
+    raise HTTPException(status_code=404, detail="Transaction not found")
 
 @router.put("/{transaction_id}", response_model=models.TransactionRead)
 async def update_transaction(
@@ -45,36 +252,47 @@ async def update_transaction(
     current_user: Annotated[models.User, Depends(deps.get_current_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.TransactionRead:
-    db_transaction = await session.get(models.DBTransaction, transaction_id)
-    if not db_transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
+    db_transaction = await get_writable_transaction(session, transaction_id)
+    wallet_ids = {db_transaction.wallet_id, transaction_update.wallet_id}
 
-    db_wallet = await session.get(models.DBWallet, db_transaction.wallet_id)
-    if not db_wallet:
-        raise HTTPException(status_code=404, detail="Wallet not found")
+    # Revert the original transaction impact and apply the new one
+    revert = -models.balance_delta(db_transaction.type, db_transaction.amount)
+    change = models.balance_delta(transaction_update.type, transaction_update.amount)
+    check_funds = transaction_update.type == 'debit'
 
-    # Revert the original transaction impact
-    if db_transaction.type == 'debit':
-        db_wallet.balance += db_transaction.amount
+    if transaction_update.wallet_id == db_transaction.wallet_id:
+        changed = await change_balance(
+            session, db_transaction.wallet_id, revert + change, check_funds=check_funds
+        )
+        if not changed:
+            await raise_balance_error(session, db_transaction.wallet_id)
     else:
-        db_wallet.balance -= db_transaction.amount
+        changed = await change_balance(session, db_transaction.wallet_id, revert)
+        if not changed:
+            raise HTTPException(status_code=404, detail="Wallet not found")
 
-    # Apply the new transaction update
-    if transaction_update.type == 'debit':
-        if db_wallet.balance < transaction_update.amount:
-            raise HTTPException(status_code=400, detail="Insufficient funds")
-        db_wallet.balance -= transaction_update.amount
-    else:
-        db_wallet.balance += transaction_update.amount
+        changed = await change_balance(
+            session, transaction_update.wallet_id, change, check_funds=check_funds
+        )
+        if not changed:
+            await raise_balance_error(session, transaction_update.wallet_id)
+
+    # Move the transaction between the daily rollups with the same change
+    await models.update_rollups(session, [db_transaction], reverse=True)
+    for wallet_id in wallet_ids:
+        await models.invalidate_checkpoints(
+            session, wallet_id, db_transaction.created_at, db_transaction.id
+        )
 
     # Update the transaction
     for key, value in transaction_update.model_dump().items():
         setattr(db_transaction, key, value)
 
     session.add(db_transaction)
-    session.add(db_wallet)
+    await models.update_rollups(session, [db_transaction])
     await session.commit()
     await session.refresh(db_transaction)
+    await models.wallet_cache.invalidate(*wallet_ids)
 
     return models.TransactionRead.model_validate(db_transaction)
 
@@ -84,22 +302,23 @@ async def delete_transaction(
     current_user: Annotated[models.User, Depends(deps.get_current_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> dict:
-    db_transaction = await session.get(models.DBTransaction, transaction_id)
-    if not db_transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
-
-    db_wallet = await session.get(models.DBWallet, db_transaction.wallet_id)
-    if not db_wallet:
-        raise HTTPException(status_code=404, detail="Wallet not found")
+    db_transaction = await get_writable_transaction(session, transaction_id)
 
     # Revert the transaction impact on the wallet
-    if db_transaction.type == 'debit':
-        db_wallet.balance += db_transaction.amount
-    else:
-        db_wallet.balance -= db_transaction.amount
+    changed = await change_balance(
+        session,
+        db_transaction.wallet_id,
+        -models.balance_delta(db_transaction.type, db_transaction.amount),
+    )
+    if not changed:
+        raise HTTPException(status_code=404, detail="Wallet not found")
 
+    await models.update_rollups(session, [db_transaction], reverse=True)
+    await models.invalidate_checkpoints(
+        session, db_transaction.wallet_id, db_transaction.created_at, db_transaction.id
+    )
     await session.delete(db_transaction)
-    session.add(db_wallet)
     await session.commit()
+    await models.wallet_cache.invalidate(db_transaction.wallet_id)
 
     return {"message": "Transaction deleted successfully"}
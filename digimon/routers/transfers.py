@@ -0,0 +1,84 @@
+# digimon/routers/transfers.py
+
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Annotated
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .. import archive_transactions, models, deps
+from .transactions import change_balance, raise_balance_error
+
+router = APIRouter(prefix="/transfers", tags=["transfers"])
+
+@router.post("", response_model=models.TransferRead)
+async def create_transfer(
+    transfer: models.TransferCreate,
+    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+) -> models.TransferRead:
+    if transfer.from_wallet_id == transfer.to_wallet_id:
+        raise HTTPException(status_code=400, detail="Cannot transfer to the same wallet")
+
+    # Touch the wallet rows lowest id first so that two opposing transfers
+    # always lock them in the same order and cannot deadlock
+    for wallet_id in sorted((transfer.from_wallet_id, transfer.to_wallet_id)):
+        if wallet_id == transfer.from_wallet_id:
+            changed = await change_balance(session, wallet_id, -transfer.amount, check_funds=True)
+            if not changed:
+                await raise_balance_error(session, wallet_id)
+        else:
+            changed = await change_balance(session, wallet_id, transfer.amount)
+            if not changed:
+                raise HTTPException(status_code=404, detail="Wallet not found")
+
+    db_transfer = models.DBTransfer(**transfer.model_dump())
+    session.add(db_transfer)
+    await session.flush()
+
+    debit = models.DBTransaction(
+        wallet_id=transfer.from_wallet_id,
+        amount=transfer.amount,
+        type="debit",
+        description=transfer.description,
+        transfer_id=db_transfer.id,
+    )
+    credit = models.DBTransaction(
+        wallet_id=transfer.to_wallet_id,
+        amount=transfer.amount,
+        type="credit",
+        description=transfer.description,
+        transfer_id=db_transfer.id,
+    )
+    session.add_all([debit, credit])
+    await models.update_rollups(session, [debit, credit])
+    await session.commit()
+    await models.wallet_cache.invalidate(transfer.from_wallet_id, transfer.to_wallet_id)
+
+    return models.TransferRead(
+        **db_transfer.model_dump(),
+        debit_transaction_id=debit.id,
+        credit_transaction_id=credit.id,
+    )
+
+@router.get("/{transfer_id}", response_model=models.TransferRead)
+async def read_transfer(
+    transfer_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+) -> models.TransferRead:
+    db_transfer = await session.get(models.DBTransfer, transfer_id)
+    if not db_transfer:
+        raise HTTPException(status_code=404, detail="Transfer not found")
+
+    result = await session.exec(
+        models.select(models.DBTransaction.type, models.DBTransaction.id).where(
+            models.DBTransaction.transfer_id == transfer_id
+        )
+    )
+    legs = dict(result.all())
+    if len(legs) < 2:
+        # Archived with the month they were created in
+        archived = await archive_transactions.read_archived_transfer_legs(session, transfer_id)
+        legs.update((leg.type, leg.id) for leg in archived if leg.type not in legs)
+    return models.TransferRead(
+        **db_transfer.model_dump(),
+        debit_transaction_id=legs.get("debit"),
+        credit_transaction_id=legs.get("credit"),
+    )
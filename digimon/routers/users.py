@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlmodel import select
+from sqlalchemy.exc import IntegrityError
 from typing import Annotated
 from .. import deps
 from .. import models
@@ -18,7 +18,11 @@ async def get_user(
     session: Annotated[AsyncSession, Depends(models.get_session)],
     current_user: models.User = Depends(deps.get_current_user),
 ) -> models.User:
-    user = await session.get(models.DBUser, user_id)
+    async def load() -> models.User | None:
+        user = await session.get(models.DBUser, user_id)
+        return models.User.model_validate(user) if user else None
+
+    user = await models.user_cache.fetch(user_id, load)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -32,22 +36,18 @@ async def create_user(
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.User:
 
-    result = await session.exec(
-        select(models.DBUser).where(models.DBUser.username == user_info.username)
-    )
-
-    user = result.one_or_none()
-
-    if user:
+    user = models.DBUser.model_validate(user_info)
+    await user.set_password(user_info.password)
+    session.add(user)
+    # The unique indexes reject a taken username or email, no lookup first
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
-            detail="This username already exists.",
+            detail="This username or email already exists.",
         )
-
-    user = models.DBUser.from_orm(user_info)
-    await user.set_password(user_info.password)
-    session.add(user)
-    await session.commit()
     await session.refresh(user)  # Refresh to get the updated instance from the DB
 
     return user
@@ -68,6 +68,9 @@ async def change_password(
             detail="User not found",
         )
 
+    # Not holding a pooled connection while bcrypt runs
+    await session.commit()
+
     if not await user.verify_password(password_update.current_password):
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
@@ -77,6 +80,8 @@ async def change_password(
     await user.set_password(password_update.new_password)
     session.add(user)
     await session.commit()
+    await models.user_cache.invalidate(user_id)
+    deps.principal_cache.pop(user_id)
 
     return {"detail": "Password updated successfully"}
 
@@ -98,8 +103,17 @@ async def update_user(
 
     db_user.sqlmodel_update(user_update)
     session.add(db_user)
-    await session.commit()
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This username or email already exists.",
+        )
     await session.refresh(db_user)
+    await models.user_cache.invalidate(user_id)
+    deps.principal_cache.pop(user_id)
 
     return db_user
 
@@ -120,5 +134,7 @@ async def delete_user(
 
     await session.delete(user)
     await session.commit()
+    await models.user_cache.invalidate(user_id)
+    deps.principal_cache.pop(user_id)
 
     return {"detail": "User deleted successfully"}
@@ -1,12 +1,21 @@
 # digimon/routers/wallets.py
 
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Annotated
+import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Annotated, Optional
+from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
-from .. import models, deps
+from .. import models, deps, projection
 
 router = APIRouter(prefix="/wallets", tags=["wallets"])
 
+TransactionFields = Annotated[
+    Optional[tuple[str, ...]], Depends(deps.FieldsParameter(*models.TransactionRead.model_fields))
+]
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
 @router.post("", response_model=models.WalletRead)
 async def create_wallet(
     wallet: models.WalletCreate,
@@ -27,10 +36,89 @@ async def create_wallet(
 
 @router.get("/{wallet_id}", response_model=models.WalletRead)
 async def read_wallet(wallet_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]) -> models.WalletRead:
-    db_wallet = await session.get(models.DBWallet, wallet_id)
-    if not db_wallet:
+    wallet = await models.wallet_cache.fetch(
+        wallet_id, lambda: models.read_wallet(session, wallet_id)
+    )
+    if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
-    return models.WalletRead.model_validate(db_wallet)
+    return wallet
+
+@router.get("/{wallet_id}/transactions", response_model=models.TransactionPage)
+async def read_wallet_transactions(
+    wallet_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    fields: TransactionFields,
+    cursor: Optional[int] = None,
+    limit: Annotated[int, Query(ge=1, le=HISTORY_MAX_PAGE_SIZE)] = HISTORY_PAGE_SIZE,
+    type: Optional[str] = None,
+    created_from: Annotated[Optional[datetime.datetime], Query(alias="from")] = None,
+    created_to: Annotated[Optional[datetime.datetime], Query(alias="to")] = None,
+) -> models.TransactionPage:
+    """Newest first. Pass the returned ``next_cursor`` as ``cursor`` to get
+    the next page; every page is an index range scan on (wallet_id, id), so
+    deep pages cost the same as the first one.
+
+    ``fields`` selects only those columns, plus ``id``, for each transaction."""
+    if await session.get(models.DBWallet, wallet_id) is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+
+    columns = projection.select_fields(models.DBTransaction, fields) if fields else select(models.DBTransaction)
+    query = columns.where(models.DBTransaction.wallet_id == wallet_id)
+    if cursor is not None:
+        query = query.where(models.DBTransaction.id < cursor)
+    if type is not None:
+        query = query.where(models.DBTransaction.type == type)
+    if created_from is not None:
+        query = query.where(models.DBTransaction.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(models.DBTransaction.created_at < created_to)
+
+    result = await session.exec(query.order_by(models.DBTransaction.id.desc()).limit(limit))
+    transactions = result.all()
+
+    if fields:
+        transactions = projection.records(fields, transactions)
+        next_cursor = transactions[-1]["id"] if len(transactions) == limit else None
+        return projection.ProjectedResponse(dict(transactions=transactions, next_cursor=next_cursor))
+
+    next_cursor = transactions[-1].id if len(transactions) == limit else None
+    return models.TransactionPage(
+        transactions=[models.TransactionRead.model_validate(t) for t in transactions],
+        next_cursor=next_cursor,
+    )
+
+@router.get("/{wallet_id}/balance", response_model=models.WalletBalance)
+async def read_wallet_balance(
+    wallet_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    at: Optional[datetime.datetime] = None,
+) -> models.WalletBalance:
+    wallet = await models.read_wallet(session, wallet_id)
+    if not wallet:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+
+    if at is None:
+        return models.WalletBalance(
+            wallet_id=wallet_id, balance=wallet.balance, at=datetime.datetime.now()
+        )
+    at = models.stored_datetime(at)
+    horizon = await models.archive_horizon(session)
+    if horizon is not None and at < horizon:
+        raise HTTPException(status_code=400, detail=f"Transactions before {horizon.date()} are archived")
+    return await models.balance_at(session, wallet_id, at, since=horizon)
+
+@router.get("/{wallet_id}/summary", response_model=models.WalletSummary)
+async def read_wallet_summary(
+    wallet_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    day_from: Annotated[Optional[datetime.date], Query(alias="from")] = None,
+    day_to: Annotated[Optional[datetime.date], Query(alias="to")] = None,
+) -> models.WalletSummary:
+    """Daily credit and debit totals from ``from`` up to, not including,
+    ``to``; read from the rollups only, never from the transactions."""
+    if await session.get(models.DBWallet, wallet_id) is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    return await models.read_summary(session, wallet_id, day_from, day_to)
 
 @router.put("/{wallet_id}", response_model=models.WalletRead)
 async def update_wallet(
@@ -43,12 +131,16 @@ async def update_wallet(
         raise HTTPException(status_code=404, detail="Wallet not found")
 
     if wallet_update.balance is not None:
-        db_wallet.balance = wallet_update.balance
+        # Uncompacted ledger entries still apply on top of the stored balance
+        pending = await session.exec(
+            select(models.pending_delta()).where(models.DBWallet.id == wallet_id)
+        )
+        db_wallet.balance = wallet_update.balance - pending.one()
 
     session.add(db_wallet)
     await session.commit()
-    await session.refresh(db_wallet)
-    return models.WalletRead.model_validate(db_wallet)
+    await models.wallet_cache.invalidate(wallet_id)
+    return await models.read_wallet(session, wallet_id)
 
 @router.delete("/{wallet_id}", response_model=dict)
 async def delete_wallet(
@@ -61,4 +153,5 @@ async def delete_wallet(
 
     await session.delete(db_wallet)
     await session.commit()
+    await models.wallet_cache.invalidate(wallet_id)
     return {"detail": "Wallet deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,122 @@
+# digimon/scheduler.py
+
+import asyncio
+import logging
+from collections import defaultdict, deque
+
+from . import config
+from . import models
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+
+class WriteScheduler:
+    """Group commit of transaction writes per wallet.
+
+    Writes submitted for the same wallet are queued, and whatever arrives
+    within ``window`` seconds (or until ``max_batch_size`` entries are
+    queued) is applied in one DB transaction with a single commit. Every
+    caller gets back the outcome of its own entry.
+    """
+
+    def __init__(self, window: float, max_batch_size: int):
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self.queues = defaultdict(deque)
+        self.full = {}
+        self.workers = {}
+
+        self.batches = 0
+        self.writes = 0
+        self.largest_batch = 0
+        self.max_queue_depth = 0
+
+    async def submit(self, transaction: models.TransactionCreate):
+        """Queue a write and wait for its ``(status, transaction)`` outcome."""
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues[transaction.wallet_id]
+        queue.append((transaction, future))
+        self.max_queue_depth = max(self.max_queue_depth, len(queue))
+
+        wallet_id = transaction.wallet_id
+        if wallet_id not in self.workers:
+            self.full[wallet_id] = asyncio.Event()
+            self.workers[wallet_id] = asyncio.create_task(self.drain(wallet_id))
+        elif len(queue) >= self.max_batch_size:
+            self.full[wallet_id].set()
+
+        return await future
+
+    async def drain(self, wallet_id: int):
+        queue = self.queues[wallet_id]
+        try:
+            while queue:
+                if len(queue) < self.max_batch_size:
+                    try:
+                        await asyncio.wait_for(self.full[wallet_id].wait(), self.window)
+                    except asyncio.TimeoutError:
+                        pass
+                self.full[wallet_id].clear()
+
+                size = min(len(queue), self.max_batch_size)
+                batch = [queue.popleft() for _ in range(size)]
+                await self.flush(batch)
+        finally:
+            del self.workers[wallet_id]
+            del self.full[wallet_id]
+            if not queue:
+                del self.queues[wallet_id]
+
+    async def flush(self, batch):
+        transactions = [transaction for transaction, _ in batch]
+        async_session = models.sessionmaker(
+            models.engine, class_=models.AsyncSession, expire_on_commit=False
+        )
+        try:
+            async with async_session() as session:
+                outcomes = await models.apply_transactions(
+                    session, transactions, ledger=settings.LEDGER_MODE
+                )
+                await models.update_rollups(
+                    session, [created for _, created in outcomes if created is not None]
+                )
+                await session.commit()
+            await models.wallet_cache.invalidate(*{transaction.wallet_id for transaction in transactions})
+        except Exception as e:
+            logger.exception("Failed to flush a batch of %d writes", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future), outcome in zip(batch, outcomes):
+            if not future.done():
+                future.set_result(outcome)
+
+    async def close(self):
+        # Let the queued writes finish before the engine goes away
+        if self.workers:
+            await asyncio.gather(*self.workers.values(), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return dict(
+            queue_depth=sum(len(queue) for queue in self.queues.values()),
+            active_wallets=len(self.workers),
+            max_queue_depth=self.max_queue_depth,
+            batches=self.batches,
+            writes=self.writes,
+            average_batch_size=self.writes / self.batches if self.batches else 0.0,
+            largest_batch=self.largest_batch,
+        )
+
+
+write_scheduler = WriteScheduler(
+    window=settings.WRITE_BATCH_WINDOW_MS / 1000,
+    max_batch_size=settings.WRITE_BATCH_MAX_SIZE,
+)
@@ -1,6 +1,9 @@
+import asyncio
 import pytest
+from sqlalchemy import event
 from httpx import AsyncClient
 from digimon import models
+from digimon.routers import items as items_router
 
 
 @pytest.mark.asyncio
@@ -9,7 +12,7 @@ async def test_create_item(client: AsyncClient, token_user1: models.Token):
     payload = {
         "name": "Test Item",
         "description": "A test item",
-        "price": 10.99,
+        "price": 1099,
         "merchant_id": 1,
     }
     response = await client.post("/items", json=payload, headers=headers)
@@ -30,13 +33,38 @@ async def test_read_items(client: AsyncClient):
     assert len(data["items"]) >= 1
 
 
+@pytest.mark.asyncio
+async def test_read_items_after(client: AsyncClient, token_user1: models.Token, monkeypatch):
+    monkeypatch.setattr(items_router, "SIZE_PER_PAGE", 2)
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    for name in ("Page Item 1", "Page Item 2", "Page Item 3"):
+        response = await client.post("/items", json={"name": name, "merchant_id": 1}, headers=headers)
+        assert response.status_code == 200
+
+    seen = []
+    after = 0
+    while after is not None:
+        response = await client.get("/items", params={"after": after})
+        data = response.json()
+        assert response.status_code == 200
+        seen += [item["id"] for item in data["items"]]
+        after = data["next_after"]
+
+    assert seen == sorted(seen)
+    assert len(seen) == len(set(seen)) >= 3
+    assert data["page_count"] == -(-len(seen) // 2)
+
+    response = await client.get("/items", params={"page": 0})
+    assert response.status_code == 422
+
+
 @pytest.mark.asyncio
 async def test_read_item(client: AsyncClient, token_user1: models.Token):
     headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
     payload = {
         "name": "Test Item",
         "description": "A test item",
-        "price": 10.99,
+        "price": 1099,
         "merchant_id": 1,
     }
     response = await client.post("/items", json=payload, headers=headers)
@@ -57,7 +85,7 @@ async def test_update_item(client: AsyncClient, token_user1: models.Token):
     payload = {
         "name": "Test Item",
         "description": "A test item",
-        "price": 10.99,
+        "price": 1099,
         "merchant_id": 1,
     }
     response = await client.post("/items", json=payload, headers=headers)
@@ -66,7 +94,7 @@ async def test_update_item(client: AsyncClient, token_user1: models.Token):
     update_payload = {
         "name": "Updated Item Name",
         "description": "Updated description",
-        "price": 12.99,
+        "price": 1299,
         "merchant_id": created_item['merchant_id']  
     }
     response = await client.put(f"/items/{created_item['id']}", json=update_payload, headers=headers)
@@ -83,7 +111,7 @@ async def test_delete_item(client: AsyncClient, token_user1: models.Token):
     payload = {
         "name": "Test Item",
         "description": "A test item",
-        "price": 10.99,
+        "price": 1099,
         "merchant_id": 1,
     }
     response = await client.post("/items", json=payload, headers=headers)
@@ -93,3 +121,266 @@ async def test_delete_item(client: AsyncClient, token_user1: models.Token):
 
     assert response.status_code == 200
     assert "delete success" in response.json()["message"]
+
+
+@pytest.mark.asyncio
+async def test_search_items(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    payload = {"name": "Quokka Lamp", "description": "A bright lamp", "merchant_id": 1}
+    response = await client.post("/items", json=payload, headers=headers)
+    lamp = response.json()
+    payload = {"name": "Desk", "description": "Fits a quokka lamp", "merchant_id": 1}
+    response = await client.post("/items", json=payload, headers=headers)
+    desk = response.json()
+
+    response = await client.get("/items/search", params={"q": "quokka lam"})
+    assert response.status_code == 200
+    # A match in the name ranks above one in the description
+    assert [item["id"] for item in response.json()["items"]] == [lamp["id"], desk["id"]]
+
+    payload = {"name": "Wombat Lamp", "description": "A bright lamp", "merchant_id": 1}
+    response = await client.put(f"/items/{lamp['id']}", json=payload, headers=headers)
+    assert response.status_code == 200
+    response = await client.get("/items/search", params={"q": "wombat"})
+    assert [item["id"] for item in response.json()["items"]] == [lamp["id"]]
+
+    response = await client.delete(f"/items/{desk['id']}", headers=headers)
+    assert response.status_code == 200
+    response = await client.get("/items/search", params={"q": "quokka"})
+    assert response.json()["items"] == []
+
+    response = await client.get("/items/search", params={"q": '"*)'})
+    assert response.status_code == 200
+    assert response.json()["items"] == []
+
+
+@pytest.mark.asyncio
+async def test_read_item_cached(client: AsyncClient, token_user1: models.Token, monkeypatch):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    payload = {"name": "Cached Item", "price": 100, "merchant_id": 1}
+    response = await client.post("/items", json=payload, headers=headers)
+    item_id = response.json()["id"]
+
+    hits = models.item_cache.hits
+    for _ in range(2):
+        response = await client.get(f"/items/{item_id}")
+        assert response.json()["name"] == "Cached Item"
+    assert models.item_cache.hits == hits + 1
+
+    payload = {"name": "Renamed Item", "price": 100, "merchant_id": 1}
+    await client.put(f"/items/{item_id}", json=payload, headers=headers)
+    response = await client.get(f"/items/{item_id}")
+    assert response.json()["name"] == "Renamed Item"
+
+    # A read whose load is overtaken by a write does not cache what it read
+    stale = models.Item.model_validate(response.json())
+
+    async def load():
+        await models.item_cache.invalidate(item_id)
+        return stale
+
+    await models.item_cache.invalidate(item_id)
+    assert await models.item_cache.fetch(item_id, load) == stale
+    assert await models.item_cache.peek(item_id) is None
+
+    await client.delete(f"/items/{item_id}", headers=headers)
+    response = await client.get(f"/items/{item_id}")
+    assert response.status_code == 404
+
+    response = await client.get("/stats/entity-cache", headers=headers)
+    assert response.json()["items"]["invalidations"] >= 2
+    # Other workers could not invalidate a per-process wallet cache
+    assert response.json()["wallets"]["enabled"] is False
+
+    monkeypatch.setattr(models.item_cache, "enabled", False)
+    hits = models.item_cache.hits
+    for _ in range(2):
+        await client.get("/items/1")
+    assert models.item_cache.hits == hits
+
+
+@pytest.mark.asyncio
+async def test_read_item_etag(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    payload = {"name": "Tagged Item", "price": 100, "merchant_id": 1}
+    response = await client.post("/items", json=payload, headers=headers)
+    item_id = response.json()["id"]
+
+    response = await client.get(f"/items/{item_id}")
+    etag = response.headers["etag"]
+    response = await client.get(f"/items/{item_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    payload = {"name": "Retagged Item", "price": 100, "merchant_id": 1}
+    response = await client.put(f"/items/{item_id}", json=payload, headers=headers)
+    assert response.json()["version"] == 2
+    response = await client.get(f"/items/{item_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+    response = await client.get("/items", params={"page": 1})
+    etag = response.headers["etag"]
+    response = await client.get("/items", params={"page": 1}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    await client.put(f"/items/{item_id}", json=payload, headers=headers)
+    response = await client.get("/items", params={"page": 1}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    # Concurrent writes of different contents never share a version
+    responses = await asyncio.gather(*(
+        client.put(f"/items/{item_id}", json=dict(payload, name=f"Concurrent {index}"), headers=headers)
+        for index in range(2)
+    ))
+    assert sorted(response.json()["version"] for response in responses) == [4, 5]
+
+
+@pytest.mark.asyncio
+async def test_items_bulk(
+    client: AsyncClient, token_user1: models.Token, merchant_user1: models.DBMerchant
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    payload = {
+        "items": [
+            {"name": f"Bulk Item {index}", "price": 100 + index, "merchant_id": merchant_user1.id}
+            for index in range(5)
+        ]
+    }
+    response = await client.post("/items/bulk", json=payload, headers=headers)
+    assert response.status_code == 200
+    ids = response.json()["ids"]
+    assert len(ids) == 5
+
+    response = await client.get(f"/items/{ids[3]}")
+    assert response.json()["name"] == "Bulk Item 3"
+    assert response.json()["price"] == 103
+
+    payload = {
+        "items": [
+            {
+                "id": item_id,
+                "name": f"Bulk Item {item_id} v2",
+                "price": 200,
+                "merchant_id": merchant_user1.id,
+            }
+            for item_id in ids
+        ]
+    }
+    response = await client.put("/items/bulk", json=payload, headers=headers)
+    assert response.status_code == 200
+    response = await client.get(f"/items/{ids[3]}")
+    assert response.json()["name"] == f"Bulk Item {ids[3]} v2"
+    assert response.json()["version"] == 2
+
+    response = await client.get("/items/search", params={"q": "bulk item v2"})
+    assert len(response.json()["items"]) == 5
+
+    # One bad record rejects the whole batch
+    payload = {
+        "items": [
+            {"name": "Orphan", "merchant_id": merchant_user1.id},
+            {"name": "Orphan", "merchant_id": 9999},
+        ]
+    }
+    response = await client.post("/items/bulk", json=payload, headers=headers)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "items", 1, "merchant_id"]
+
+    # A deleted id fails the batch, and is not written back
+    response = await client.delete(f"/items/{ids[4]}", headers=headers)
+    assert response.status_code == 200
+    payload = {
+        "items": [
+            {"id": item_id, "name": "Missing", "merchant_id": merchant_user1.id}
+            for item_id in (ids[0], ids[4])
+        ]
+    }
+    response = await client.put("/items/bulk", json=payload, headers=headers)
+    assert response.status_code == 404
+    assert response.json()["detail"] == f"Items not found: [{ids[4]}]"
+    response = await client.get(f"/items/{ids[4]}")
+    assert response.status_code == 404
+    response = await client.get(f"/items/{ids[0]}")
+    assert response.json()["name"] == f"Bulk Item {ids[0]} v2"
+
+
+@pytest.mark.asyncio
+async def test_read_items_embed(
+    client: AsyncClient, token_user1: models.Token, merchant_user1: models.DBMerchant
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    payload = {
+        "items": [
+            {"name": f"Embed Item {index}", "merchant_id": merchant_user1.id, "user_id": token_user1.user_id}
+            for index in range(items_router.SIZE_PER_PAGE)
+        ]
+    }
+    response = await client.post("/items/bulk", json=payload, headers=headers)
+    after = response.json()["ids"][0] - 1
+    # Leave the item count cached, it is not what is measured
+    await client.get("/items")
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(models.engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        response = await client.get("/items", params={"after": after, "embed": "merchant,user"})
+    finally:
+        event.remove(models.engine.sync_engine, "before_cursor_execute", listener)
+
+    items = response.json()["items"]
+    assert len(items) == items_router.SIZE_PER_PAGE
+    assert items[0]["merchant"]["id"] == merchant_user1.id
+    assert items[0]["user"]["username"] == "user1"
+    # The page, then one query per relation for all of its items
+    assert len(statements) == 3
+
+    response = await client.get("/items", params={"after": after})
+    assert "merchant" not in response.json()["items"][0]
+
+    response = await client.get(f"/items/{after + 1}", params={"embed": "merchant"})
+    assert response.json()["merchant"]["name"] == merchant_user1.name
+    assert "user" not in response.json()
+
+    response = await client.get("/items", params={"embed": "wallet"})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_read_items_fields(
+    client: AsyncClient, token_user1: models.Token, merchant_user1: models.DBMerchant
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    payload = {
+        "items": [
+            {"name": f"Fields Item {index}", "price": 150, "merchant_id": merchant_user1.id, "user_id": token_user1.user_id}
+            for index in range(3)
+        ]
+    }
+    response = await client.post("/items/bulk", json=payload, headers=headers)
+    ids = response.json()["ids"]
+
+    response = await client.get("/items", params={"after": ids[0] - 1, "fields": "name,price"})
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert items[0] == {"id": ids[0], "name": "Fields Item 0", "price": 150}
+    # The same ETag as the full page, both follow the item versions
+    full = await client.get("/items", params={"after": ids[0] - 1})
+    assert response.headers["ETag"] == full.headers["ETag"]
+
+    response = await client.get(f"/items/{ids[1]}", params={"fields": "name,version"})
+    assert response.json() == {"id": ids[1], "name": "Fields Item 1", "version": 1}
+    etag = response.headers["ETag"]
+    response = await client.get(
+        f"/items/{ids[1]}", params={"fields": "name"}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    response = await client.get("/items", params={"fields": "name,secret"})
+    assert response.status_code == 422
+    response = await client.get("/items", params={"fields": "name", "embed": "merchant"})
+    assert response.status_code == 422
+    response = await client.get("/items/999999", params={"fields": "name"})
+    assert response.status_code == 404
@@ -1,3 +1,4 @@
+import json
 import pytest
 from httpx import AsyncClient
 from digimon import models
@@ -83,3 +84,99 @@ async def test_merchant_not_found(client: AsyncClient, token_user1: models.Token
     response = await client.get("/merchants/9999", headers=headers)  
     assert response.status_code == 404
     assert response.json()["detail"] == "Merchant not found"
+
+@pytest.mark.asyncio
+async def test_read_merchants_pages(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    for name in ("Page Merchant 1", "Page Merchant 2", "Page Merchant 3"):
+        response = await client.post("/merchants", json={"name": name}, headers=headers)
+        assert response.status_code == 200
+
+    seen = []
+    after = 0
+    while after is not None:
+        response = await client.get("/merchants", params={"after": after, "size_per_page": 2})
+        data = response.json()
+        assert response.status_code == 200
+        assert data["page_size"] == len(data["merchants"]) <= 2
+        seen += [merchant["id"] for merchant in data["merchants"]]
+        after = data["next_after"]
+
+    assert seen == sorted(seen)
+    assert len(seen) == len(set(seen)) >= 3
+
+    response = await client.get("/merchants", params={"format": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    streamed = [json.loads(line) for line in response.text.splitlines()]
+    assert [merchant["id"] for merchant in streamed] == seen
+    assert streamed[0].keys() == {"id", "name", "description", "tax_id", "user_id", "version"}
+
+    response = await client.get("/merchants", params={"size_per_page": 1000})
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_search_merchants(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post("/merchants", json={"name": "Pangolin Books"}, headers=headers)
+    merchant = response.json()
+
+    response = await client.get("/merchants/search", params={"q": "pangolin b"})
+    assert response.status_code == 200
+    assert [found["id"] for found in response.json()["merchants"]] == [merchant["id"]]
+
+    response = await client.put(
+        f"/merchants/{merchant['id']}", json={"name": "Armadillo Books"}, headers=headers
+    )
+    assert response.status_code == 200
+    response = await client.get("/merchants/search", params={"q": "pangolin"})
+    assert response.json()["merchants"] == []
+
+    response = await client.delete(f"/merchants/{merchant['id']}", headers=headers)
+    response = await client.get("/merchants/search", params={"q": "armadillo"})
+    assert response.json()["merchants"] == []
+
+@pytest.mark.asyncio
+async def test_read_merchant_etag(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post("/merchants", json={"name": "Tagged Merchant"}, headers=headers)
+    merchant_id = response.json()["id"]
+
+    response = await client.get(f"/merchants/{merchant_id}")
+    etag = response.headers["etag"]
+    response = await client.get(f"/merchants/{merchant_id}", headers={"If-None-Match": f"W/{etag}"})
+    assert response.status_code == 304
+
+    await client.put(f"/merchants/{merchant_id}", json={"name": "Retagged Merchant"}, headers=headers)
+    response = await client.get(f"/merchants/{merchant_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+
+@pytest.mark.asyncio
+async def test_read_merchants_embed(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post("/merchants", json={"name": "Embedded Merchant"}, headers=headers)
+    merchant_id = response.json()["id"]
+
+    response = await client.get(f"/merchants/{merchant_id}", params={"embed": "user"})
+    assert response.json()["user"]["username"] == "user1"
+
+    response = await client.get("/merchants", params={"after": merchant_id - 1, "embed": "user"})
+    assert response.json()["merchants"][0]["user"]["username"] == "user1"
+    response = await client.get("/merchants", params={"after": merchant_id - 1})
+    assert "user" not in response.json()["merchants"][0]
+
+
+@pytest.mark.asyncio
+async def test_read_merchants_fields(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post("/merchants", json={"name": "Sparse Merchant"}, headers=headers)
+    merchant_id = response.json()["id"]
+
+    response = await client.get("/merchants", params={"after": merchant_id - 1, "fields": "name"})
+    assert response.json()["merchants"] == [{"id": merchant_id, "name": "Sparse Merchant"}]
+    assert response.json()["page_size"] == 1
+
+    response = await client.get(f"/merchants/{merchant_id}", params={"fields": "id"})
+    assert response.json() == {"id": merchant_id}
+    assert response.headers["ETag"]
@@ -1,14 +1,19 @@
 
 
+import asyncio
+import csv
+import datetime
+import json
 import pytest
 from httpx import AsyncClient
-from digimon import models
+from digimon import archive_transactions, idempotency, jobs, models, scheduler, security
+from digimon.routers import transactions as transactions_router
 
 @pytest.mark.asyncio
 async def test_create_transaction(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
     headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
     
-    wallet_payload = {"user_id": token_user1.user_id, "balance": 100.0}
+    wallet_payload = {"user_id": token_user1.user_id, "balance": 100}
     wallet = models.DBWallet(**wallet_payload)
     session.add(wallet)
     await session.commit()
@@ -16,7 +21,7 @@ async def test_create_transaction(client: AsyncClient, token_user1: models.Token
     
     transaction_payload = {
         "wallet_id": wallet.id,
-        "amount": 50.0,
+        "amount": 50,
         "type": "debit",
         "description": "Test transaction"
     }
@@ -28,11 +33,65 @@ async def test_create_transaction(client: AsyncClient, token_user1: models.Token
     assert data["description"] == transaction_payload["description"]
     assert data["type"] == transaction_payload["type"]
 
+@pytest.mark.asyncio
+async def test_create_transaction_insufficient_funds(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+
+    wallet_payload = {"user_id": token_user1.user_id, "balance": 30}
+    wallet = models.DBWallet(**wallet_payload)
+    session.add(wallet)
+    await session.commit()
+    await session.refresh(wallet)
+
+    transaction_payload = {
+        "wallet_id": wallet.id,
+        "amount": 50,
+        "type": "debit",
+        "description": "Test transaction"
+    }
+    response = await client.post("/transactions", json=transaction_payload, headers=headers)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Insufficient funds"
+
+    transaction_payload["wallet_id"] = 9999
+    response = await client.post("/transactions", json=transaction_payload, headers=headers)
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Wallet not found"
+
+@pytest.mark.asyncio
+async def test_create_transaction_concurrent_debits(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+
+    wallet_payload = {"user_id": token_user1.user_id, "balance": 100}
+    wallet = models.DBWallet(**wallet_payload)
+    session.add(wallet)
+    await session.commit()
+    await session.refresh(wallet)
+
+    transaction_payload = {
+        "wallet_id": wallet.id,
+        "amount": 10,
+        "type": "debit",
+        "description": "Concurrent debit"
+    }
+    responses = await asyncio.gather(
+        *[client.post("/transactions", json=transaction_payload, headers=headers) for _ in range(15)]
+    )
+    status_codes = [response.status_code for response in responses]
+
+    assert status_codes.count(200) == 10
+    assert status_codes.count(400) == 5
+
+    response = await client.get(f"/wallets/{wallet.id}", headers=headers)
+    assert response.json()["balance"] == 0
+
 @pytest.mark.asyncio
 async def test_read_transaction(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
     headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
     
-    wallet_payload = {"user_id": token_user1.user_id, "balance": 100.0}
+    wallet_payload = {"user_id": token_user1.user_id, "balance": 100}
     wallet = models.DBWallet(**wallet_payload)
     session.add(wallet)
     await session.commit()
@@ -40,7 +99,7 @@ async def test_read_transaction(client: AsyncClient, token_user1: models.Token,
     
     transaction_payload = {
         "wallet_id": wallet.id,
-        "amount": 50.0,
+        "amount": 50,
         "type": "debit",
         "description": "Test transaction"
     }
@@ -59,7 +118,7 @@ async def test_update_transaction(client: AsyncClient, token_user1: models.Token
     headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
     
     # Create a wallet and transaction for testing
-    wallet_payload = {"user_id": token_user1.user_id, "balance": 100.0}
+    wallet_payload = {"user_id": token_user1.user_id, "balance": 100}
     wallet = models.DBWallet(**wallet_payload)
     session.add(wallet)
     await session.commit()
@@ -67,7 +126,7 @@ async def test_update_transaction(client: AsyncClient, token_user1: models.Token
     
     transaction_payload = {
         "wallet_id": wallet.id,
-        "amount": 50.0,
+        "amount": 50,
         "type": "debit",
         "description": "Initial transaction"
     }
@@ -77,7 +136,7 @@ async def test_update_transaction(client: AsyncClient, token_user1: models.Token
     # Update the transaction
     update_payload = {
         "wallet_id": wallet.id,  # Include wallet_id to ensure schema validation
-        "amount": 75.0,
+        "amount": 75,
         "type": "debit",
         "description": "Updated transaction"
     }
@@ -93,7 +152,7 @@ async def test_update_transaction_insufficient_funds(client: AsyncClient, token_
     headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
     
     # Create a wallet with insufficient balance for the update
-    wallet_payload = {"user_id": token_user1.user_id, "balance": 50.0}
+    wallet_payload = {"user_id": token_user1.user_id, "balance": 50}
     wallet = models.DBWallet(**wallet_payload)
     session.add(wallet)
     await session.commit()
@@ -102,7 +161,7 @@ async def test_update_transaction_insufficient_funds(client: AsyncClient, token_
     # Create a transaction
     transaction_payload = {
         "wallet_id": wallet.id,
-        "amount": 40.0,
+        "amount": 40,
         "type": "debit",
         "description": "Initial transaction"
     }
@@ -112,7 +171,7 @@ async def test_update_transaction_insufficient_funds(client: AsyncClient, token_
     # Attempt to update the transaction with an amount greater than the wallet balance
     update_payload = {
         "wallet_id": wallet.id,  # Include wallet_id to ensure schema validation
-        "amount": 60.0,  # Exceeds remaining balance
+        "amount": 60,  # Exceeds remaining balance
         "type": "debit",
         "description": "Updated transaction"
     }
@@ -125,7 +184,7 @@ async def test_update_transaction_insufficient_funds(client: AsyncClient, token_
 async def test_delete_transaction(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
     headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
     
-    wallet_payload = {"user_id": token_user1.user_id, "balance": 100.0}
+    wallet_payload = {"user_id": token_user1.user_id, "balance": 100}
     wallet = models.DBWallet(**wallet_payload)
     session.add(wallet)
     await session.commit()
@@ -133,7 +192,7 @@ async def test_delete_transaction(client: AsyncClient, token_user1: models.Token
     
     transaction_payload = {
         "wallet_id": wallet.id,
-        "amount": 50.0,
+        "amount": 50,
         "type": "debit",
         "description": "Test transaction"
     }
@@ -155,3 +214,409 @@ async def test_delete_transaction_not_found(client: AsyncClient, token_user1: mo
     response = await client.delete("/transactions/9999", headers=headers)  
     assert response.status_code == 404
     assert response.json()["detail"] == "Transaction not found"
+
+@pytest.mark.asyncio
+async def test_create_transactions_batch(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+
+    wallets = [models.DBWallet(user_id=token_user1.user_id, balance=balance) for balance in (100, 10)]
+    session.add_all(wallets)
+    await session.commit()
+    for wallet in wallets:
+        await session.refresh(wallet)
+
+    batch_payload = {
+        "transactions": [
+            {"wallet_id": wallets[0].id, "amount": 60, "type": "debit"},
+            {"wallet_id": wallets[1].id, "amount": 20, "type": "debit"},
+            {"wallet_id": wallets[0].id, "amount": 60, "type": "debit"},
+            {"wallet_id": wallets[1].id, "amount": 15, "type": "credit"},
+            {"wallet_id": wallets[1].id, "amount": 20, "type": "debit"},
+            {"wallet_id": 9999, "amount": 5, "type": "credit"},
+        ]
+    }
+    response = await client.post("/transactions/batch", json=batch_payload, headers=headers)
+    data = response.json()
+
+    assert response.status_code == 200
+    assert [result["status"] for result in data["results"]] == [
+        "ok", "insufficient_funds", "insufficient_funds", "ok", "ok", "wallet_not_found"
+    ]
+    assert data["succeeded"] == 3
+    assert data["failed"] == 3
+
+    created = data["results"][0]["transaction"]
+    response = await client.get(f"/transactions/{created['id']}", headers=headers)
+    assert response.json()["amount"] == 60
+
+    response = await client.get(f"/wallets/{wallets[0].id}", headers=headers)
+    assert response.json()["balance"] == 40
+    response = await client.get(f"/wallets/{wallets[1].id}", headers=headers)
+    assert response.json()["balance"] == 5
+
+@pytest.mark.asyncio
+async def test_create_transactions_batch_too_large(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+
+    transaction = {"wallet_id": 1, "amount": 1, "type": "credit"}
+    batch_payload = {"transactions": [transaction] * (models.MAX_BATCH_SIZE + 1)}
+    response = await client.post("/transactions/batch", json=batch_payload, headers=headers)
+
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_write_scheduler_group_commit(token_user1: models.Token, session: models.AsyncSession):
+    wallet = models.DBWallet(user_id=token_user1.user_id, balance=25)
+    session.add(wallet)
+    await session.commit()
+    await session.refresh(wallet)
+
+    write_scheduler = scheduler.WriteScheduler(window=0.05, max_batch_size=100)
+    transactions = [
+        models.TransactionCreate(wallet_id=wallet.id, amount=10, type="debit")
+        for _ in range(3)
+    ]
+    outcomes = await asyncio.gather(*[write_scheduler.submit(transaction) for transaction in transactions])
+
+    assert [status for status, _ in outcomes] == ["ok", "ok", "insufficient_funds"]
+    assert outcomes[0][1].id != outcomes[1][1].id
+    assert outcomes[2][1] is None
+
+    stats = write_scheduler.stats()
+    assert stats["batches"] == 1
+    assert stats["largest_batch"] == 3
+    assert stats["queue_depth"] == 0
+
+    await session.refresh(wallet)
+    assert wallet.balance == 5
+
+@pytest.mark.asyncio
+async def test_read_write_scheduler_stats(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.get("/stats/write-scheduler", headers=headers)
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["queue_depth"] == 0
+    assert data["batches"] >= 1
+
+@pytest.mark.asyncio
+async def test_create_transaction_idempotency_key(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
+    headers = {
+        "Authorization": f"{token_user1.token_type} {token_user1.access_token}",
+        "Idempotency-Key": "test-create-transaction-retry",
+    }
+
+    wallet = models.DBWallet(user_id=token_user1.user_id, balance=100)
+    session.add(wallet)
+    await session.commit()
+    await session.refresh(wallet)
+
+    transaction_payload = {
+        "wallet_id": wallet.id,
+        "amount": 30,
+        "type": "debit",
+        "description": "Retried payment"
+    }
+    first = await client.post("/transactions", json=transaction_payload, headers=headers)
+    retry = await client.post("/transactions", json=transaction_payload, headers=headers)
+
+    assert first.status_code == 200
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+    await session.refresh(wallet)
+    assert wallet.balance == 70
+
+    transaction_payload["amount"] = 40
+    response = await client.post("/transactions", json=transaction_payload, headers=headers)
+    assert response.status_code == 422
+
+    response = await client.get("/stats/idempotency", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["hits"] >= 2
+
+@pytest.mark.asyncio
+async def test_idempotency_key_per_caller(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
+    user2 = models.DBUser(
+        username="idempotency-user2", password="", email="user2@idempotency.local", first_name="Second", last_name="User"
+    )
+    wallet = models.DBWallet(user_id=token_user1.user_id, balance=100)
+    session.add_all([user2, wallet])
+    await session.commit()
+    await session.refresh(user2)
+    await session.refresh(wallet)
+
+    headers1 = {
+        "Authorization": f"{token_user1.token_type} {token_user1.access_token}",
+        "Idempotency-Key": "test-idempotency-per-caller",
+    }
+    headers2 = {
+        "Authorization": f"Bearer {security.create_access_token(data={'sub': user2.id})}",
+        "Idempotency-Key": "test-idempotency-per-caller",
+    }
+    transaction_payload = {"wallet_id": wallet.id, "amount": 10, "type": "credit"}
+
+    # A rejected token is not stored against the key
+    response = await client.post(
+        "/transactions", json=transaction_payload, headers=dict(headers1, Authorization="Bearer invalid")
+    )
+    assert response.status_code == 401
+    first = await client.post("/transactions", json=transaction_payload, headers=headers1)
+    assert first.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+
+    # Another caller with the same key and body runs its own request
+    second = await client.post("/transactions", json=transaction_payload, headers=headers2)
+    assert second.status_code == 200
+    assert "Idempotent-Replayed" not in second.headers
+    assert second.json()["id"] != first.json()["id"]
+
+@pytest.mark.asyncio
+async def test_idempotency_key_lease(session: models.AsyncSession):
+    middleware = idempotency.IdempotencyMiddleware(None)
+    key = "test-idempotency-lease"
+    assert await middleware.claim(key, "fingerprint") is None
+    assert await middleware.claim(key, "fingerprint") == "in_progress"
+
+    # The request that claimed it died; once its lease is up it is taken over
+    row = await session.get(models.DBIdempotencyKey, key)
+    row.created_date -= datetime.timedelta(seconds=idempotency.settings.IDEMPOTENCY_LEASE_SECONDS + 1)
+    session.add(row)
+    await session.commit()
+    assert await middleware.claim(key, "fingerprint") is None
+    assert await middleware.claim(key, "fingerprint") == "in_progress"
+
+    # Expired keys are purged
+    await session.refresh(row)
+    row.created_date -= datetime.timedelta(seconds=idempotency.settings.IDEMPOTENCY_TTL_SECONDS + 1)
+    session.add(row)
+    await session.commit()
+    assert await jobs.purge_idempotency_keys() >= 1
+    session.expunge_all()
+    assert await session.get(models.DBIdempotencyKey, key) is None
+
+@pytest.mark.asyncio
+async def test_ledger_mode(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession, monkeypatch):
+    monkeypatch.setattr(transactions_router.settings, "LEDGER_MODE", True)
+    monkeypatch.setattr(scheduler.settings, "LEDGER_MODE", True)
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+
+    wallet = models.DBWallet(user_id=token_user1.user_id, balance=100)
+    session.add(wallet)
+    await session.commit()
+    await session.refresh(wallet)
+
+    # Concurrent writes are coalesced by the write scheduler, each batch
+    # into one ledger entry
+    batches = scheduler.write_scheduler.batches
+    transaction_payload = {"wallet_id": wallet.id, "amount": 10, "type": "debit"}
+    responses = await asyncio.gather(
+        *[client.post("/transactions", json=transaction_payload, headers=headers) for _ in range(3)]
+    )
+    assert [response.status_code for response in responses] == [200] * 3
+    assert scheduler.write_scheduler.batches > batches
+
+    transaction_payload["amount"] = 80
+    response = await client.post("/transactions", json=transaction_payload, headers=headers)
+    assert response.status_code == 400
+
+    # Without the scheduler the entry is appended by the request itself
+    monkeypatch.setattr(transactions_router.settings, "WRITE_SCHEDULER_ENABLED", False)
+    response = await client.post("/transactions", json=transaction_payload, headers=headers)
+    assert response.status_code == 400
+    batches = scheduler.write_scheduler.batches
+    transaction_payload.update(amount=10, type="credit")
+    response = await client.post("/transactions", json=transaction_payload, headers=headers)
+    assert response.status_code == 200
+    assert scheduler.write_scheduler.batches == batches
+
+    # Only ledger entries were written, the stored balance is untouched
+    await session.refresh(wallet)
+    assert wallet.balance == 100
+    response = await client.get(f"/wallets/{wallet.id}", headers=headers)
+    assert response.json()["balance"] == 80
+
+    # Batches go through the ledger too, checked against the ledger balance
+    batch = {"transactions": [
+        {"wallet_id": wallet.id, "amount": 50, "type": "debit"},
+        {"wallet_id": wallet.id, "amount": 50, "type": "debit"},
+    ]}
+    response = await client.post("/transactions/batch", json=batch, headers=headers)
+    assert [result["status"] for result in response.json()["results"]] == ["ok", "insufficient_funds"]
+    await session.refresh(wallet)
+    assert wallet.balance == 100
+
+    while await models.compact_ledger(session, batch_size=1):
+        await session.commit()
+
+    await session.refresh(wallet)
+    assert wallet.balance == 30
+    response = await client.get(f"/wallets/{wallet.id}", headers=headers)
+    assert response.json()["balance"] == 30
+
+@pytest.mark.asyncio
+async def test_export_transactions(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+
+    wallet = models.DBWallet(user_id=token_user1.user_id, balance=0)
+    session.add(wallet)
+    await session.commit()
+    await session.refresh(wallet)
+
+    for amount in (10, 20, 30):
+        transaction_payload = {"wallet_id": wallet.id, "amount": amount, "type": "credit"}
+        await client.post("/transactions", json=transaction_payload, headers=headers)
+
+    response = await client.get(
+        "/transactions/export", params=dict(wallet_id=wallet.id, chunk_size=2), headers=headers
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["amount"] for record in records] == [10, 20, 30]
+    assert records[0]["wallet_id"] == wallet.id
+
+    response = await client.get(
+        "/transactions/export", params=dict(wallet_id=wallet.id, format="csv", chunk_size=2), headers=headers
+    )
+    assert response.status_code == 200
+    rows = list(csv.DictReader(response.text.splitlines()))
+    assert [row["amount"] for row in rows] == ["10", "20", "30"]
+
+    response = await client.get(
+        "/transactions/export", params={"wallet_id": wallet.id, "from": "2000-01-01T00:00:00", "to": "2000-01-02T00:00:00"}, headers=headers
+    )
+    assert response.text == ""
+
+@pytest.mark.asyncio
+async def test_import_transactions(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession, tmp_path, monkeypatch):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    monkeypatch.setattr(transactions_router.settings, "IMPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(transactions_router.settings, "IMPORT_CHUNK_SIZE", 2)
+
+    wallet = models.DBWallet(user_id=token_user1.user_id, balance=0)
+    session.add(wallet)
+    await session.commit()
+    await session.refresh(wallet)
+
+    body = "\n".join([
+        "wallet_id,amount,type,description,created_at",
+        # A quoted field may hold a line break
+        f'{wallet.id},100,credit,"opening\nbalance, 2019",2019-01-01T00:00:00',
+        f"{wallet.id},abc,debit,,",
+        f"{wallet.id},30,debit,,2019-01-02T00:00:00",
+        "9999,10,credit,,",
+        f"{wallet.id},10,refund,,",
+    ])
+    job = f"test-import-{wallet.id}"
+    response = await client.post(f"/transactions/import?format=csv&job={job}", content=body, headers=headers)
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["rows"] == 5
+    assert data["imported"] == 2
+    assert data["rejected"] == 3
+
+    response = await client.get(f"/transactions/import/{data['job_id']}/rejects", headers=headers)
+    assert response.status_code == 200
+    rejects = [json.loads(line) for line in response.text.splitlines()]
+    assert [reject["line"] for reject in rejects] == [4, 6, 7]
+
+    response = await client.get(f"/wallets/{wallet.id}/transactions", headers=headers)
+    transactions = response.json()["transactions"]
+    assert [t["amount"] for t in transactions] == [30, 100]
+    assert transactions[1]["created_at"] == "2019-01-01T00:00:00"
+    assert transactions[1]["description"] == "opening\nbalance, 2019"
+
+    # Sending the same job again resumes after the last committed chunk
+    response = await client.post(f"/transactions/import?format=csv&job={job}", content=body, headers=headers)
+    data = response.json()
+    assert data["skipped"] == 5
+    assert data["imported"] == 0
+
+    response = await client.get(f"/wallets/{wallet.id}", headers=headers)
+    assert response.json()["balance"] == 70
+
+@pytest.mark.asyncio
+async def test_archive_transactions(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession, tmp_path):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+
+    wallet = models.DBWallet(user_id=token_user1.user_id, balance=80)
+    session.add(wallet)
+    await session.commit()
+    await session.refresh(wallet)
+
+    old = [
+        models.DBTransaction(wallet_id=wallet.id, amount=100, type="credit", created_at=datetime.datetime(2018, 3, 1)),
+        models.DBTransaction(wallet_id=wallet.id, amount=30, type="debit", created_at=datetime.datetime(2018, 3, 31, 23, 59)),
+    ]
+    recent = models.DBTransaction(wallet_id=wallet.id, amount=10, type="credit")
+    session.add_all([*old, recent])
+    await session.commit()
+
+    moved = await archive_transactions.archive_transactions(session, hot_months=3, directory=tmp_path, chunk_size=1)
+    assert moved["2018-03"] == 2
+    assert "2018-03" not in await archive_transactions.archive_transactions(session, 3, tmp_path, 1)
+    assert await session.get(models.DBTransaction, old[0].id) is None
+
+    # Archived rows stay readable, but can no longer be changed
+    response = await client.get(f"/transactions/{old[1].id}")
+    assert response.status_code == 200
+    assert response.json()["amount"] == 30
+    assert response.json()["created_at"] == "2018-03-31T23:59:00"
+
+    response = await client.delete(f"/transactions/{old[1].id}", headers=headers)
+    assert response.status_code == 409
+
+    response = await client.get(f"/transactions/{recent.id}")
+    assert response.status_code == 200
+
+    # A missing archive file reads as a missing transaction
+    archive = next(tmp_path.iterdir())
+    archive.rename(tmp_path / "moved")
+    response = await client.get(f"/transactions/{old[1].id}")
+    assert response.status_code == 404
+    (tmp_path / "moved").rename(archive)
+
+    # The balance still reconciles against the archived totals
+    _, _, mismatches = await models.reconcile_wallets(session, wallet.id, wallet.id)
+    assert mismatches == []
+
+    response = await client.get(f"/wallets/{wallet.id}/balance", params={"at": "2018-03-15T00:00:00"})
+    assert response.status_code == 400
+    # Times with an offset are compared with the naive stored ones
+    response = await client.get(f"/wallets/{wallet.id}/balance", params={"at": "2018-03-15T00:00:00Z"})
+    assert response.status_code == 400
+    at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=1)
+    response = await client.get(f"/wallets/{wallet.id}/balance", params={"at": at.isoformat()})
+    assert response.status_code == 200
+    assert response.json()["balance"] == 80
+
+
+@pytest.mark.asyncio
+async def test_archive_transfer(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession, tmp_path):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    wallets = [models.DBWallet(user_id=token_user1.user_id, balance=100) for _ in range(2)]
+    session.add_all(wallets)
+    await session.commit()
+    for wallet in wallets:
+        await session.refresh(wallet)
+
+    payload = {"from_wallet_id": wallets[0].id, "to_wallet_id": wallets[1].id, "amount": 40}
+    response = await client.post("/transfers", json=payload, headers=headers)
+    transfer = response.json()
+
+    # Backdate both legs into a closed month
+    for transaction_id in (transfer["debit_transaction_id"], transfer["credit_transaction_id"]):
+        leg = await session.get(models.DBTransaction, transaction_id)
+        leg.created_at = datetime.datetime(2019, 5, 10)
+        session.add(leg)
+    await session.commit()
+    moved = await archive_transactions.archive_transactions(session, hot_months=3, directory=tmp_path, chunk_size=100)
+    assert moved["2019-05"] == 2
+
+    response = await client.get(f"/transfers/{transfer['id']}")
+    assert response.status_code == 200
+    assert response.json() == transfer
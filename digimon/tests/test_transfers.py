@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from httpx import AsyncClient
+from digimon import models
+
+
+async def create_wallets(session: models.AsyncSession, user_id: int, *balances: float) -> list[models.DBWallet]:
+    wallets = [models.DBWallet(user_id=user_id, balance=balance) for balance in balances]
+    session.add_all(wallets)
+    await session.commit()
+    for wallet in wallets:
+        await session.refresh(wallet)
+    return wallets
+
+@pytest.mark.asyncio
+async def test_create_transfer(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    source, target = await create_wallets(session, token_user1.user_id, 100, 20)
+
+    payload = {
+        "from_wallet_id": source.id,
+        "to_wallet_id": target.id,
+        "amount": 30,
+        "description": "Test transfer",
+    }
+    response = await client.post("/transfers", json=payload, headers=headers)
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["amount"] == payload["amount"]
+
+    response = await client.get(f"/transactions/{data['debit_transaction_id']}", headers=headers)
+    debit = response.json()
+    assert debit["type"] == "debit"
+    assert debit["wallet_id"] == source.id
+    assert debit["transfer_id"] == data["id"]
+
+    response = await client.get(f"/transactions/{data['credit_transaction_id']}", headers=headers)
+    credit = response.json()
+    assert credit["type"] == "credit"
+    assert credit["wallet_id"] == target.id
+    assert credit["transfer_id"] == data["id"]
+
+    response = await client.get(f"/transfers/{data['id']}", headers=headers)
+    assert response.json() == data
+
+    response = await client.get(f"/wallets/{source.id}", headers=headers)
+    assert response.json()["balance"] == 70
+    response = await client.get(f"/wallets/{target.id}", headers=headers)
+    assert response.json()["balance"] == 50
+
+@pytest.mark.asyncio
+async def test_create_transfer_insufficient_funds(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    # The target has the lower id, so its credit is applied before the debit fails
+    target, source = await create_wallets(session, token_user1.user_id, 0, 10)
+
+    payload = {"from_wallet_id": source.id, "to_wallet_id": target.id, "amount": 30}
+    response = await client.post("/transfers", json=payload, headers=headers)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Insufficient funds"
+
+    response = await client.get(f"/wallets/{target.id}", headers=headers)
+    assert response.json()["balance"] == 0
+
+    payload = {"from_wallet_id": source.id, "to_wallet_id": 9999, "amount": 5}
+    response = await client.post("/transfers", json=payload, headers=headers)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Wallet not found"
+
+    payload = {"from_wallet_id": source.id, "to_wallet_id": source.id, "amount": 5}
+    response = await client.post("/transfers", json=payload, headers=headers)
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_concurrent_opposing_transfers(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    first, second = await create_wallets(session, token_user1.user_id, 50, 50)
+
+    payloads = [
+        {"from_wallet_id": first.id, "to_wallet_id": second.id, "amount": 5},
+        {"from_wallet_id": second.id, "to_wallet_id": first.id, "amount": 5},
+    ] * 5
+    responses = await asyncio.gather(
+        *[client.post("/transfers", json=payload, headers=headers) for payload in payloads]
+    )
+    assert all(response.status_code == 200 for response in responses)
+
+    response = await client.get(f"/wallets/{first.id}", headers=headers)
+    assert response.json()["balance"] == 50
+    response = await client.get(f"/wallets/{second.id}", headers=headers)
+    assert response.json()["balance"] == 50
@@ -3,7 +3,7 @@ from httpx import AsyncClient
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.exc import NoResultFound
-from digimon import models
+from digimon import deps, models, passwords
 
 
 @pytest.mark.asyncio
@@ -23,6 +23,30 @@ async def test_create_user(client: AsyncClient):
     assert data["email"] == payload["email"]
 
 
+@pytest.mark.asyncio
+async def test_create_user_conflict(client: AsyncClient):
+    payload = {
+        "email": "conflict@example.com",
+        "username": "conflict",
+        "first_name": "Test",
+        "last_name": "User",
+        "password": "password123"
+    }
+    response = await client.post("/users/create", json=payload)
+    assert response.status_code == 200
+
+    response = await client.post("/users/create", json=dict(payload, email="other@example.com"))
+    assert response.status_code == 409
+    response = await client.post("/users/create", json=dict(payload, username="other"))
+    assert response.status_code == 409
+
+    response = await client.post("/token", data={"username": "conflict@example.com", "password": "password123"})
+    assert response.status_code == 200
+    assert response.json()["user_id"] is not None
+    response = await client.post("/token", data={"username": "conflict", "password": "wrong"})
+    assert response.status_code == 401
+
+
 @pytest.mark.asyncio
 async def test_get_user(client: AsyncClient, token_user1: models.Token):
     headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
@@ -88,3 +112,49 @@ async def test_user_not_found(client: AsyncClient, token_user1: models.Token):
 
     assert response.status_code == 404
     assert response.json()["detail"] == "User not found"
+
+
+@pytest.mark.asyncio
+async def test_login_sheds_load(client: AsyncClient, token_user1: models.Token, monkeypatch):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    form = {"username": "user1", "password": "123456"}
+    response = await client.post("/token", data=form)
+    assert response.status_code == 200
+
+    response = await client.get("/stats/password-hasher", headers=headers)
+    stats = response.json()
+    assert stats["completed"] >= 1
+    assert stats["hash_time"]["max_ms"] > 0
+
+    # Every thread busy and the queue full
+    hasher = passwords.password_hasher
+    monkeypatch.setattr(hasher, "pending", hasher.workers + hasher.queue_size)
+    response = await client.post("/token", data=form)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert hasher.rejected >= 1
+
+
+@pytest.mark.asyncio
+async def test_principal_cache(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    deps.principal_cache.pop(token_user1.user_id)
+
+    await client.get("/users/me", headers=headers)
+    hits = deps.principal_cache.hits
+    response = await client.get("/users/me", headers=headers)
+    assert response.json()["first_name"] == "Firstname"
+    assert deps.principal_cache.hits == hits + 1
+
+    update_payload = {
+        "first_name": "Cached",
+        "last_name": "lastname",
+        "email": "test@test.com",
+        "username": "user1",
+    }
+    await client.put(f"/users/{token_user1.user_id}/update", json=update_payload, headers=headers)
+    response = await client.get("/users/me", headers=headers)
+    assert response.json()["first_name"] == "Cached"
+
+    response = await client.get("/stats/principal-cache", headers=headers)
+    assert response.json()["hit_ratio"] > 0
@@ -1,13 +1,17 @@
+import datetime
+import io
+import json
 import pytest
 from httpx import AsyncClient
-from digimon import models
+from sqlmodel import select
+from digimon import models, reconcile
 
 @pytest.mark.asyncio
 async def test_create_wallet(client: AsyncClient, token_user1: models.Token):
     headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
     payload = {
         "user_id": token_user1.user_id,
-        "balance": 100.0,
+        "balance": 100,
     }
     response = await client.post("/wallets", json=payload, headers=headers)
     data = response.json()
@@ -22,7 +26,7 @@ async def test_read_wallet(client: AsyncClient, token_user1: models.Token):
     
     payload = {
         "user_id": token_user1.user_id,
-        "balance": 100.0,
+        "balance": 100,
     }
     response = await client.post("/wallets", json=payload, headers=headers)
     created_wallet = response.json()
@@ -33,18 +37,36 @@ async def test_read_wallet(client: AsyncClient, token_user1: models.Token):
     assert response.status_code == 200
     assert data["user_id"] == token_user1.user_id
 
+@pytest.mark.asyncio
+async def test_read_wallet_after_transaction(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post(
+        "/wallets", json={"user_id": token_user1.user_id, "balance": 100}, headers=headers
+    )
+    wallet_id = response.json()["id"]
+
+    response = await client.get(f"/wallets/{wallet_id}", headers=headers)
+    assert response.json()["balance"] == 100
+
+    # The cached wallet is dropped once the write is committed
+    payload = {"wallet_id": wallet_id, "amount": 25, "type": "credit"}
+    response = await client.post("/transactions", json=payload, headers=headers)
+    assert response.status_code == 200
+    response = await client.get(f"/wallets/{wallet_id}", headers=headers)
+    assert response.json()["balance"] == 125
+
 @pytest.mark.asyncio
 async def test_update_wallet(client: AsyncClient, token_user1: models.Token):
     headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
     payload = {
         "user_id": token_user1.user_id,
-        "balance": 50.0,
+        "balance": 50,
     }
     response = await client.post("/wallets", json=payload, headers=headers)
     created_wallet = response.json()
 
     update_payload = {
-        "balance": 150.0
+        "balance": 150
     }
     response = await client.put(f"/wallets/{created_wallet['id']}", json=update_payload, headers=headers)
     data = response.json()
@@ -57,7 +79,7 @@ async def test_delete_wallet(client: AsyncClient, token_user1: models.Token):
     headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
     payload = {
         "user_id": token_user1.user_id,
-        "balance": 100.0,
+        "balance": 100,
     }
     response = await client.post("/wallets", json=payload, headers=headers)
     created_wallet = response.json()
@@ -73,3 +95,281 @@ async def test_wallet_not_found(client: AsyncClient, token_user1: models.Token):
     response = await client.get("/wallets/9999", headers=headers)  
     assert response.status_code == 404
     assert response.json()["detail"] == "Wallet not found"
+
+@pytest.mark.asyncio
+async def test_create_wallet_minor_units(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    payload = {
+        "user_id": token_user1.user_id,
+        "balance": models.to_minor_units("10.99"),
+    }
+    response = await client.post("/wallets", json=payload, headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["balance"] == 1099
+
+    payload["balance"] = 10.99
+    response = await client.post("/wallets", json=payload, headers=headers)
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_read_wallet_transactions(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    payload = {
+        "user_id": token_user1.user_id,
+        "balance": 100,
+    }
+    response = await client.post("/wallets", json=payload, headers=headers)
+    created_wallet = response.json()
+
+    transaction_ids = []
+    for transaction_type in ("credit", "debit", "credit", "debit", "credit"):
+        transaction_payload = {"wallet_id": created_wallet["id"], "amount": 10, "type": transaction_type}
+        response = await client.post("/transactions", json=transaction_payload, headers=headers)
+        transaction_ids.append(response.json()["id"])
+
+    response = await client.get(f"/wallets/{created_wallet['id']}/transactions?limit=2")
+    data = response.json()
+
+    assert response.status_code == 200
+    assert [t["id"] for t in data["transactions"]] == transaction_ids[:-3:-1]
+    assert data["transactions"][0]["created_at"] is not None
+
+    seen = [t["id"] for t in data["transactions"]]
+    while data["next_cursor"] is not None:
+        response = await client.get(
+            f"/wallets/{created_wallet['id']}/transactions?limit=2&cursor={data['next_cursor']}"
+        )
+        data = response.json()
+        seen += [t["id"] for t in data["transactions"]]
+    assert seen == transaction_ids[::-1]
+
+    response = await client.get(f"/wallets/{created_wallet['id']}/transactions?type=debit")
+    assert [t["id"] for t in response.json()["transactions"]] == [transaction_ids[3], transaction_ids[1]]
+
+    response = await client.get(f"/wallets/{created_wallet['id']}/transactions?from=2000-01-01T00:00:00&to=2000-01-02T00:00:00")
+    assert response.json()["transactions"] == []
+
+    response = await client.get("/wallets/9999/transactions")
+    assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_read_wallet_transactions_fields(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post("/wallets", json={"user_id": token_user1.user_id, "balance": 100}, headers=headers)
+    wallet_id = response.json()["id"]
+    transaction_payload = {"wallet_id": wallet_id, "amount": 10, "type": "credit"}
+    response = await client.post("/transactions", json=transaction_payload, headers=headers)
+    transaction = response.json()
+
+    response = await client.get(f"/wallets/{wallet_id}/transactions", params={"fields": "amount,created_at"})
+    assert response.json() == {
+        "transactions": [{"id": transaction["id"], "amount": 10, "created_at": transaction["created_at"]}],
+        "next_cursor": None,
+    }
+
+    response = await client.get(f"/transactions/{transaction['id']}", params={"fields": "type"})
+    assert response.json() == {"id": transaction["id"], "type": "credit"}
+
+@pytest.mark.asyncio
+async def test_read_wallet_balance_at(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
+    start = datetime.datetime(2024, 1, 1)
+    amounts = [100, -30, 50, -20, 10]  # running balance 100, 70, 120, 100, 110
+
+    wallet = models.DBWallet(user_id=token_user1.user_id, balance=sum(amounts))
+    session.add(wallet)
+    await session.commit()
+    await session.refresh(wallet)
+
+    for day, amount in enumerate(amounts):
+        session.add(models.DBTransaction(
+            wallet_id=wallet.id,
+            amount=abs(amount),
+            type="credit" if amount > 0 else "debit",
+            created_at=start + datetime.timedelta(days=day),
+        ))
+    await session.commit()
+
+    async def balance_at(day: float) -> dict:
+        at = (start + datetime.timedelta(days=day)).isoformat()
+        response = await client.get(f"/wallets/{wallet.id}/balance", params=dict(at=at))
+        assert response.status_code == 200
+        return response.json()
+
+    # Without checkpoints the balance is walked back from the current one
+    assert (await balance_at(2.5))["balance"] == 120
+    assert (await balance_at(-1))["balance"] == 0
+
+    assert await models.write_balance_checkpoints(session, interval=3) >= 1
+    await session.commit()
+    # Nothing new to checkpoint since the last run
+    assert await models.write_balance_checkpoints(session, interval=3) == 0
+
+    data = await balance_at(4.5)
+    assert data["balance"] == 110
+    assert data["checkpoint_id"] is not None
+    assert (await balance_at(3.5))["balance"] == 100
+    assert (await balance_at(1.5))["balance"] == 70
+
+    response = await client.get(f"/wallets/{wallet.id}/balance")
+    assert response.json()["balance"] == 110
+
+@pytest.mark.asyncio
+async def test_balance_checkpoints_incremental(token_user1: models.Token, session: models.AsyncSession):
+    wallet = models.DBWallet(user_id=token_user1.user_id, balance=0)
+    session.add(wallet)
+    await session.commit()
+    await session.refresh(wallet)
+
+    async def add(*days: float):
+        start = datetime.datetime(2020, 1, 1)
+        session.add_all(
+            models.DBTransaction(wallet_id=wallet.id, amount=10, type="credit", created_at=start + datetime.timedelta(days=day))
+            for day in days
+        )
+        await session.commit()
+
+    async def checkpoints() -> list[int]:
+        result = await session.exec(
+            select(models.DBBalanceCheckpoint.transaction_id).where(models.DBBalanceCheckpoint.wallet_id == wallet.id)
+        )
+        return result.all()
+
+    async def run(settled_before: datetime.datetime = None):
+        await models.write_balance_checkpoints(session, interval=3, settled_before=settled_before)
+        await session.commit()
+
+    await add(0, 1)
+    await run()
+    assert await checkpoints() == []
+
+    # Counted since the last checkpoint, not since the last run
+    await add(2)
+    await run()
+    assert len(await checkpoints()) == 1
+
+    # A transaction not yet settled holds the run up, the ones after it
+    # are looked at again by the next run
+    now = datetime.datetime.now()
+    session.add(models.DBTransaction(wallet_id=wallet.id, amount=10, type="credit", created_at=now))
+    await session.commit()
+    await add(3, 4)
+    await run(settled_before=now - datetime.timedelta(seconds=1))
+    assert len(await checkpoints()) == 1
+    await run(settled_before=now + datetime.timedelta(seconds=1))
+    assert len(await checkpoints()) == 2
+
+@pytest.mark.asyncio
+async def test_balance_checkpoints_after_edit(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    start = datetime.datetime(2024, 2, 1)
+    wallet = models.DBWallet(user_id=token_user1.user_id, balance=180)
+    other = models.DBWallet(user_id=token_user1.user_id, balance=0)
+    session.add_all([wallet, other])
+    await session.commit()
+    await session.refresh(wallet)
+    await session.refresh(other)
+
+    transactions = [
+        models.DBTransaction(wallet_id=wallet.id, amount=amount, type="credit", created_at=start + datetime.timedelta(days=day))
+        for day, amount in enumerate([100, 50, 30])
+    ]
+    session.add_all(transactions)
+    await session.commit()
+    assert await models.write_balance_checkpoints(session, interval=3) >= 1
+    await session.commit()
+
+    async def balance_at(wallet_id: int) -> int:
+        at = (start + datetime.timedelta(days=10)).isoformat()
+        response = await client.get(f"/wallets/{wallet_id}/balance", params=dict(at=at))
+        return response.json()["balance"]
+
+    assert await balance_at(wallet.id) == 180
+
+    await session.refresh(transactions[1])
+    response = await client.delete(f"/transactions/{transactions[1].id}", headers=headers)
+    assert response.status_code == 200
+    assert await balance_at(wallet.id) == 130
+
+    await session.refresh(transactions[0])
+    payload = {"wallet_id": other.id, "amount": 100, "type": "credit"}
+    response = await client.put(f"/transactions/{transactions[0].id}", json=payload, headers=headers)
+    assert response.status_code == 200
+    assert await balance_at(wallet.id) == 30
+    assert await balance_at(other.id) == 100
+
+@pytest.mark.asyncio
+async def test_read_wallet_summary(client: AsyncClient, token_user1: models.Token, session: models.AsyncSession):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+
+    wallet = models.DBWallet(user_id=token_user1.user_id, balance=0)
+    session.add(wallet)
+    await session.commit()
+    await session.refresh(wallet)
+
+    ids = []
+    for amount, type in [(100, "credit"), (30, "debit"), (20, "debit")]:
+        response = await client.post(
+            "/transactions", json=dict(wallet_id=wallet.id, amount=amount, type=type), headers=headers
+        )
+        assert response.status_code == 200
+        ids.append(response.json()["id"])
+
+    # Reversals move the totals, they do not add to them
+    response = await client.put(
+        f"/transactions/{ids[1]}", json=dict(wallet_id=wallet.id, amount=40, type="debit"), headers=headers
+    )
+    assert response.status_code == 200
+    response = await client.delete(f"/transactions/{ids[2]}", headers=headers)
+    assert response.status_code == 200
+
+    response = await client.get(f"/wallets/{wallet.id}/summary")
+    data = response.json()
+
+    assert response.status_code == 200
+    assert len(data["days"]) == 1
+    assert data["credit_total"] == 100
+    assert data["credit_count"] == 1
+    assert data["debit_total"] == 40
+    assert data["debit_count"] == 1
+
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    response = await client.get(f"/wallets/{wallet.id}/summary", params={"from": tomorrow.isoformat()})
+    assert response.json()["days"] == []
+
+    # A rebuild from the raw transactions gives the same rollups
+    assert await models.rebuild_rollups(session, wallet.id, wallet.id) == 1
+    await session.commit()
+    response = await client.get(f"/wallets/{wallet.id}/summary")
+    assert response.json() == data
+
+@pytest.mark.asyncio
+async def test_reconcile_wallets(token_user1: models.Token, session: models.AsyncSession):
+    balanced = models.DBWallet(user_id=token_user1.user_id, balance=70)
+    drifted = models.DBWallet(user_id=token_user1.user_id, balance=100)
+    session.add_all([balanced, drifted])
+    await session.commit()
+
+    for wallet in (balanced, drifted):
+        session.add_all([
+            models.DBTransaction(wallet_id=wallet.id, amount=100, type="credit"),
+            models.DBTransaction(wallet_id=wallet.id, amount=30, type="debit"),
+        ])
+    await session.commit()
+
+    report = io.StringIO()
+    summary = await reconcile.reconcile(workers=2, wallets_per_range=1, report=report, job_name="test-reconcile")
+    mismatches = {
+        mismatch["wallet_id"]: mismatch for mismatch in map(json.loads, report.getvalue().splitlines())
+    }
+
+    assert summary.wallets >= 2
+    assert summary.mismatches == len(mismatches)
+    assert balanced.id not in mismatches
+    assert mismatches[drifted.id]["expected"] == 70
+    assert mismatches[drifted.id]["difference"] == 30
+
+    # Every wallet was checked, the same job has nothing left to do
+    summary = await reconcile.reconcile(workers=2, wallets_per_range=1, report=report, job_name="test-reconcile")
+    assert summary.wallets == 0
+    assert summary.skipped_wallets >= 2